@@ -0,0 +1,34 @@
+"""create site_visits for incremental enter/exit sessions
+Revision ID: 0003_site_visits
+Revises: 0002_bilingual_and_tracking
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0003_site_visits"
+down_revision = "0002_bilingual_and_tracking"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        "site_visits",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("employee_id", sa.String(length=32), nullable=False),
+        sa.Column("site_id", sa.Integer, sa.ForeignKey("sites.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("entered_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("exited_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("last_seen_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("point_count", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("outside_count", sa.Integer, nullable=False, server_default="0"),
+    )
+    # "who was on site X today" and "open visit of employee Y"
+    op.create_index("ix_site_visits_site_entered", "site_visits", ["site_id", "entered_at"])
+    op.create_index("ix_site_visits_employee_exited", "site_visits", ["employee_id", "exited_at"])
+
+def downgrade():
+    op.drop_index("ix_site_visits_employee_exited", table_name="site_visits")
+    op.drop_index("ix_site_visits_site_entered", table_name="site_visits")
+    op.drop_table("site_visits")
@@ -0,0 +1,33 @@
+"""create attendance_daily rollup
+Revision ID: 0004_attendance_daily
+Revises: 0003_site_visits
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0004_attendance_daily"
+down_revision = "0003_site_visits"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        "attendance_daily",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("employee_id", sa.String(length=32), nullable=False),
+        sa.Column("site_id", sa.Integer, sa.ForeignKey("sites.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("day", sa.Date, nullable=False),
+        sa.Column("first_seen", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("last_seen", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("seconds_on_site", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("ping_count", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("needs_recompute", sa.Boolean, nullable=False, server_default=sa.false()),
+        sa.UniqueConstraint("employee_id", "site_id", "day", name="uq_attendance_daily_employee_site_day"),
+    )
+    op.create_index("ix_attendance_daily_day_site", "attendance_daily", ["day", "site_id"])
+
+def downgrade():
+    op.drop_index("ix_attendance_daily_day_site", table_name="attendance_daily")
+    op.drop_table("attendance_daily")
@@ -0,0 +1,122 @@
+"""turn tracking_points into monthly range partitions on timestamp
+Revision ID: 0005_partition_tracking_points
+Revises: 0004_attendance_daily
+Create Date: 2026-10-17
+
+PostgreSQL only (no-op elsewhere). The existing heap table is renamed, a
+partitioned table with the same columns is created with one partition per
+month from the oldest row up to a few months ahead plus a DEFAULT partition
+for stragglers, the rows are copied over and the old table is dropped.
+
+Partitioned tables need the partition key in every unique constraint, so the
+primary key becomes (id, timestamp); ids still come from the same sequence.
+Future partitions and retention are handled by ``python -m app.partitions``.
+"""
+import datetime as dt
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0005_partition_tracking_points"
+down_revision = "0004_attendance_daily"
+branch_labels = None
+depends_on = None
+
+MONTHS_AHEAD = 3
+
+COLUMNS = "id, employee_id, timestamp, lat, lng, accuracy, site_id, site_name_ar, site_name_en"
+
+
+def _add_months(month: dt.date, n: int) -> dt.date:
+    y, m = divmod(month.month - 1 + n, 12)
+    return dt.date(month.year + y, m + 1, 1)
+
+
+def _create_indexes():
+    op.execute("CREATE INDEX ix_tracking_points_employee_id ON tracking_points (employee_id)")
+    op.execute('CREATE INDEX ix_tracking_points_timestamp ON tracking_points ("timestamp")')
+    op.execute('CREATE INDEX ix_tracking_points_employee_timestamp ON tracking_points (employee_id, "timestamp")')
+
+
+def _rename_legacy(suffix: str):
+    op.execute(f"ALTER TABLE tracking_points RENAME TO tracking_points_{suffix}")
+    for name in (
+        "ix_tracking_points_employee_id",
+        "ix_tracking_points_timestamp",
+        "ix_tracking_points_employee_timestamp",
+    ):
+        op.execute(f"ALTER INDEX IF EXISTS {name} RENAME TO {name}_{suffix}")
+    op.execute(f"ALTER TABLE tracking_points_{suffix} RENAME CONSTRAINT tracking_points_pkey TO tracking_points_{suffix}_pkey")
+    op.execute("ALTER SEQUENCE tracking_points_id_seq OWNED BY NONE")
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+
+    _rename_legacy("legacy")
+    op.execute(
+        """
+        CREATE TABLE tracking_points (
+            id integer NOT NULL DEFAULT nextval('tracking_points_id_seq'),
+            employee_id varchar(32) NOT NULL,
+            "timestamp" timestamptz NOT NULL,
+            lat double precision NOT NULL,
+            lng double precision NOT NULL,
+            accuracy double precision,
+            site_id integer REFERENCES sites (id),
+            site_name_ar varchar(255),
+            site_name_en varchar(255),
+            CONSTRAINT tracking_points_pkey PRIMARY KEY (id, "timestamp")
+        ) PARTITION BY RANGE ("timestamp")
+        """
+    )
+    op.execute("ALTER SEQUENCE tracking_points_id_seq OWNED BY tracking_points.id")
+
+    oldest = bind.exec_driver_sql(
+        "SELECT min(\"timestamp\") AT TIME ZONE 'UTC' FROM tracking_points_legacy"
+    ).scalar()
+    today = dt.datetime.utcnow().date()
+    month = (oldest.date() if oldest else today).replace(day=1)
+    last = _add_months(today.replace(day=1), MONTHS_AHEAD)
+    while month <= last:
+        upper = _add_months(month, 1)
+        op.execute(
+            f"CREATE TABLE tracking_points_p{month:%Y%m} PARTITION OF tracking_points "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d} 00:00:00+00') TO ('{upper:%Y-%m-%d} 00:00:00+00')"
+        )
+        month = upper
+    op.execute("CREATE TABLE tracking_points_default PARTITION OF tracking_points DEFAULT")
+    _create_indexes()
+
+    op.execute(f"INSERT INTO tracking_points ({COLUMNS}) SELECT {COLUMNS} FROM tracking_points_legacy")
+    op.execute("DROP TABLE tracking_points_legacy")
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+
+    _rename_legacy("partitioned")
+    op.execute(
+        """
+        CREATE TABLE tracking_points (
+            id integer NOT NULL DEFAULT nextval('tracking_points_id_seq'),
+            employee_id varchar(32) NOT NULL,
+            "timestamp" timestamptz NOT NULL,
+            lat double precision NOT NULL,
+            lng double precision NOT NULL,
+            accuracy double precision,
+            site_id integer REFERENCES sites (id),
+            site_name_ar varchar(255),
+            site_name_en varchar(255),
+            CONSTRAINT tracking_points_pkey PRIMARY KEY (id)
+        )
+        """
+    )
+    op.execute("ALTER SEQUENCE tracking_points_id_seq OWNED BY tracking_points.id")
+    _create_indexes()
+    op.execute(f"INSERT INTO tracking_points ({COLUMNS}) SELECT {COLUMNS} FROM tracking_points_partitioned")
+    op.execute("DROP TABLE tracking_points_partitioned CASCADE")
@@ -0,0 +1,22 @@
+"""add last_timestamp / point_count to tracking_points for ingest compaction
+Revision ID: 0006_tracking_point_compaction
+Revises: 0005_partition_tracking_points
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0006_tracking_point_compaction"
+down_revision = "0005_partition_tracking_points"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # on a partitioned table ADD COLUMN on the parent reaches every partition
+    op.add_column("tracking_points", sa.Column("last_timestamp", sa.DateTime(timezone=True), nullable=True))
+    op.add_column("tracking_points", sa.Column("point_count", sa.Integer, nullable=False, server_default="1"))
+
+def downgrade():
+    op.drop_column("tracking_points", "point_count")
+    op.drop_column("tracking_points", "last_timestamp")
@@ -0,0 +1,49 @@
+"""create latest_positions (newest fix per employee)
+Revision ID: 0007_latest_positions
+Revises: 0006_tracking_point_compaction
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0007_latest_positions"
+down_revision = "0006_tracking_point_compaction"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        "latest_positions",
+        sa.Column("employee_id", sa.String(length=32), primary_key=True),
+        sa.Column("timestamp", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("lat", sa.Float, nullable=False),
+        sa.Column("lng", sa.Float, nullable=False),
+        sa.Column("accuracy", sa.Float, nullable=True),
+        sa.Column("site_id", sa.Integer, sa.ForeignKey("sites.id", ondelete="SET NULL"), nullable=True),
+        sa.Column("site_name_ar", sa.String(length=255), nullable=True),
+        sa.Column("site_name_en", sa.String(length=255), nullable=True),
+        sa.Column("point_id", sa.Integer, nullable=True),
+    )
+    op.create_index("ix_latest_positions_site_id", "latest_positions", ["site_id"])
+    # backfill: newest row per employee (last fix of a compacted run)
+    op.execute(
+        """
+        INSERT INTO latest_positions
+            (employee_id, timestamp, lat, lng, accuracy, site_id, site_name_ar, site_name_en, point_id)
+        SELECT employee_id, ts, lat, lng, accuracy, site_id, site_name_ar, site_name_en, id
+        FROM (
+            SELECT tp.*, COALESCE(tp.last_timestamp, tp.timestamp) AS ts,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY tp.employee_id
+                       ORDER BY COALESCE(tp.last_timestamp, tp.timestamp) DESC, tp.id DESC
+                   ) AS rn
+            FROM tracking_points tp
+        ) ranked
+        WHERE rn = 1
+        """
+    )
+
+def downgrade():
+    op.drop_index("ix_latest_positions_site_id", table_name="latest_positions")
+    op.drop_table("latest_positions")
@@ -0,0 +1,20 @@
+"""add polygon geometry to sites
+Revision ID: 0008_site_polygons
+Revises: 0007_latest_positions
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0008_site_polygons"
+down_revision = "0007_latest_positions"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # [[lat, lng], ...]; NULL keeps the centre + radius_m circle
+    op.add_column("sites", sa.Column("polygon", sa.JSON, nullable=True))
+
+def downgrade():
+    op.drop_column("sites", "polygon")
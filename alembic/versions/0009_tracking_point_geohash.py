@@ -0,0 +1,86 @@
+"""add integer geohash to tracking_points for spatial range queries
+Revision ID: 0009_tracking_point_geohash
+Revises: 0008_site_polygons
+Create Date: 2026-10-17
+
+Existing rows are backfilled in id order, ``BATCH_ROWS`` at a time, with a
+frozen copy of the ``app.geohash.encode`` used on ingest at this revision
+(so later changes to the app cannot change what replaying history writes).
+The index is created after the backfill so the updates do not have to
+maintain it.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0009_tracking_point_geohash"
+down_revision = "0008_site_polygons"
+branch_labels = None
+depends_on = None
+
+BATCH_ROWS = 10000
+GEOHASH_BITS = 26  # per axis
+
+
+# ----- frozen copy of app.geohash.encode as of this revision -----
+def _spread(v):
+    v &= 0x3FFFFFF
+    v = (v | (v << 16)) & 0x0000FFFF0000FFFF
+    v = (v | (v << 8)) & 0x00FF00FF00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F0F0F0F0F
+    v = (v | (v << 2)) & 0x3333333333333333
+    v = (v | (v << 1)) & 0x5555555555555555
+    return v
+
+
+def encode(lat, lng):
+    """52-bit integer geohash: 26 bits of longitude and latitude interleaved, longitude first."""
+    n = 1 << GEOHASH_BITS
+    x = min(int((lng + 180.0) / 360.0 * n), n - 1)
+    y = min(max(int((lat + 90.0) / 180.0 * n), 0), n - 1)
+    return (_spread(x) << 1) | _spread(y)
+
+points = sa.table(
+    "tracking_points",
+    sa.column("id", sa.Integer),
+    sa.column("timestamp", sa.DateTime(timezone=True)),
+    sa.column("lat", sa.Float),
+    sa.column("lng", sa.Float),
+    sa.column("geohash", sa.BigInteger),
+)
+
+
+def upgrade():
+    # on a partitioned table ADD COLUMN on the parent reaches every partition
+    op.add_column("tracking_points", sa.Column("geohash", sa.BigInteger, nullable=True))
+
+    bind = op.get_bind()
+    update = (
+        points.update()
+        # (id, timestamp) is the primary key of the partitioned table
+        .where(points.c.id == sa.bindparam("_id"))
+        .where(points.c.timestamp == sa.bindparam("_timestamp"))
+        .values(geohash=sa.bindparam("_geohash"))
+    )
+    last_id = 0
+    while True:
+        batch = bind.execute(
+            sa.select(points.c.id, points.c.timestamp, points.c.lat, points.c.lng)
+            .where(points.c.id > last_id)
+            .order_by(points.c.id)
+            .limit(BATCH_ROWS)
+        ).all()
+        if not batch:
+            break
+        bind.execute(
+            update,
+            [{"_id": r.id, "_timestamp": r.timestamp, "_geohash": encode(r.lat, r.lng)} for r in batch],
+        )
+        last_id = batch[-1].id
+
+    op.create_index("ix_tracking_points_geohash_timestamp", "tracking_points", ["geohash", "timestamp"])
+
+
+def downgrade():
+    op.drop_index("ix_tracking_points_geohash_timestamp", table_name="tracking_points")
+    op.drop_column("tracking_points", "geohash")
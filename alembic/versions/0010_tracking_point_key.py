@@ -0,0 +1,52 @@
+"""add client_point_id and a unique point key to tracking_points
+Revision ID: 0010_tracking_point_key
+Revises: 0009_tracking_point_geohash
+Create Date: 2026-10-17
+
+Rows re-sent by retrying clients before this revision share employee_id
+and timestamp. Nothing is deleted: the lowest id keeps ``""`` and every
+other copy gets ``#legacy-<id>`` so the unique index can be built, while
+site_visits, attendance_daily and latest_positions (derived from those same
+rows) stay consistent and the downgrade loses nothing. The index leads with
+(employee_id, timestamp), so it replaces
+``ix_tracking_points_employee_timestamp`` for the report range scans.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0010_tracking_point_key"
+down_revision = "0009_tracking_point_geohash"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # "" = no client id sent; the key then falls back to employee_id + timestamp
+    op.add_column(
+        "tracking_points",
+        sa.Column("client_point_id", sa.String(length=64), nullable=False, server_default=""),
+    )
+    # keep duplicates, just make their keys distinct (uses the old employee+timestamp index)
+    op.execute(
+        """
+        UPDATE tracking_points SET client_point_id = '#legacy-' || id
+        WHERE EXISTS (
+            SELECT 1 FROM tracking_points d
+            WHERE d.employee_id = tracking_points.employee_id
+              AND d."timestamp" = tracking_points."timestamp"
+              AND d.id < tracking_points.id
+        )
+        """
+    )
+    op.create_index(
+        "uq_tracking_points_point_key",
+        "tracking_points",
+        ["employee_id", "timestamp", "client_point_id"],
+        unique=True,
+    )
+    op.drop_index("ix_tracking_points_employee_timestamp", table_name="tracking_points")
+
+def downgrade():
+    op.create_index("ix_tracking_points_employee_timestamp", "tracking_points", ["employee_id", "timestamp"])
+    op.drop_index("uq_tracking_points_point_key", table_name="tracking_points")
+    op.drop_column("tracking_points", "client_point_id")
@@ -0,0 +1,44 @@
+"""allow at most one open site visit per employee
+Revision ID: 0011_site_visits_one_open
+Revises: 0010_tracking_point_key
+Create Date: 2026-10-17
+
+Concurrent workers could each open a visit for the same employee. Before the
+partial unique index is built, every open visit but the latest one of an
+employee is closed at its last fix, which is what the state machine would
+have done when the newer visit was opened.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "0011_site_visits_one_open"
+down_revision = "0010_tracking_point_key"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.execute(
+        """
+        UPDATE site_visits SET exited_at = last_seen_at, outside_count = 0
+        WHERE exited_at IS NULL
+          AND EXISTS (
+            SELECT 1 FROM site_visits n
+            WHERE n.employee_id = site_visits.employee_id
+              AND n.exited_at IS NULL
+              AND (n.entered_at > site_visits.entered_at
+                   OR (n.entered_at = site_visits.entered_at AND n.id > site_visits.id))
+          )
+        """
+    )
+    op.create_index(
+        "uq_site_visits_open",
+        "site_visits",
+        ["employee_id"],
+        unique=True,
+        postgresql_where=sa.text("exited_at IS NULL"),
+        sqlite_where=sa.text("exited_at IS NULL"),
+    )
+
+def downgrade():
+    op.drop_index("uq_site_visits_open", table_name="site_visits")
@@ -5,17 +5,36 @@ This module centralises password hashing and JSON Web Token creation and
 verification. It uses passlib's bcrypt scheme for secure password storage and
 python-jose for signing JWTs. The JWT includes the user's ID and role in its
 payload to facilitate role-based access control downstream.
+
+Password hashing and verification for request handlers run in a small,
+dedicated process pool (see ``verify_password_async``) so bcrypt bursts during
+shift changes cannot monopolise the threadpool shared by the sync endpoints.
+A concurrency cap with a queue timeout makes excess logins fail fast with
+``PasswordHasherBusy`` instead of piling up.
+
+Decoded token payloads are cached per worker by token digest until the
+token's ``exp``, so a client reusing the same access token does not pay for
+signature verification on every request.
 """
 
 from __future__ import annotations
 
+import asyncio
 import datetime as dt
+import hashlib
+import multiprocessing
 import os
-from typing import Any, Dict, Optional
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional, Tuple, TypeVar
 
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 
+from .cache import TTLCache
+from .metrics import BCRYPT_SECONDS
 from .models import User, UserRole
 
 # Cryptographic context for bcrypt hashing.
@@ -26,6 +45,17 @@ SECRET_KEY = os.getenv("JWT_SECRET", "CHANGE_ME_FALCOM_SECRET")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("JWT_EXPIRE_MIN", "15"))
 REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("JWT_REFRESH_EXPIRE_DAYS", "7"))
+JWT_CACHE_MAX = int(os.getenv("JWT_CACHE_MAX", "10000"))
+
+# bcrypt process pool: worker processes, max in-flight + queued hashes, wait limit.
+BCRYPT_POOL_SIZE = int(os.getenv("BCRYPT_POOL_SIZE", "2"))
+BCRYPT_MAX_CONCURRENCY = int(os.getenv("BCRYPT_MAX_CONCURRENCY", str(BCRYPT_POOL_SIZE * 4)))
+BCRYPT_QUEUE_TIMEOUT_S = float(os.getenv("BCRYPT_QUEUE_TIMEOUT_S", "5"))
+
+# Verified payloads keyed by sha256(token); each entry lives until the token's exp.
+_token_cache: TTLCache[bytes, Dict[str, Any]] = TTLCache(
+    maxsize=JWT_CACHE_MAX, ttl_s=ACCESS_TOKEN_EXPIRE_MINUTES * 60
+)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -38,6 +68,92 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+class PasswordHasherBusy(Exception):
+    """Raised when no bcrypt slot frees up within ``BCRYPT_QUEUE_TIMEOUT_S``."""
+
+
+T = TypeVar("T")
+
+_hash_pool: Optional[ProcessPoolExecutor] = None
+_hash_pool_lock = threading.Lock()
+_hash_slots = asyncio.Semaphore(BCRYPT_MAX_CONCURRENCY)
+
+
+def _get_hash_pool() -> ProcessPoolExecutor:
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is None:
+            # spawn: never fork a process that already runs threads
+            _hash_pool = ProcessPoolExecutor(
+                max_workers=BCRYPT_POOL_SIZE,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _hash_pool
+
+
+def shutdown_hash_pool() -> None:
+    """Stop the bcrypt worker processes (called on application shutdown)."""
+    global _hash_pool
+    with _hash_pool_lock:
+        pool, _hash_pool = _hash_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _worker_pid() -> int:
+    # importing this module in the worker also loads passlib/bcrypt
+    return os.getpid()
+
+
+def warm_hash_pool() -> None:
+    """Start the bcrypt worker processes now rather than on the first login."""
+    pool = _get_hash_pool()
+    for future in [pool.submit(_worker_pid) for _ in range(BCRYPT_POOL_SIZE)]:
+        future.result()
+
+
+async def _run_hash_job(fn: Callable[..., T], *args: Any) -> T:
+    global _hash_pool
+    try:
+        await asyncio.wait_for(_hash_slots.acquire(), BCRYPT_QUEUE_TIMEOUT_S)
+    except asyncio.TimeoutError:
+        raise PasswordHasherBusy("password hashing capacity exhausted") from None
+    try:
+        pool = _get_hash_pool()
+        try:
+            with BCRYPT_SECONDS.time():
+                return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+        except BrokenProcessPool:
+            # a worker died; start a fresh pool for the next caller
+            with _hash_pool_lock:
+                if _hash_pool is pool:
+                    _hash_pool = None
+            raise
+    finally:
+        _hash_slots.release()
+
+
+def _verify_and_update(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+async def verify_password_async(
+    plain_password: str, hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    """
+    Verify a password in the bcrypt process pool.
+
+    Returns ``(valid, new_hash)`` where ``new_hash`` is set when the stored
+    hash uses deprecated settings and should be replaced.
+    """
+    return await _run_hash_job(_verify_and_update, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """Hash a password in the bcrypt process pool."""
+    return await _run_hash_job(get_password_hash, password)
+
+
 def create_access_token(data: Dict[str, Any], expires_delta: Optional[dt.timedelta] = None) -> str:
     """Generate a signed JWT containing the given data and an expiry."""
     to_encode = data.copy()
@@ -61,11 +177,20 @@ def create_refresh_token(data: Dict[str, Any]) -> str:
 
 def decode_token(token: str) -> Dict[str, Any]:
     """Decode a JWT and return its payload. Raise JWTError if invalid."""
+    key = hashlib.sha256(token.encode()).digest()
+    payload = _token_cache.get(key)
+    if payload is not None:
+        return dict(payload)
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
     except JWTError as exc:
         raise exc
+    exp = payload.get("exp")
+    if exp is not None:
+        ttl = exp - time.time()
+        if ttl > 0:
+            _token_cache.set(key, payload, ttl_s=ttl)
+    return dict(payload)
 
 
 def authenticate_user(user: User, password: str) -> bool:
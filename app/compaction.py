@@ -0,0 +1,228 @@
+"""
+Optional ingest-time compaction of tracking points.
+
+With ``TRACKING_COMPACTION_ENABLED=1`` accepted points are compacted per
+employee before they are written:
+
+* **Stationary runs** - consecutive fixes within ``STATIONARY_RADIUS_M`` of the
+  run's first fix, at the same site and no more than ``STATIONARY_MAX_GAP_S``
+  apart, are stored as one row: ``timestamp`` is the first fix,
+  ``last_timestamp`` the last one and ``point_count`` the number of fixes.
+  The run can continue across requests: the last row written for each
+  employee is remembered per worker (after commit) and extended with an
+  UPDATE instead of inserting a new row.
+* **Moving segments** - with ``SIMPLIFY_TOLERANCE_M > 0`` the remaining
+  single-fix rows are simplified with Douglas-Peucker: a fix is dropped when
+  it lies within the tolerance of the line between the fixes kept around
+  it. Stationary rows, site changes and the first/last fix of a batch are
+  always kept.
+
+Input rows that are not stored as a row of their own (absorbed into a
+stationary run or simplified away) are flagged ``row["absorbed"] = True``;
+their id is the run's row, or ``None`` when simplified away.
+
+Visits and daily rollups are still fed the raw points, so they are exact;
+``STATIONARY_MAX_GAP_S`` never exceeds ``ROLLUP_MAX_GAP_S`` so that rollups
+recomputed from compacted rows count a run's whole span as time on site.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import threading
+from itertools import groupby
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, event, update
+from sqlalchemy.orm import Session
+
+from .cache import TTLCache
+from .geofence import METERS_PER_DEG_LAT, haversine_m
+from .ingest import Row, as_utc, insert_points, point_key
+from .metrics import COMPACTION_POINTS_IN, COMPACTION_RATIO, COMPACTION_ROWS_OUT
+from .models import TrackingPoint
+from .rollups import ROLLUP_MAX_GAP_S
+
+TRACKING_COMPACTION_ENABLED = os.getenv("TRACKING_COMPACTION_ENABLED", "0") == "1"
+STATIONARY_RADIUS_M = float(os.getenv("STATIONARY_RADIUS_M", "15"))
+STATIONARY_MAX_GAP_S = min(float(os.getenv("STATIONARY_MAX_GAP_S", str(ROLLUP_MAX_GAP_S))), ROLLUP_MAX_GAP_S)
+# 0 disables Douglas-Peucker simplification of moving segments.
+SIMPLIFY_TOLERANCE_M = float(os.getenv("SIMPLIFY_TOLERANCE_M", "0"))
+COMPACTION_TAILS_MAX = int(os.getenv("COMPACTION_TAILS_MAX", "100000"))
+
+# Last row written per employee, so stationary runs can span requests.
+_tails: TTLCache[str, Row] = TTLCache(maxsize=COMPACTION_TAILS_MAX, ttl_s=STATIONARY_MAX_GAP_S)
+_PENDING_TAILS_KEY = "compaction_tails"
+
+_totals_lock = threading.Lock()
+_totals = [0, 0]  # points in, rows written
+
+
+def _observe(points_in: int, rows_out: int) -> None:
+    COMPACTION_POINTS_IN.inc(points_in)
+    COMPACTION_ROWS_OUT.inc(rows_out)
+    with _totals_lock:
+        _totals[0] += points_in
+        _totals[1] += rows_out
+        if _totals[1]:
+            COMPACTION_RATIO.set(_totals[0] / _totals[1])
+
+
+def _last_ts(node: Row):
+    return as_utc(node["last_timestamp"] or node["timestamp"])
+
+
+def _is_stationary(node: Row, row: Row) -> bool:
+    if node["site_id"] != row["site_id"]:
+        return False
+    gap = (as_utc(row["timestamp"]) - _last_ts(node)).total_seconds()
+    if gap < 0 or gap > STATIONARY_MAX_GAP_S:
+        return False
+    return haversine_m(node["lat"], node["lng"], row["lat"], row["lng"]) <= STATIONARY_RADIUS_M
+
+
+def _offset_m(row: Row, a: Row, b: Row) -> float:
+    """Distance in metres from ``row`` to the segment ``a``-``b`` (local flat projection)."""
+    kx = METERS_PER_DEG_LAT * math.cos(math.radians(a["lat"]))
+    bx, by = (b["lng"] - a["lng"]) * kx, (b["lat"] - a["lat"]) * METERS_PER_DEG_LAT
+    px, py = (row["lng"] - a["lng"]) * kx, (row["lat"] - a["lat"]) * METERS_PER_DEG_LAT
+    length2 = bx * bx + by * by
+    t = 0.0 if length2 == 0 else max(0.0, min(1.0, (px * bx + py * by) / length2))
+    return math.hypot(px - t * bx, py - t * by)
+
+
+def douglas_peucker(nodes: List[Row], tolerance_m: float, fixed: List[bool]) -> List[bool]:
+    """Return a keep-mask for ``nodes``; ``fixed`` nodes and both ends are always kept."""
+    n = len(nodes)
+    keep = [True] * n
+    if n < 3 or tolerance_m <= 0:
+        return keep
+    anchors = [i for i in range(n) if i == 0 or i == n - 1 or fixed[i]]
+    stack = list(zip(anchors, anchors[1:]))
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        worst, worst_d = first, -1.0
+        for i in range(first + 1, last):
+            d = _offset_m(nodes[i], nodes[first], nodes[last])
+            if d > worst_d:
+                worst, worst_d = i, d
+        if worst_d > tolerance_m:
+            stack.append((first, worst))
+            stack.append((worst, last))
+        else:
+            for i in range(first + 1, last):
+                keep[i] = False
+    return keep
+
+
+def compact(rows: List[Row], tails: Dict[str, Row]) -> Tuple[List[Row], List[Row], List[Optional[Row]]]:
+    """
+    Compact ``rows`` against the employees' previous rows in ``tails``.
+
+    Returns ``(new_rows, extended_tails, owners)`` where ``owners[i]`` is the
+    new or extended row that absorbed ``rows[i]`` (``None`` if simplified
+    away). Input rows are not modified.
+    """
+    owners: List[Optional[Row]] = [None] * len(rows)
+    new_rows: List[Row] = []
+    extended: List[Row] = []
+    key = lambda i: rows[i]["employee_id"]  # noqa: E731
+    for employee_id, group in groupby(sorted(range(len(rows)), key=key), key=key):
+        order = sorted(group, key=lambda i: as_utc(rows[i]["timestamp"]))
+        tail = tails.get(employee_id)
+        tail_node = node = dict(tail) if tail is not None else None
+        nodes: List[Row] = []
+        for i in order:
+            row = rows[i]
+            if node is not None and _is_stationary(node, row):
+                node["last_timestamp"] = row["timestamp"]
+                node["point_count"] += 1
+            else:
+                node = dict(row, last_timestamp=None, point_count=1)
+                nodes.append(node)
+            owners[i] = node
+        if tail_node is not None and tail_node["point_count"] > tail["point_count"]:
+            extended.append(tail_node)
+
+        fixed = [
+            n["point_count"] > 1 or (j > 0 and n["site_id"] != nodes[j - 1]["site_id"])
+            for j, n in enumerate(nodes)
+        ]
+        keep = douglas_peucker(nodes, SIMPLIFY_TOLERANCE_M, fixed)
+        dropped = {id(n) for n, k in zip(nodes, keep) if not k}
+        for i in order:
+            if id(owners[i]) in dropped:
+                owners[i] = None
+        new_rows.extend(n for n, k in zip(nodes, keep) if k)
+    return new_rows, extended, owners
+
+
+def _extend_rows(db: Session, extended: List[Row]) -> None:
+    table = TrackingPoint.__table__
+    stmt = (
+        update(table)
+        .where(table.c.id == bindparam("_id"))
+        .where(table.c.timestamp == bindparam("_timestamp"))
+        .values(last_timestamp=bindparam("_last_timestamp"), point_count=bindparam("_point_count"))
+    )
+    db.execute(
+        stmt,
+        [
+            {
+                "_id": r["id"],
+                "_timestamp": r["timestamp"],
+                "_last_timestamp": r["last_timestamp"],
+                "_point_count": r["point_count"],
+            }
+            for r in extended
+        ],
+    )
+
+
+def insert_compacted(db: Session, rows: List[Row]) -> List[Optional[int]]:
+    """
+    ``insert_points`` with compaction; returns, per input row, the id of the
+    row that now represents it (``None`` for simplified-away points) and
+    flags the rows that were not stored as their own row.
+    """
+    tails = {}
+    for employee_id in {r["employee_id"] for r in rows}:
+        tail = _tails.get(employee_id)
+        if tail is not None:
+            tails[employee_id] = tail
+    new_rows, extended, owners = compact(rows, tails)
+    if extended:
+        _extend_rows(db, extended)
+    for row, new_id in zip(new_rows, insert_points(db, new_rows)):
+        row["id"] = new_id
+    _observe(len(rows), len(new_rows))
+
+    latest: Dict[str, Row] = {}
+    for row in extended + new_rows:
+        if row["id"] is None:
+            continue  # lost an insert race to an identical point
+        current = latest.get(row["employee_id"])
+        if current is None or as_utc(row["timestamp"]) >= as_utc(current["timestamp"]):
+            latest[row["employee_id"]] = row
+    db.info.setdefault(_PENDING_TAILS_KEY, {}).update(latest)
+    for row, owner in zip(rows, owners):
+        # a run's row carries the key of its first fix only
+        if owner is None or point_key(owner) != point_key(row):
+            row["absorbed"] = True
+    return [owner["id"] if owner is not None else None for owner in owners]
+
+
+@event.listens_for(Session, "after_commit")
+def _remember_tails(session: Session) -> None:
+    """``after_commit`` hook: the rows written in this transaction become the tails."""
+    for employee_id, row in session.info.pop(_PENDING_TAILS_KEY, {}).items():
+        _tails.set(employee_id, row)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_tails(session: Session) -> None:
+    """``after_rollback`` hook: nothing written in this transaction exists."""
+    session.info.pop(_PENDING_TAILS_KEY, None)
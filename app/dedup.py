@@ -0,0 +1,122 @@
+"""
+Idempotent tracking uploads.
+
+A tracking point is identified by ``(employee_id, timestamp,
+client_point_id)``. ``client_point_id`` is optional; when the client sends
+none it is stored as ``""`` and the identity falls back to employee +
+timestamp. ``uq_tracking_points_point_key`` enforces the key (it includes
+the partition key, as unique indexes on ``tracking_points`` must) and
+``insert_points`` writes with ``ON CONFLICT DO NOTHING``, so a re-sent point
+never becomes a second row.
+
+In front of the database, ``recent_points`` remembers the keys committed by
+this worker (bounded LRU, ``RECENT_POINTS_TTL_S``), so the usual retry of a
+flaky upload is dropped before any SQL is sent. Duplicates are flagged on
+their row (``row["duplicate"] = True``), get no id, and are not fed to
+visits, rollups, latest positions or the live feed.
+
+With compaction enabled the batch is also checked against the table before
+compacting, because a conflicting stationary run would otherwise take the
+fresh fixes it absorbed down with it. Only a run's first fix is stored
+with its key, so a re-sent fix that was absorbed into a run is recognised
+only while it is still in ``recent_points``.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import Select, event, select, tuple_
+from sqlalchemy.orm import Session
+
+from .cache import TTLCache
+from .ingest import PointKey, Row, as_utc, point_key
+from .metrics import INGEST_DUPLICATES
+from .models import TrackingPoint
+
+RECENT_POINTS_MAX = int(os.getenv("RECENT_POINTS_MAX", "50000"))
+RECENT_POINTS_TTL_S = float(os.getenv("RECENT_POINTS_TTL_S", "3600"))
+# keys per existence lookup (compaction mode)
+_LOOKUP_CHUNK = 1000
+
+recent_points: TTLCache[PointKey, bool] = TTLCache(maxsize=RECENT_POINTS_MAX, ttl_s=RECENT_POINTS_TTL_S)
+_PENDING_KEY = "recent_point_keys"
+
+
+def point_id_select(row: Row) -> Select:
+    """Id of the stored row with ``row``'s point key (if it was not compacted away)."""
+    employee_id, timestamp, client_point_id = point_key(row)
+    return select(TrackingPoint.id).where(
+        TrackingPoint.employee_id == employee_id,
+        TrackingPoint.timestamp == timestamp,
+        TrackingPoint.client_point_id == client_point_id,
+    )
+
+
+def _stored_keys(db: Session, keys: Sequence[PointKey]) -> Set[PointKey]:
+    tp = TrackingPoint
+    found: Set[PointKey] = set()
+    for start in range(0, len(keys), _LOOKUP_CHUNK):
+        stmt = select(tp.employee_id, tp.timestamp, tp.client_point_id).where(
+            tuple_(tp.employee_id, tp.timestamp, tp.client_point_id).in_(keys[start:start + _LOOKUP_CHUNK])
+        )
+        found.update((r.employee_id, as_utc(r.timestamp), r.client_point_id) for r in db.execute(stmt))
+    return found
+
+
+def drop_duplicates(db: Session, rows: List[Row], check_db: bool = False) -> List[Row]:
+    """
+    Flag rows committed recently by this worker or repeated within the batch
+    and return the others; ``check_db`` also looks the rest up in the table.
+    """
+    fresh: List[Row] = []
+    keys: Set[PointKey] = set()
+    for row in rows:
+        key = point_key(row)
+        if key in keys or recent_points.get(key):
+            row["duplicate"] = True
+        else:
+            keys.add(key)
+            fresh.append(row)
+    if len(fresh) < len(rows):
+        INGEST_DUPLICATES.labels("cache").inc(len(rows) - len(fresh))
+    if check_db and fresh:
+        stored = _stored_keys(db, [point_key(r) for r in fresh])
+        if stored:
+            for row in fresh:
+                if point_key(row) in stored:
+                    row["duplicate"] = True
+            INGEST_DUPLICATES.labels("database").inc(sum(1 for r in fresh if r.get("duplicate")))
+            fresh = [r for r in fresh if not r.get("duplicate")]
+    return fresh
+
+
+def drop_conflicts(rows: List[Row], ids: Sequence[Optional[int]]) -> Tuple[List[Row], List[int]]:
+    """Flag rows skipped by ``ON CONFLICT DO NOTHING``; return the inserted rows and their ids."""
+    inserted, inserted_ids = [], []
+    for row, point_id in zip(rows, ids):
+        if point_id is None:
+            row["duplicate"] = True
+        else:
+            inserted.append(row)
+            inserted_ids.append(point_id)
+    if len(inserted) < len(rows):
+        INGEST_DUPLICATES.labels("database").inc(len(rows) - len(inserted))
+    return inserted, inserted_ids
+
+
+def remember(db: Session, rows: List[Row]) -> None:
+    """Remember the rows' keys once the transaction commits."""
+    db.info.setdefault(_PENDING_KEY, []).extend(point_key(r) for r in rows)
+
+
+@event.listens_for(Session, "after_commit")
+def _remember_committed(session: Session) -> None:
+    for key in session.info.pop(_PENDING_KEY, ()):
+        recent_points.set(key, True)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_pending(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
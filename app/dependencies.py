@@ -4,29 +4,171 @@ FastAPI dependencies for database access, authentication and RBAC.
 This module exposes dependency functions used in route definitions. They
 abstract common concerns such as loading a database session, extracting the
 current user from a JWT bearer token and enforcing role-based permissions.
+
+The identity and role of active users are cached per worker for
+``USER_CACHE_TTL_S`` seconds so authenticated requests do not need a database
+round trip. Cache entries are dropped whenever a ``User`` row is updated or
+deleted through the ORM, so deactivations and role changes made by this
+worker apply immediately and those made elsewhere within the TTL.
+
+With ``AUTH_STATELESS=1`` tokens carrying ``employee_id`` and ``role``
+claims are trusted without loading the user: identity and role come from
+the signed claims, and deactivated accounts are rejected through
+``inactive_users``, a set of inactive user ids reloaded every
+``AUTH_INACTIVE_REFRESH_S`` seconds (and updated immediately for changes
+committed by this worker). Role or employee id changes made elsewhere apply
+when the access token expires.
 """
 
 from __future__ import annotations
 
+import asyncio
+import os
+import time
+from dataclasses import dataclass
 from typing import Annotated
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError
-from sqlalchemy.orm import Session
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, object_session
 
 from .auth import decode_token
-from .db import get_db
+from .cache import TTLCache
+from .db import get_async_db
+from .metrics import JWT_DECODE_SECONDS, USER_LOOKUP_SECONDS
 from .models import User, UserRole
 
 # OAuth2 scheme that reads the bearer token from the Authorization header.
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
+USER_CACHE_TTL_S = float(os.getenv("USER_CACHE_TTL_S", "30"))
+USER_CACHE_MAX = int(os.getenv("USER_CACHE_MAX", "10000"))
+AUTH_STATELESS = os.getenv("AUTH_STATELESS", "0") == "1"
+AUTH_INACTIVE_REFRESH_S = float(os.getenv("AUTH_INACTIVE_REFRESH_S", "30"))
+
+
+@dataclass(frozen=True)
+class CurrentUser:
+    """Detached snapshot of the authenticated user, safe to share across requests."""
+
+    id: int
+    employee_id: str
+    full_name: str
+    role: UserRole
+    is_active: bool
+
+    @classmethod
+    def from_user(cls, user: User) -> "CurrentUser":
+        return cls(
+            id=user.id,
+            employee_id=user.employee_id,
+            full_name=user.full_name,
+            role=user.role,
+            is_active=user.is_active,
+        )
+
+
+class InactiveUsers:
+    """Ids of deactivated users for the stateless path, reloaded periodically."""
+
+    def __init__(self, refresh_s: float):
+        self.refresh_s = refresh_s
+        self._ids: frozenset[int] = frozenset()
+        self._loaded_at: float | None = None
+        self._lock = asyncio.Lock()
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._ids
+
+    def is_stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.refresh_s
+
+    async def refresh(self, db: AsyncSession) -> None:
+        # one reload at a time; others keep using the current set meanwhile
+        if self._lock.locked() and self._loaded_at is not None:
+            return
+        async with self._lock:
+            if not self.is_stale():
+                return
+            ids = await db.scalars(select(User.id).where(User.is_active.is_(False)))
+            self._ids = frozenset(ids.all())
+            self._loaded_at = time.monotonic()
+
+    def update(self, changes: dict[int, bool]) -> None:
+        """Apply ``{user_id: inactive}`` changes committed by this worker."""
+        ids = set(self._ids)
+        for user_id, inactive in changes.items():
+            if inactive:
+                ids.add(user_id)
+            else:
+                ids.discard(user_id)
+        self._ids = frozenset(ids)
+
+
+user_cache: TTLCache[int, CurrentUser] = TTLCache(maxsize=USER_CACHE_MAX, ttl_s=USER_CACHE_TTL_S)
+inactive_users = InactiveUsers(AUTH_INACTIVE_REFRESH_S)
+
+_STALE_USERS_KEY = "stale_user_ids"
+_INACTIVE_CHANGES_KEY = "inactive_user_changes"
 
-def get_current_user(
+
+def _invalidate_cached_user(target: User, deleted: bool) -> None:
+    # Drop now, and again after commit so a request racing the transaction
+    # cannot leave the pre-commit row in the cache.
+    user_cache.pop(target.id)
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_STALE_USERS_KEY, set()).add(target.id)
+        session.info.setdefault(_INACTIVE_CHANGES_KEY, {})[target.id] = deleted or not target.is_active
+
+
+@event.listens_for(User, "after_update")
+def _user_updated(mapper, connection, target: User) -> None:
+    _invalidate_cached_user(target, deleted=False)
+
+
+@event.listens_for(User, "after_delete")
+def _user_deleted(mapper, connection, target: User) -> None:
+    _invalidate_cached_user(target, deleted=True)
+
+
+@event.listens_for(Session, "after_commit")
+def _drop_stale_users(session: Session) -> None:
+    for user_id in session.info.pop(_STALE_USERS_KEY, ()):
+        user_cache.pop(user_id)
+    changes = session.info.pop(_INACTIVE_CHANGES_KEY, None)
+    if changes:
+        inactive_users.update(changes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_inactive_changes(session: Session) -> None:
+    session.info.pop(_INACTIVE_CHANGES_KEY, None)
+
+
+async def _user_from_claims(payload: dict, user_id: int, db: AsyncSession) -> CurrentUser | None:
+    """Stateless identity from the token, or None when the claims are missing."""
+    employee_id = payload.get("employee_id")
+    try:
+        role = UserRole(payload.get("role"))
+    except ValueError:
+        return None
+    if not employee_id:
+        return None
+    if inactive_users.is_stale():
+        await inactive_users.refresh(db)
+    if user_id in inactive_users:
+        return None
+    return CurrentUser(id=user_id, employee_id=employee_id, full_name="", role=role, is_active=True)
+
+
+async def get_current_user(
     token: Annotated[str, Depends(oauth2_scheme)],
-    db: Annotated[Session, Depends(get_db)],
-) -> User:
+    db: Annotated[AsyncSession, Depends(get_async_db)],
+) -> CurrentUser:
     """Return the current user based on the given JWT token."""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -34,17 +176,29 @@ def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = decode_token(token)
+        with JWT_DECODE_SECONDS.time():
+            payload = decode_token(token)
         user_id: int | None = payload.get("user_id")
         if user_id is None:
             raise credentials_exception
-        role = payload.get("role")
     except JWTError:
         raise credentials_exception
-    user: User | None = db.get(User, user_id)
+    if AUTH_STATELESS and "employee_id" in payload:
+        # بدون قراءة من القاعدة: الهوية والدور من التوكن الموقّع
+        current = await _user_from_claims(payload, user_id, db)
+        if current is None:
+            raise credentials_exception
+        return current
+    with USER_LOOKUP_SECONDS.time():
+        cached = user_cache.get(user_id)
+        if cached is not None:
+            return cached
+        user: User | None = await db.get(User, user_id)
     if user is None or not user.is_active:
         raise credentials_exception
-    return user
+    current = CurrentUser.from_user(user)
+    user_cache.set(user_id, current)
+    return current
 
 
 def require_roles(*roles: UserRole):
@@ -53,7 +207,7 @@ def require_roles(*roles: UserRole):
     the specified roles. Use like: Depends(require_roles(UserRole.ADMIN)).
     """
 
-    def role_checker(user: Annotated[User, Depends(get_current_user)]) -> User:
+    async def role_checker(user: Annotated[CurrentUser, Depends(get_current_user)]) -> CurrentUser:
         if user.role not in roles:
             raise HTTPException(status_code=403, detail="Forbidden")
         return user
@@ -0,0 +1,372 @@
+"""
+Geofence matching for the Falcom Geofence API.
+
+Active sites are held in a process-local grid index keyed on lat/lng. Each
+site is registered in every grid cell touched by its radius-expanded bounding
+box, so matching a GPS fix only evaluates the haversine distance against the
+handful of sites registered in the fix's cell instead of scanning the whole
+``sites`` table on every ping.
+
+The index is built lazily from the database, patched in place by the site
+CRUD endpoints and rebuilt after ``SITE_INDEX_TTL_S`` seconds so that edits
+made through other workers are eventually picked up. When the shared snapshot
+follower in ``app.site_cache`` is running it replaces the index from Redis as
+soon as another worker publishes a new version and keeps it fresh otherwise.
+
+Sites with a ``polygon`` (irregular compounds) match by polygon instead of
+by radius. Each polygon is prepared once per index build: its lat/lng
+bounding box (which also drives the grid registration) and its edges
+projected to local metres, with the inverse slope of every edge
+precomputed. A fix is first checked against the bounding box and only
+then ray-cast against the edge arrays with NumPy, so polygons with
+hundreds of vertices cost about the same per ping as a circle.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from .models import Site
+
+EARTH_RADIUS_M = 6371000.0
+METERS_PER_DEG_LAT = 111320.0
+
+# Grid cell size in degrees (0.01° ≈ 1.1 km of latitude).
+SITE_INDEX_CELL_DEG = float(os.getenv("SITE_INDEX_CELL_DEG", "0.01"))
+# Maximum age of the index before it is rebuilt from the database.
+SITE_INDEX_TTL_S = float(os.getenv("SITE_INDEX_TTL_S", "60"))
+# Upper bound on points x sites distances held in memory by ``match_many``.
+MATCH_CHUNK_CELLS = 1_000_000
+
+Cell = Tuple[int, int]
+Vertex = Tuple[float, float]  # (lat, lng)
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Return the great-circle distance in metres between two lat/lng points."""
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = (math.sin(dlat/2)**2 +
+         math.cos(math.radians(lat1)) *
+         math.cos(math.radians(lat2)) *
+         math.sin(dlon/2)**2)
+    return 2*EARTH_RADIUS_M*math.asin(math.sqrt(a))
+
+
+class PreparedPolygon:
+    """A site polygon prepared for repeated point-in-polygon tests."""
+
+    __slots__ = (
+        "vertices", "bbox", "radius_m", "_lat0", "_lng0", "_kx",
+        "_x1", "_y1", "_y2", "_dxdy", "_ex", "_ey", "_edx", "_edy",
+    )
+
+    def __init__(self, vertices: Sequence[Sequence[float]]):
+        ring = [(float(lat), float(lng)) for lat, lng in vertices]
+        if len(ring) > 1 and ring[0] == ring[-1]:
+            ring.pop()  # closed rings repeat the first vertex
+        if len(ring) < 3:
+            raise ValueError("a polygon needs at least 3 vertices")
+        self.vertices: Tuple[Vertex, ...] = tuple(ring)
+        lat = np.array([v[0] for v in ring])
+        lng = np.array([v[1] for v in ring])
+        self.bbox = (float(lat.min()), float(lng.min()), float(lat.max()), float(lng.max()))
+        # local equirectangular projection (metres) around the vertex centroid
+        self._lat0 = float(lat.mean())
+        self._lng0 = float(lng.mean())
+        self._kx = METERS_PER_DEG_LAT * math.cos(math.radians(self._lat0))
+        x = (lng - self._lng0) * self._kx
+        y = (lat - self._lat0) * METERS_PER_DEG_LAT
+        x2, y2 = np.roll(x, -1), np.roll(y, -1)
+        # radius of the circle with the same area (shoelace): scales exit buffers
+        self.radius_m = math.sqrt(abs(float(np.dot(x, y2) - np.dot(x2, y))) / 2 / math.pi)
+        # every edge, for distances to the boundary
+        self._ex, self._ey, self._edx, self._edy = x, y, x2 - x, y2 - y
+        keep = y != y2  # horizontal edges never cross the test ray
+        self._x1, self._y1, self._y2 = x[keep], y[keep], y2[keep]
+        self._dxdy = (x2 - x)[keep] / (y2 - y)[keep]
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, PreparedPolygon) and self.vertices == other.vertices
+
+    def __hash__(self) -> int:
+        return hash(self.vertices)
+
+    def __len__(self) -> int:
+        return len(self.vertices)
+
+    def in_bbox(self, lat: float, lng: float) -> bool:
+        min_lat, min_lng, max_lat, max_lng = self.bbox
+        return min_lat <= lat <= max_lat and min_lng <= lng <= max_lng
+
+    def contains(self, lat: float, lng: float) -> bool:
+        """Even-odd ray cast of one point (bounding box checked first)."""
+        if not self.in_bbox(lat, lng):
+            return False
+        x = (lng - self._lng0) * self._kx
+        y = (lat - self._lat0) * METERS_PER_DEG_LAT
+        crosses = (self._y1 > y) != (self._y2 > y)
+        hits = crosses & (x < self._x1 + (y - self._y1) * self._dxdy)
+        return bool(np.count_nonzero(hits) & 1)
+
+    def distance_m(self, lat: float, lng: float) -> float:
+        """Distance in metres from the point to the polygon (0 inside)."""
+        if self.contains(lat, lng):
+            return 0.0
+        px = (lng - self._lng0) * self._kx - self._ex
+        py = (lat - self._lat0) * METERS_PER_DEG_LAT - self._ey
+        length2 = self._edx * self._edx + self._edy * self._edy
+        t = np.clip((px * self._edx + py * self._edy) / np.where(length2 > 0, length2, 1.0), 0.0, 1.0)
+        return float(np.sqrt(np.min((px - t * self._edx) ** 2 + (py - t * self._edy) ** 2)))
+
+    def contains_many(self, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+        """Vectorised ``contains`` for arrays of degrees."""
+        min_lat, min_lng, max_lat, max_lng = self.bbox
+        inside = (lats >= min_lat) & (lats <= max_lat) & (lngs >= min_lng) & (lngs <= max_lng)
+        idx = np.flatnonzero(inside)
+        step = max(1, MATCH_CHUNK_CELLS // len(self._x1)) if len(self._x1) else len(idx) or 1
+        for start in range(0, len(idx), step):
+            chunk = idx[start:start + step]
+            x = ((lngs[chunk] - self._lng0) * self._kx)[:, None]
+            y = ((lats[chunk] - self._lat0) * METERS_PER_DEG_LAT)[:, None]
+            crosses = (self._y1 > y) != (self._y2 > y)
+            hits = crosses & (x < self._x1 + (y - self._y1) * self._dxdy)
+            inside[chunk] = (np.count_nonzero(hits, axis=1) & 1).astype(bool)
+        return inside
+
+
+@dataclass(frozen=True)
+class SiteGeom:
+    """Immutable snapshot of the site fields needed for matching and tagging."""
+
+    id: int
+    lat: float
+    lng: float
+    radius_m: float
+    name_ar: Optional[str] = None
+    name_en: Optional[str] = None
+    # when set, the polygon replaces the radius for matching
+    polygon: Optional[PreparedPolygon] = None
+
+    @classmethod
+    def from_site(cls, site: Site) -> "SiteGeom":
+        return cls(
+            id=site.id,
+            lat=site.lat,
+            lng=site.lng,
+            radius_m=site.radius_m,
+            name_ar=site.name_ar,
+            name_en=site.name_en,
+            polygon=PreparedPolygon(site.polygon) if site.polygon else None,
+        )
+
+    def bbox(self) -> Tuple[float, float, float, float]:
+        """Return ``(min_lat, min_lng, max_lat, max_lng)`` covering the site."""
+        if self.polygon is not None:
+            return self.polygon.bbox
+        dlat = self.radius_m / METERS_PER_DEG_LAT
+        cos_lat = max(math.cos(math.radians(self.lat)), 1e-6)
+        dlng = self.radius_m / (METERS_PER_DEG_LAT * cos_lat)
+        return self.lat - dlat, self.lng - dlng, self.lat + dlat, self.lng + dlng
+
+    def distance_m(self, lat: float, lng: float) -> float:
+        return haversine_m(lat, lng, self.lat, self.lng)
+
+    def contains(self, lat: float, lng: float, distance_m: Optional[float] = None) -> bool:
+        if self.polygon is not None:
+            return self.polygon.contains(lat, lng)
+        if distance_m is None:
+            distance_m = self.distance_m(lat, lng)
+        return distance_m <= self.radius_m
+
+    def within_exit(self, lat: float, lng: float, factor: float) -> bool:
+        """
+        Inside the site grown for exit hysteresis: ``radius * factor`` for a
+        circle; for a polygon, within ``(factor - 1)`` times the radius of the
+        equal-area circle of its boundary.
+        """
+        if self.polygon is not None:
+            return self.polygon.distance_m(lat, lng) <= self.polygon.radius_m * (factor - 1)
+        return self.distance_m(lat, lng) <= self.radius_m * factor
+
+
+class SiteIndex:
+    """
+    Uniform lat/lng grid over the active sites.
+
+    Readers never take the lock: cell buckets are immutable tuples that are
+    swapped in atomically, so a concurrent patch or rebuild can only make a
+    reader see the previous or the next version of a bucket.
+    """
+
+    def __init__(self, cell_deg: float = SITE_INDEX_CELL_DEG, ttl_s: float = SITE_INDEX_TTL_S):
+        self.cell_deg = cell_deg
+        self.ttl_s = ttl_s
+        self._sites: Dict[int, SiteGeom] = {}
+        self._cells: Dict[Cell, Tuple[SiteGeom, ...]] = {}
+        self._loaded_at: Optional[float] = None
+        # Shared snapshot version this index was built from (None: built from the DB).
+        self.version: Optional[int] = None
+        self._arrays: Optional[tuple] = None
+        self._lock = threading.Lock()
+
+    # ----- grid helpers -----
+    def _cell(self, lat: float, lng: float) -> Cell:
+        return math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg)
+
+    def _cells_for(self, geom: SiteGeom) -> Iterable[Cell]:
+        min_lat, min_lng, max_lat, max_lng = geom.bbox()
+        i0, j0 = self._cell(min_lat, min_lng)
+        i1, j1 = self._cell(max_lat, max_lng)
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                yield i, j
+
+    def _add(self, geom: SiteGeom) -> None:
+        self._arrays = None
+        self._sites[geom.id] = geom
+        for cell in self._cells_for(geom):
+            self._cells[cell] = self._cells.get(cell, ()) + (geom,)
+
+    def _discard(self, site_id: int) -> None:
+        old = self._sites.pop(site_id, None)
+        if old is None:
+            return
+        self._arrays = None
+        for cell in self._cells_for(old):
+            bucket = tuple(g for g in self._cells.get(cell, ()) if g.id != site_id)
+            if bucket:
+                self._cells[cell] = bucket
+            else:
+                self._cells.pop(cell, None)
+
+    # ----- loading -----
+    def rebuild(self, geoms: Iterable[SiteGeom], version: Optional[int] = None) -> None:
+        """Replace the whole index with the given site geometries."""
+        index = SiteIndex(self.cell_deg, self.ttl_s)
+        for geom in geoms:
+            index._add(geom)
+        with self._lock:
+            self._sites, self._cells = index._sites, index._cells
+            self._arrays = None
+            self.version = version
+            self._loaded_at = time.monotonic()
+
+    def load(self, db: Session) -> None:
+        """Rebuild the index from the active rows of the ``sites`` table."""
+        sites = db.query(Site).filter_by(is_active=True).all()
+        self.rebuild(SiteGeom.from_site(s) for s in sites)
+
+    def is_stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl_s
+
+    def ensure_loaded(self, db: Session) -> None:
+        """Load the index if it is empty or older than the TTL."""
+        if self.is_stale():
+            self.load(db)
+
+    def touch(self) -> None:
+        """Mark the current contents as confirmed up to date."""
+        self._loaded_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        """Force a rebuild on the next ``ensure_loaded`` call."""
+        self._loaded_at = None
+
+    # ----- patching -----
+    def upsert(self, site: Site) -> None:
+        """Insert or replace a site; inactive sites are removed from the index."""
+        with self._lock:
+            self._discard(site.id)
+            if site.is_active:
+                self._add(SiteGeom.from_site(site))
+
+    def remove(self, site_id: int) -> None:
+        with self._lock:
+            self._discard(site_id)
+
+    # ----- queries -----
+    def get(self, site_id: int) -> Optional[SiteGeom]:
+        return self._sites.get(site_id)
+
+    def __len__(self) -> int:
+        return len(self._sites)
+
+    def candidates(self, lat: float, lng: float) -> Tuple[SiteGeom, ...]:
+        """Return the sites whose bounding box may contain the given point."""
+        return self._cells.get(self._cell(lat, lng), ())
+
+    def nearest(self, lat: float, lng: float) -> Optional[SiteGeom]:
+        """Return the nearest active site (by centre) that contains the point."""
+        nearest_site = None
+        nearest_dist = None
+        for site in self.candidates(lat, lng):
+            d = site.distance_m(lat, lng)
+            if (nearest_dist is None or d < nearest_dist) and site.contains(lat, lng, d):
+                nearest_dist, nearest_site = d, site
+        return nearest_site
+
+    def _site_arrays(self) -> Optional[tuple]:
+        """Return ``(geoms, lat_rad, lng_rad, radius_m)`` column arrays (polygons: inf radius)."""
+        arrays = self._arrays
+        if arrays is None:
+            geoms = tuple(self._sites.values())
+            if not geoms:
+                return None
+            arrays = (
+                geoms,
+                np.radians(np.fromiter((g.lat for g in geoms), float, len(geoms))),
+                np.radians(np.fromiter((g.lng for g in geoms), float, len(geoms))),
+                np.fromiter((np.inf if g.polygon is not None else g.radius_m for g in geoms), float, len(geoms)),
+            )
+            self._arrays = arrays
+        return arrays
+
+    def match_many(self, lats: Sequence[float], lngs: Sequence[float]) -> List[Optional[SiteGeom]]:
+        """
+        Vectorised ``nearest`` for many points at once.
+
+        Computes the full points x sites haversine matrix with NumPy (in chunks
+        bounded by ``MATCH_CHUNK_CELLS``) and picks the nearest site whose
+        radius (or polygon) contains each point.
+        """
+        n = len(lats)
+        arrays = self._site_arrays()
+        if arrays is None or n == 0:
+            return [None] * n
+        geoms, s_lat, s_lng, s_radius = arrays
+        p_lat = np.radians(np.asarray(lats, dtype=float))
+        p_lng = np.radians(np.asarray(lngs, dtype=float))
+        cos_s_lat = np.cos(s_lat)
+        polygons = [(k, g.polygon) for k, g in enumerate(geoms) if g.polygon is not None]
+        deg_lat = np.asarray(lats, dtype=float)
+        deg_lng = np.asarray(lngs, dtype=float)
+
+        matches: List[Optional[SiteGeom]] = []
+        step = max(1, MATCH_CHUNK_CELLS // len(geoms))
+        for start in range(0, n, step):
+            lat = p_lat[start:start + step, None]
+            lng = p_lng[start:start + step, None]
+            a = (np.sin((s_lat - lat) / 2) ** 2 +
+                 np.cos(lat) * cos_s_lat * np.sin((s_lng - lng) / 2) ** 2)
+            d = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+            d = np.where(d <= s_radius, d, np.inf)
+            for k, polygon in polygons:
+                outside = ~polygon.contains_many(deg_lat[start:start + step], deg_lng[start:start + step])
+                d[outside, k] = np.inf
+            best = np.argmin(d, axis=1)
+            hit = np.isfinite(d[np.arange(len(best)), best])
+            matches.extend(geoms[b] if h else None for b, h in zip(best.tolist(), hit.tolist()))
+        return matches
+
+
+# Process-wide index shared by all requests of this worker.
+site_index = SiteIndex()
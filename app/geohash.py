@@ -0,0 +1,90 @@
+"""
+Integer geohash of tracking points for spatial range queries.
+
+Each point stores the 52-bit geohash of its fix in ``tracking_points.geohash``:
+26 bits of longitude and 26 of latitude interleaved exactly like the
+base-32 geohash (longitude first), i.e. a cell of roughly 0.6 m x 0.3 m.
+Because the bits are interleaved, every coarser cell is a contiguous range
+of integers, so "points in this cell" is ``geohash BETWEEN lo AND hi`` on a
+plain B-tree index (no text collation or ``LIKE`` prefix rules involved).
+
+``cover_ranges`` expands a query circle to the coarsest cells that still
+cover its bounding box with at most ``NEAR_MAX_CELLS`` cells and returns
+their integer ranges; the caller refines the candidates exactly with
+``haversine_m``.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+from typing import List, Tuple
+
+from .geofence import METERS_PER_DEG_LAT
+
+GEOHASH_BITS = 26  # per axis
+NEAR_MAX_CELLS = int(os.getenv("NEAR_MAX_CELLS", "16"))
+NEAR_MAX_RADIUS_M = float(os.getenv("NEAR_MAX_RADIUS_M", "5000"))
+
+
+def _spread(v: int) -> int:
+    """Put bit i of a 26-bit value at bit 2i."""
+    v &= 0x3FFFFFF
+    v = (v | (v << 16)) & 0x0000FFFF0000FFFF
+    v = (v | (v << 8)) & 0x00FF00FF00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F0F0F0F0F
+    v = (v | (v << 2)) & 0x3333333333333333
+    v = (v | (v << 1)) & 0x5555555555555555
+    return v
+
+
+def _interleave(x: int, y: int) -> int:
+    return (_spread(x) << 1) | _spread(y)
+
+
+def _cell_x(lng: float, bits: int = GEOHASH_BITS) -> int:
+    return min(int((lng + 180.0) / 360.0 * (1 << bits)), (1 << bits) - 1)
+
+
+def _cell_y(lat: float, bits: int = GEOHASH_BITS) -> int:
+    return min(max(int((lat + 90.0) / 180.0 * (1 << bits)), 0), (1 << bits) - 1)
+
+
+def encode(lat: float, lng: float) -> int:
+    """52-bit integer geohash of a fix."""
+    return _interleave(_cell_x(lng), _cell_y(lat))
+
+
+def cover_ranges(lat: float, lng: float, radius_m: float, max_cells: int = NEAR_MAX_CELLS) -> List[Tuple[int, int]]:
+    """
+    Inclusive ``(lo, hi)`` geohash ranges covering the circle's bounding box.
+
+    Uses the finest level at which the box spans at most ``max_cells``
+    cells; cells that are adjacent on the curve are merged into one range.
+    """
+    dlat = radius_m / METERS_PER_DEG_LAT
+    cos_lat = math.cos(math.radians(lat))
+    dlng = 360.0 if cos_lat < 1e-6 else radius_m / (METERS_PER_DEG_LAT * cos_lat)
+    lat_lo, lat_hi = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+    for bits in range(GEOHASH_BITS, -1, -1):
+        n = 1 << bits
+        ys = range(_cell_y(lat_lo, bits), _cell_y(lat_hi, bits) + 1)
+        if dlng * 2 >= 360.0:
+            xs = range(n)
+        else:
+            # unwrapped across the antimeridian, folded back below
+            x_lo = math.floor((lng - dlng + 180.0) / 360.0 * n)
+            x_hi = math.floor((lng + dlng + 180.0) / 360.0 * n)
+            xs = range(x_lo, x_hi + 1) if x_hi - x_lo + 1 < n else range(n)
+        if len(xs) * len(ys) <= max_cells or bits == 0:
+            break
+    shift = 2 * (GEOHASH_BITS - bits)
+    cells = sorted({_interleave(x % n, y) for x in xs for y in ys})
+    ranges: List[Tuple[int, int]] = []
+    for cell in cells:
+        lo, hi = cell << shift, ((cell + 1) << shift) - 1
+        if ranges and ranges[-1][1] + 1 == lo:
+            ranges[-1] = (ranges[-1][0], hi)
+        else:
+            ranges.append((lo, hi))
+    return ranges
@@ -0,0 +1,117 @@
+"""
+Shared tracking ingestion pipeline for the Falcom Geofence API.
+
+Both the single-point and the batch tracking endpoints funnel accepted points
+through this module: points are matched against the active sites in one
+vectorised pass and written to ``tracking_points`` with a single bulk INSERT.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from . import geohash
+from .db import dialect_insert
+from .geofence import site_index
+from .metrics import SITE_MATCH_SECONDS
+from .models import TrackingPoint
+
+INSERT_CHUNK_ROWS = int(os.getenv("INSERT_CHUNK_ROWS", "250"))
+
+Row = Dict[str, Any]
+# (employee_id, timestamp, client_point_id), see app.dedup
+PointKey = Tuple[str, dt.datetime, str]
+
+
+def as_utc(value: dt.datetime) -> dt.datetime:
+    """Return an aware UTC datetime; naive values are taken to be UTC already."""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=dt.timezone.utc)
+    return value.astimezone(dt.timezone.utc)
+
+
+def point_key(row: Row) -> PointKey:
+    return (row["employee_id"], as_utc(row["timestamp"]), row.get("client_point_id") or "")
+
+
+def build_rows(
+    employee_ids: Sequence[str],
+    timestamps: Sequence[Optional[dt.datetime]],
+    lats: Sequence[float],
+    lngs: Sequence[float],
+    accuracies: Sequence[Optional[float]],
+    client_point_ids: Optional[Sequence[Optional[str]]] = None,
+) -> List[Row]:
+    """
+    Turn column arrays into ``tracking_points`` rows tagged with their site.
+
+    Missing timestamps default to the current UTC time and client-supplied
+    ones are normalised to UTC. The site index must already be loaded (see
+    ``SiteIndex.ensure_loaded``).
+
+    Without ``client_point_ids`` a point is identified by employee +
+    timestamp (see ``app.dedup``). Server-stamped points have no identity a
+    retry could repeat; they get ``#<index>`` so that points of one batch,
+    which share the same ``now``, stay distinct.
+
+    Columns may also be NumPy arrays (packed uploads): ``datetime64``
+    timestamps in UTC and float accuracies with NaN for unknown.
+    """
+    now = dt.datetime.now(dt.timezone.utc)
+    if isinstance(timestamps, np.ndarray):
+        timestamps = timestamps.astype("datetime64[us]").tolist()
+    if isinstance(accuracies, np.ndarray):
+        accuracies = np.where(np.isnan(accuracies), None, accuracies).tolist()
+    if client_point_ids is None:
+        client_point_ids = [None] * len(lats)
+    with SITE_MATCH_SECONDS.time():
+        if len(lats) == 1:
+            sites = [site_index.nearest(lats[0], lngs[0])]
+        else:
+            sites = site_index.match_many(lats, lngs)
+    return [
+        {
+            "employee_id": employee_id,
+            "timestamp": as_utc(timestamp) if timestamp is not None else now,
+            "lat": float(lat),
+            "lng": float(lng),
+            "accuracy": accuracy,
+            "site_id": site.id if site else None,
+            "site_name_ar": site.name_ar if site else None,
+            "site_name_en": site.name_en if site else None,
+            "geohash": geohash.encode(lat, lng),
+            "client_point_id": client_point_id or ("" if timestamp is not None else f"#{i}"),
+        }
+        for i, (employee_id, timestamp, lat, lng, accuracy, site, client_point_id) in enumerate(zip(
+            employee_ids, timestamps, lats, lngs, accuracies, sites, client_point_ids
+        ))
+    ]
+
+
+def insert_points(db: Session, rows: List[Row]) -> List[Optional[int]]:
+    """
+    Bulk insert the rows and return their new ids in input order.
+
+    Uses ``INSERT ... ON CONFLICT DO NOTHING RETURNING`` executemany; rows
+    whose point key is already stored are skipped and get ``None``. The
+    caller commits.
+    """
+    if not rows:
+        return []
+    table = TrackingPoint.__table__
+    stmt = dialect_insert(db, table).on_conflict_do_nothing().returning(
+        table.c.id, table.c.employee_id, table.c.timestamp, table.c.client_point_id
+    )
+    # skipped rows return nothing, so ids are matched back by point key
+    inserted: Dict[PointKey, int] = {}
+    # SQLAlchemy splices the RETURNING rows of its insertmanyvalues pages
+    # together quadratically, so very large batches go in fixed-size chunks.
+    for start in range(0, len(rows), INSERT_CHUNK_ROWS):
+        for r in db.execute(stmt, rows[start:start + INSERT_CHUNK_ROWS]):
+            inserted[(r.employee_id, as_utc(r.timestamp), r.client_point_id)] = r.id
+    return [inserted.get(point_key(row)) for row in rows]
@@ -0,0 +1,281 @@
+"""
+Write-behind ingestion queue for tracking points.
+
+With ``TRACKING_INGEST_MODE=queue`` accepted points are placed on a bounded
+in-process queue and a background writer thread flushes them in group
+commits: one bulk INSERT and one COMMIT per ``INGEST_FLUSH_MAX_ROWS`` rows or
+per ``INGEST_FLUSH_INTERVAL_MS`` window, whichever comes first.
+
+``TRACKING_ACK_MODE`` controls durability:
+
+* ``flush`` (default): the request waits until its group has been committed
+  and gets the real row ids back. If the group commit fails, its requests
+  are retried one transaction each, so only the request with the offending
+  rows gets the error.
+* ``enqueue``: the request returns as soon as the points are queued. Points
+  still in the queue are lost if the process dies before the next flush.
+
+The default ``sync`` mode writes inline on the request's own session.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .compaction import TRACKING_COMPACTION_ENABLED, insert_compacted
+from .db import SessionLocal
+from .dedup import drop_conflicts, drop_duplicates, remember
+from .ingest import Row, insert_points
+from .latest import apply_points as apply_latest
+from .rollups import apply_points as apply_rollups
+from .visits import apply_points as apply_visits
+from .metrics import (
+    DB_COMMIT_SECONDS,
+    INGEST_COMMIT_LAG_SECONDS,
+    INGEST_FLUSH_ERRORS,
+    INGEST_FLUSH_ROWS,
+    INGEST_FLUSH_SECONDS,
+    INGEST_QUEUE_DEPTH,
+    INGEST_REJECTED,
+)
+
+logger = logging.getLogger(__name__)
+
+TRACKING_INGEST_MODE = os.getenv("TRACKING_INGEST_MODE", "sync")  # sync | queue
+TRACKING_ACK_MODE = os.getenv("TRACKING_ACK_MODE", "flush")  # flush | enqueue
+INGEST_QUEUE_MAX = int(os.getenv("INGEST_QUEUE_MAX", "10000"))
+INGEST_FLUSH_MAX_ROWS = int(os.getenv("INGEST_FLUSH_MAX_ROWS", "500"))
+INGEST_FLUSH_INTERVAL_MS = float(os.getenv("INGEST_FLUSH_INTERVAL_MS", "50"))
+INGEST_ENQUEUE_TIMEOUT_S = float(os.getenv("INGEST_ENQUEUE_TIMEOUT_S", "1"))
+INGEST_ACK_TIMEOUT_S = float(os.getenv("INGEST_ACK_TIMEOUT_S", "10"))
+
+
+class IngestQueueFull(Exception):
+    """Raised when points cannot be queued within ``INGEST_ENQUEUE_TIMEOUT_S``."""
+
+
+@dataclass
+class _Pending:
+    rows: List[Row]
+    future: Future = field(default_factory=Future)
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+_STOP = object()
+
+
+class GroupCommitWriter:
+    """Background thread that drains queued rows in group commits."""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        maxsize: int = INGEST_QUEUE_MAX,
+        max_rows: int = INGEST_FLUSH_MAX_ROWS,
+        interval_s: float = INGEST_FLUSH_INTERVAL_MS / 1000.0,
+    ):
+        self.session_factory = session_factory
+        self.max_rows = max_rows
+        self.interval_s = interval_s
+        self._queue: "queue.Queue[object]" = queue.Queue(maxsize=maxsize)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        INGEST_QUEUE_DEPTH.set_function(self._queue.qsize)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        with self._lock:
+            if self.running:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="tracking-group-commit", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Flush everything already queued, then stop the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+
+    def submit(self, rows: List[Row], timeout: Optional[float] = INGEST_ENQUEUE_TIMEOUT_S) -> Future:
+        """
+        Queue rows for the next group commit; the future resolves to their ids.
+
+        Waits up to ``timeout`` seconds for room in the queue; ``0`` never
+        blocks, which is what callers on the event loop must use.
+        """
+        self.start()
+        pending = _Pending(rows)
+        try:
+            if timeout == 0:
+                self._queue.put_nowait(pending)
+            else:
+                self._queue.put(pending, timeout=timeout)
+        except queue.Full:
+            INGEST_REJECTED.inc()
+            raise IngestQueueFull("tracking ingestion queue is full") from None
+        return pending.future
+
+    # ----- writer thread -----
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            group: List[_Pending] = [item]
+            n_rows = len(item.rows)
+            deadline = time.monotonic() + self.interval_s
+            while n_rows < self.max_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                group.append(item)
+                n_rows += len(item.rows)
+            self._flush(group)
+        # drain whatever arrived after the stop marker
+        leftovers = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                leftovers.append(item)
+        if leftovers:
+            self._flush(leftovers)
+
+    def _flush(self, group: List[_Pending]) -> None:
+        rows = [row for pending in group for row in pending.rows]
+        started = time.monotonic()
+        try:
+            ids = self._commit(rows)
+        except Exception as exc:  # noqa: BLE001 - reported through the futures
+            INGEST_FLUSH_ERRORS.inc()
+            if len(group) == 1:
+                logger.exception("group commit of %d tracking points failed", len(rows))
+                group[0].future.set_exception(exc)
+                return
+            # one bad row must not fail every request of the group
+            logger.warning("group commit of %d requests failed (%s), retrying them one by one", len(group), exc)
+            for pending in group:
+                for row in pending.rows:
+                    # flags from the failed attempt (e.g. repeats across requests)
+                    row.pop("duplicate", None)
+                    row.pop("absorbed", None)
+                self._flush([pending])
+            return
+
+        finished = time.monotonic()
+        INGEST_FLUSH_SECONDS.observe(finished - started)
+        INGEST_FLUSH_ROWS.observe(len(rows))
+        offset = 0
+        for pending in group:
+            INGEST_COMMIT_LAG_SECONDS.observe(finished - pending.enqueued_at)
+            pending.future.set_result(ids[offset:offset + len(pending.rows)])
+            offset += len(pending.rows)
+
+    def _commit(self, rows: List[Row]) -> List[Optional[int]]:
+        db = self.session_factory()
+        try:
+            ids = persist_points(db, rows)
+            with DB_COMMIT_SECONDS.time():
+                db.commit()
+            return ids
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+def persist_points(db: Session, rows: List[Row]) -> List[Optional[int]]:
+    """
+    Write rows and maintain the tables derived from them, in one transaction.
+
+    Used by both the inline and the write-behind path; the caller commits.
+    Re-sent points are flagged ``row["duplicate"]`` and get no id (see
+    ``app.dedup``).
+    """
+    fresh = drop_duplicates(db, rows, check_db=TRACKING_COMPACTION_ENABLED)
+    if TRACKING_COMPACTION_ENABLED:
+        ids = insert_compacted(db, fresh)
+    else:
+        fresh, ids = drop_conflicts(fresh, insert_points(db, fresh))
+    # visits and rollups always see every raw (new) point
+    apply_visits(db, fresh)
+    apply_rollups(db, fresh)
+    apply_latest(db, fresh, ids)
+    remember(db, rows)
+    by_row = {id(row): point_id for row, point_id in zip(fresh, ids)}
+    return [by_row.get(id(row)) for row in rows]
+
+
+# Process-wide writer; only started when the queue mode is in use.
+ingest_writer = GroupCommitWriter()
+
+
+def store_rows(db: Session, rows: List[Row]) -> Optional[List[int]]:
+    """
+    Persist rows according to the configured ingestion mode.
+
+    Returns the new ids, or ``None`` when ``TRACKING_ACK_MODE=enqueue`` and
+    the rows were only queued. Raises ``IngestQueueFull`` on back-pressure.
+    """
+    if TRACKING_INGEST_MODE != "queue":
+        ids = persist_points(db, rows)
+        with DB_COMMIT_SECONDS.time():
+            db.commit()
+        return ids
+    future = ingest_writer.submit(rows)
+    if TRACKING_ACK_MODE == "enqueue":
+        return None
+    # Hand the request's pooled connection back before blocking, otherwise
+    # enough waiting requests can exhaust the pool the writer needs.
+    db.close()
+    return future.result(timeout=INGEST_ACK_TIMEOUT_S)
+
+
+async def store_rows_async(db: AsyncSession, rows: List[Row]) -> Optional[List[int]]:
+    """
+    ``store_rows`` for async endpoints.
+
+    The inline path runs ``persist_points`` on the async connection via
+    ``run_sync``; the queue path never blocks the event loop and awaits the
+    group commit instead of parking a thread on it.
+    """
+    if TRACKING_INGEST_MODE != "queue":
+        ids = await db.run_sync(persist_points, rows)
+        with DB_COMMIT_SECONDS.time():
+            await db.commit()
+        return ids
+    future = ingest_writer.submit(rows, timeout=0)
+    if TRACKING_ACK_MODE == "enqueue":
+        return None
+    await db.close()
+    return await asyncio.wait_for(asyncio.wrap_future(future), INGEST_ACK_TIMEOUT_S)
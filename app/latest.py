@@ -0,0 +1,136 @@
+"""
+Latest position per employee (``latest_positions``) for the fleet view.
+
+``apply_points`` upserts the newest fix of each employee in an accepted batch
+in the same transaction as the raw insert. The upsert only replaces a row
+with a fix that is at least as new, so offline uploads replayed late never
+move an employee back in time.
+
+``latest_positions`` (the object) is this worker's write-through copy of the
+table: rows committed here are merged into it right after commit, and the
+whole table (one row per employee) is reloaded every ``LATEST_RELOAD_S``
+seconds to pick up points accepted by other workers. ``GET /tracking/latest``
+is served from it, so the fleet view costs O(employees), not O(history).
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from .db import dialect_insert
+from .ingest import Row, as_utc
+from .models import LatestPosition
+
+LATEST_POSITIONS_ENABLED = os.getenv("LATEST_POSITIONS_ENABLED", "1") == "1"
+LATEST_RELOAD_S = float(os.getenv("LATEST_RELOAD_S", "60"))
+
+LATEST_COLUMNS = (
+    "employee_id",
+    "timestamp",
+    "lat",
+    "lng",
+    "accuracy",
+    "site_id",
+    "site_name_ar",
+    "site_name_en",
+    "point_id",
+)
+
+_PENDING_KEY = "pending_latest_positions"
+
+
+def newest_per_employee(rows: Sequence[Row], ids: Sequence[Optional[int]]) -> Dict[str, Row]:
+    """Reduce a batch to one position per employee (the newest fix)."""
+    newest: Dict[str, Row] = {}
+    for row, point_id in zip(rows, ids):
+        position = {c: row.get(c) for c in LATEST_COLUMNS}
+        position["timestamp"] = as_utc(row["timestamp"])
+        position["point_id"] = point_id
+        current = newest.get(row["employee_id"])
+        if current is None or position["timestamp"] >= current["timestamp"]:
+            newest[row["employee_id"]] = position
+    return newest
+
+
+def apply_points(db: Session, rows: List[Row], ids: Sequence[Optional[int]]) -> None:
+    """Upsert the newest fix per employee; caller commits."""
+    if not LATEST_POSITIONS_ENABLED or not rows:
+        return
+    newest = newest_per_employee(rows, ids)
+    table = LatestPosition.__table__
+    stmt = dialect_insert(db, table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.employee_id],
+        set_={c: stmt.excluded[c] for c in LATEST_COLUMNS if c != "employee_id"},
+        # out-of-order offline uploads never replace a newer fix
+        where=stmt.excluded.timestamp >= table.c.timestamp,
+    )
+    # sorted: concurrent writers lock rows in the same order
+    db.execute(stmt, [newest[e] for e in sorted(newest)])
+    db.info.setdefault(_PENDING_KEY, []).append(newest)
+
+
+class LatestPositions:
+    """Write-through, periodically reloaded copy of ``latest_positions``."""
+
+    def __init__(self, reload_s: float = LATEST_RELOAD_S):
+        self.reload_s = reload_s
+        self._positions: Dict[str, Row] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def is_stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.reload_s
+
+    def load(self, db: Session) -> None:
+        loaded = {}
+        for r in db.execute(select(*(getattr(LatestPosition, c) for c in LATEST_COLUMNS))).mappings():
+            position = dict(r)
+            position["timestamp"] = as_utc(position["timestamp"])
+            loaded[position["employee_id"]] = position
+        with self._lock:
+            # keep anything merged after the query started that is newer
+            for employee_id, position in self._positions.items():
+                current = loaded.get(employee_id)
+                if current is None or position["timestamp"] > current["timestamp"]:
+                    loaded[employee_id] = position
+            self._positions = loaded
+            self._loaded_at = time.monotonic()
+
+    def merge(self, positions: Iterable[Row]) -> None:
+        with self._lock:
+            for position in positions:
+                current = self._positions.get(position["employee_id"])
+                if current is None or position["timestamp"] >= current["timestamp"]:
+                    self._positions[position["employee_id"]] = position
+
+    def snapshot(self, site_ids: Optional[Iterable[int]] = None) -> List[Tuple]:
+        """Positions as ``LATEST_COLUMNS`` tuples ordered by employee id."""
+        wanted = set(site_ids) if site_ids else None
+        with self._lock:
+            positions = list(self._positions.values())
+        return [
+            tuple(p[c] for c in LATEST_COLUMNS)
+            for p in sorted(positions, key=lambda p: p["employee_id"])
+            if wanted is None or p["site_id"] in wanted
+        ]
+
+
+latest_positions = LatestPositions()
+
+
+@event.listens_for(Session, "after_commit")
+def _merge_committed(session: Session) -> None:
+    for newest in session.info.pop(_PENDING_KEY, ()):
+        latest_positions.merge(newest.values())
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,127 @@
+"""
+In-process fan-out of accepted tracking points to live dashboards.
+
+The tracking endpoints call ``live_hub.publish`` once their rows are
+stored; ``GET /tracking/live`` subscribes and streams what arrives as
+Server-Sent Events. Publishing is thread-safe (sync endpoints run in the
+threadpool) and never blocks: rows are handed to the event loop with
+``call_soon_threadsafe`` and nothing is done at all without subscribers.
+
+Each subscription keeps at most the latest position per employee, bounded
+to ``LIVE_BUFFER_MAX`` employees. A dashboard that reads slowly therefore
+skips intermediate positions instead of growing a queue or slowing down
+ingestion; the oldest pending employee is evicted when the buffer is full.
+
+The hub is per process: a stream only sees points accepted by the worker
+serving it. With several workers (``uvicorn --workers`` or replicas) each
+dashboard gets that worker's share of the fleet only, so the live stream
+needs a single ingest worker, or a sticky route for both ``/tracking`` writes
+and ``/tracking/live``, until points are relayed between workers.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set
+
+from .ingest import Row
+from .metrics import LIVE_POSITIONS_COALESCED, LIVE_POSITIONS_SENT, LIVE_SUBSCRIBERS
+
+LIVE_BUFFER_MAX = int(os.getenv("LIVE_BUFFER_MAX", "1000"))
+LIVE_MAX_SUBSCRIBERS = int(os.getenv("LIVE_MAX_SUBSCRIBERS", "200"))
+LIVE_HEARTBEAT_S = float(os.getenv("LIVE_HEARTBEAT_S", "15"))
+
+# fields pushed to dashboards for each accepted point
+LIVE_FIELDS = ("id", "employee_id", "timestamp", "lat", "lng", "accuracy", "site_id", "site_name_ar", "site_name_en")
+
+
+class TooManySubscribers(RuntimeError):
+    pass
+
+
+class Subscription:
+    """Coalescing buffer of one stream: latest pending position per employee."""
+
+    def __init__(
+        self,
+        employee_ids: Optional[Iterable[str]] = None,
+        site_ids: Optional[Iterable[int]] = None,
+        maxsize: int = LIVE_BUFFER_MAX,
+    ):
+        self.employee_ids: Optional[Set[str]] = set(employee_ids) if employee_ids else None
+        self.site_ids: Optional[Set[int]] = set(site_ids) if site_ids else None
+        self.maxsize = maxsize
+        self._pending: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._ready = asyncio.Event()
+
+    def matches(self, position: Dict[str, Any]) -> bool:
+        if self.employee_ids is not None and position["employee_id"] not in self.employee_ids:
+            return False
+        return self.site_ids is None or position["site_id"] in self.site_ids
+
+    def offer(self, position: Dict[str, Any]) -> None:
+        """Add a position (event loop thread only)."""
+        employee_id = position["employee_id"]
+        if employee_id in self._pending:
+            self._pending[employee_id] = position
+            LIVE_POSITIONS_COALESCED.inc()
+        else:
+            if len(self._pending) >= self.maxsize:
+                self._pending.popitem(last=False)
+                LIVE_POSITIONS_COALESCED.inc()
+            self._pending[employee_id] = position
+        self._ready.set()
+
+    async def next_batch(self, timeout: float = LIVE_HEARTBEAT_S) -> List[Dict[str, Any]]:
+        """Wait up to ``timeout`` for positions; an empty list means none arrived."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self._ready.clear()
+        batch = list(self._pending.values())
+        self._pending.clear()
+        LIVE_POSITIONS_SENT.inc(len(batch))
+        return batch
+
+
+class LiveHub:
+    def __init__(self, max_subscribers: int = LIVE_MAX_SUBSCRIBERS):
+        self.max_subscribers = max_subscribers
+        self._subscribers: Set[Subscription] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def subscribe(self, subscription: Subscription) -> Subscription:
+        if len(self._subscribers) >= self.max_subscribers:
+            raise TooManySubscribers("too many live subscribers")
+        self._loop = asyncio.get_running_loop()
+        self._subscribers.add(subscription)
+        LIVE_SUBSCRIBERS.set(len(self._subscribers))
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._subscribers.discard(subscription)
+        LIVE_SUBSCRIBERS.set(len(self._subscribers))
+
+    def publish(self, rows: Sequence[Row], ids: Optional[Sequence[Optional[int]]] = None) -> None:
+        """Hand stored rows to the subscribers; callable from any thread."""
+        loop = self._loop
+        if not self._subscribers or loop is None or loop.is_closed():
+            return
+        positions = [
+            {**{f: row.get(f) for f in LIVE_FIELDS}, "id": ids[i] if ids is not None else None}
+            for i, row in enumerate(rows)
+            if not row.get("duplicate")
+        ]
+        loop.call_soon_threadsafe(self._deliver, positions)
+
+    def _deliver(self, positions: List[Dict[str, Any]]) -> None:
+        for subscription in list(self._subscribers):
+            for position in positions:
+                if subscription.matches(position):
+                    subscription.offer(position)
+
+
+live_hub = LiveHub()
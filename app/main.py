@@ -1,14 +1,30 @@
 from __future__ import annotations
 import asyncio
-from fastapi import FastAPI
+import logging
+from fastapi import FastAPI, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from sqlalchemy.exc import IntegrityError
 
-from .db import Base, engine, SessionLocal
+from .db import Base, async_engine, engine, SessionLocal
 from .models import User, UserRole, Site
-from .auth import get_password_hash
+from .auth import get_password_hash, shutdown_hash_pool, warm_hash_pool
+from .ingest_queue import TRACKING_INGEST_MODE, ingest_writer
+from .metrics import MetricsMiddleware
+from .query_profiler import DB_PROFILING_ENABLED, QueryProfilerMiddleware
+from .partitions import ensure_partitions_on_boot
+from .site_cache import site_snapshots
+from .startup import STARTUP_MODE, lock_seed, needs_seed, readiness, schema_at_head, warm_async_pool, warm_pool
 from .routers import auth as auth_router, sites as sites_router
 from .routers import tracking as tracking_router  # NEW
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI(title="Falcom Geofence API")
+# زمن كل طلب حسب المسار + عدد الطلبات الجارية (يظهر في /metrics)
+app.add_middleware(MetricsMiddleware)
+if DB_PROFILING_ENABLED:
+    # عدد الاستعلامات وزمنها لكل طلب (X-DB-Query-Count / X-DB-Time-Ms)
+    app.add_middleware(QueryProfilerMiddleware)
 
 def _site_kwargs(
     name_en: str,
@@ -54,6 +70,8 @@ def seed() -> None:
     """
     db = SessionLocal()
     try:
+        # عمّال يقلعون مع بعض على قاعدة فاضية: واحد بس يزرع والباقي ينتظر ثم يلقى البيانات
+        lock_seed(db)
         # 1) Admin user (employee_id=220220) إن لم يوجد
         admin = db.query(User).filter_by(employee_id="220220").first()
         if not admin:
@@ -102,17 +120,59 @@ def seed() -> None:
             db.add_all(Site(**s) for s in sites_data)
 
         db.commit()
+    except IntegrityError:
+        # بدون قفل (SQLite): عامل ثاني زرع قبلنا
+        db.rollback()
+        logger.info("seed already applied by another worker")
     finally:
         db.close()
 
 
+def prepare_database() -> None:
+    """DDL + seed حسب STARTUP_MODE (انظر app/startup.py)."""
+    if STARTUP_MODE == "fast":
+        # fast: الـ migrations و cron الأقسام مسؤولين عن كل شي، ولا نزرع بيانات
+        return
+    full = STARTUP_MODE == "full" or not schema_at_head(engine)
+    if full:
+        # إنشاء الجداول (لا يضر حتى لو Alembic يعمل migrations)
+        Base.metadata.create_all(bind=engine)
+    # أقسام tracking_points الشهرية القادمة (PostgreSQL فقط، وإلا لا شيء)
+    # بقفل advisory وبدون ما يوقف الإقلاع لو فشل
+    ensure_partitions_on_boot(engine)
+    if full or needs_seed(engine):
+        seed()
+
+
+async def warm_up() -> None:
+    loop = asyncio.get_running_loop()
+    # نسخة المواقع المشتركة عبر Redis (تحميل أولي + متابعة التحديثات)
+    await loop.run_in_executor(None, site_snapshots.start)
+    # فتح اتصالات الـ pool مسبقاً + تشغيل عمليات bcrypt
+    await loop.run_in_executor(None, warm_pool, engine)
+    await warm_async_pool(async_engine)
+    await loop.run_in_executor(None, warm_hash_pool)
+
+
 @app.on_event("startup")
 async def on_startup():
-    # إنشاء الجداول (لا يضر حتى لو Alembic يعمل migrations)
-    Base.metadata.create_all(bind=engine)
-    # شغّل seeding في ثريد منفصل (بدون استخدام get_db كـ context manager)
+    # شغّل تجهيز القاعدة في ثريد منفصل (بدون استخدام get_db كـ context manager)
+    loop = asyncio.get_event_loop()
+    await loop.run_in_executor(None, prepare_database)
+    if TRACKING_INGEST_MODE == "queue":
+        ingest_writer.start()
+    # التسخين في الخلفية؛ /ready يرجع 503 حتى ينتهي
+    readiness.start_warmup(warm_up())
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await readiness.stop()
+    # فرّغ طابور الكتابة (group commit) قبل إيقاف العامل
     loop = asyncio.get_event_loop()
-    await loop.run_in_executor(None, seed)
+    await loop.run_in_executor(None, ingest_writer.stop)
+    await loop.run_in_executor(None, site_snapshots.stop)
+    await loop.run_in_executor(None, shutdown_hash_pool)
 
 # تسجيل الراوترات (نفس القواعد اللي ثبتناها)
 app.include_router(auth_router.router)
@@ -122,3 +182,16 @@ app.include_router(tracking_router.router)  # NEW
 @app.get("/health")
 def health():
     return {"status": "ok"}
+
+
+@app.get("/ready")
+def ready(response: Response):
+    # جاهز لاستقبال الطلبات فقط بعد انتهاء التسخين
+    if not readiness.ready:
+        response.status_code = 503
+    return {"status": "ready" if readiness.ready else "not_ready", "detail": readiness.detail}
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,184 @@
+"""
+Prometheus metrics for the Falcom Geofence API.
+
+All collectors live on the default ``prometheus_client`` registry and are
+exposed in text format by ``GET /metrics`` in ``app/main.py``. Besides the
+ingestion metrics this covers the live feed, per-route request latency
+(``MetricsMiddleware``), per-stage latency of the hot paths and the
+SQLAlchemy connection pools.
+"""
+
+from __future__ import annotations
+
+import time
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# ----- write-behind ingestion -----
+INGEST_QUEUE_DEPTH = Gauge(
+    "tracking_ingest_queue_depth",
+    "Pending write requests in the tracking write-behind queue",
+)
+INGEST_FLUSH_SECONDS = Histogram(
+    "tracking_ingest_flush_seconds",
+    "Time spent writing and committing one group of tracking points",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+INGEST_FLUSH_ROWS = Histogram(
+    "tracking_ingest_flush_rows",
+    "Tracking points written per group commit",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500),
+)
+INGEST_COMMIT_LAG_SECONDS = Histogram(
+    "tracking_ingest_commit_lag_seconds",
+    "Time from enqueueing tracking points to their group commit",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+INGEST_FLUSH_ERRORS = Counter(
+    "tracking_ingest_flush_errors_total",
+    "Group commits that failed and were rolled back",
+)
+INGEST_REJECTED = Counter(
+    "tracking_ingest_rejected_total",
+    "Write requests rejected because the ingestion queue was full",
+)
+INGEST_DUPLICATES = Counter(
+    "tracking_ingest_duplicates_total",
+    "Re-sent tracking points dropped as duplicates",
+    ["source"],  # cache | database
+)
+
+# ----- ingest compaction -----
+COMPACTION_POINTS_IN = Counter(
+    "tracking_compaction_points_in_total",
+    "Accepted tracking points that went through ingest compaction",
+)
+COMPACTION_ROWS_OUT = Counter(
+    "tracking_compaction_rows_written_total",
+    "New tracking_points rows written after compaction",
+)
+COMPACTION_RATIO = Gauge(
+    "tracking_compaction_ratio",
+    "Accepted points per row written since start (1 = no compaction)",
+)
+
+# ----- live position feed -----
+LIVE_SUBSCRIBERS = Gauge(
+    "tracking_live_subscribers",
+    "Open /tracking/live streams",
+)
+LIVE_POSITIONS_SENT = Counter(
+    "tracking_live_positions_sent_total",
+    "Positions delivered to live subscribers",
+)
+LIVE_POSITIONS_COALESCED = Counter(
+    "tracking_live_positions_coalesced_total",
+    "Positions replaced by a newer one (or evicted) before a slow subscriber read them",
+)
+
+# ----- HTTP requests -----
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Time to serve a request, per route template, until the response body is sent",
+    ["method", "route", "status"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "Requests currently being served",
+)
+
+# ----- request stages -----
+STAGE_SECONDS = Histogram(
+    "falcom_stage_duration_seconds",
+    "Time spent in one stage of request handling",
+    ["stage"],
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+JWT_DECODE_SECONDS = STAGE_SECONDS.labels(stage="jwt_decode")
+USER_LOOKUP_SECONDS = STAGE_SECONDS.labels(stage="user_lookup")
+SITE_MATCH_SECONDS = STAGE_SECONDS.labels(stage="site_match")
+DB_COMMIT_SECONDS = STAGE_SECONDS.labels(stage="db_commit")
+BCRYPT_SECONDS = STAGE_SECONDS.labels(stage="bcrypt")
+
+# ----- SQLAlchemy connection pools (label: sync / async engine) -----
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out",
+    "Connections currently checked out of the pool",
+    ["pool"],
+)
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_overflow",
+    "Connections open beyond pool_size (max_overflow headroom in use)",
+    ["pool"],
+)
+DB_POOL_WAIT_SECONDS = Histogram(
+    "db_pool_wait_seconds",
+    "Time spent waiting to check a connection out of the pool",
+    ["pool"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+)
+
+
+def watch_pool(label: str, engine) -> None:
+    """Export checked-out and overflow gauges for ``engine``'s current pool."""
+
+    def checked_out() -> float:
+        checkedout = getattr(engine.pool, "checkedout", None)
+        return checkedout() if checkedout else 0
+
+    def overflow() -> float:
+        # QueuePool.overflow() starts at -pool_size and counts up
+        overflow = getattr(engine.pool, "overflow", None)
+        return max(overflow(), 0) if overflow else 0
+
+    DB_POOL_CHECKED_OUT.labels(pool=label).set_function(checked_out)
+    DB_POOL_OVERFLOW.labels(pool=label).set_function(overflow)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording per-route latency and the in-flight gauge.
+
+    Routes are labelled by their path template (``/sites/{site_id}``), taken
+    from the endpoint the router resolved, so labels stay low-cardinality;
+    anything that matched no route is labelled ``unmatched``.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._templates = None
+
+    def _route(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if self._templates is None:
+            self._templates = {
+                route.endpoint: route.path_format
+                for route in scope["app"].routes
+                if hasattr(route, "endpoint") and hasattr(route, "path_format")
+            }
+        return self._templates.get(endpoint, "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            HTTP_REQUEST_SECONDS.labels(scope["method"], self._route(scope), str(status)).observe(
+                time.perf_counter() - started
+            )
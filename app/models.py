@@ -2,7 +2,7 @@
 from __future__ import annotations
 import datetime as dt
 from enum import Enum
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey
+from sqlalchemy import BigInteger, Column, Integer, String, Float, Date, DateTime, Boolean, ForeignKey, Index, JSON, UniqueConstraint, text
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from sqlalchemy.types import Enum as SqlEnum
 
@@ -26,6 +26,8 @@ class Site(Base):
     lat: Mapped[float] = mapped_column(Float, nullable=False)
     lng: Mapped[float] = mapped_column(Float, nullable=False)
     radius_m: Mapped[float] = mapped_column(Float, nullable=False, default=150.0)
+    # optional [[lat, lng], ...] ring; when set it replaces the radius for matching
+    polygon: Mapped[list | None] = mapped_column(JSON, nullable=True)
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
     created_at: Mapped[dt.datetime] = mapped_column(DateTime(timezone=True), default=dt.datetime.utcnow)
 
@@ -53,3 +55,75 @@ class TrackingPoint(Base):
     # cache bilingual site names at insertion time (for stable reporting)
     site_name_ar: Mapped[str | None] = mapped_column(String(255), nullable=True)
     site_name_en: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    # ingest compaction: a stationary run is stored once, from timestamp to last_timestamp
+    last_timestamp: Mapped[dt.datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    point_count: Mapped[int] = mapped_column(Integer, nullable=False, default=1, server_default="1")
+    # 52-bit integer geohash of (lat, lng), see app.geohash; drives /tracking/near
+    geohash: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    # idempotent uploads: "" = none sent, the key falls back to employee_id + timestamp
+    client_point_id: Mapped[str] = mapped_column(String(64), nullable=False, default="", server_default="")
+
+    __table_args__ = (
+        Index("ix_tracking_points_geohash_timestamp", "geohash", "timestamp"),
+        # also serves the per-employee timestamp range scans of the reports
+        Index("uq_tracking_points_point_key", "employee_id", "timestamp", "client_point_id", unique=True),
+    )
+
+class SiteVisit(Base):
+    """One continuous stay of an employee inside a site (enter/exit session)."""
+    __tablename__ = "site_visits"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    employee_id: Mapped[str] = mapped_column(String(32), nullable=False)
+    site_id: Mapped[int] = mapped_column(ForeignKey("sites.id", ondelete="CASCADE"), nullable=False)
+    entered_at: Mapped[dt.datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    exited_at: Mapped[dt.datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)  # NULL = still on site
+    last_seen_at: Mapped[dt.datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    point_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # consecutive fixes outside the exit radius (debounce for GPS jitter)
+    outside_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_site_visits_site_entered", "site_id", "entered_at"),
+        Index("ix_site_visits_employee_exited", "employee_id", "exited_at"),
+        # at most one open visit per employee, whatever the number of workers
+        Index(
+            "uq_site_visits_open", "employee_id", unique=True,
+            postgresql_where=text("exited_at IS NULL"), sqlite_where=text("exited_at IS NULL"),
+        ),
+    )
+
+class AttendanceDaily(Base):
+    """Per-employee, per-site, per-day rollup maintained incrementally on ingest."""
+    __tablename__ = "attendance_daily"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    employee_id: Mapped[str] = mapped_column(String(32), nullable=False)
+    site_id: Mapped[int] = mapped_column(ForeignKey("sites.id", ondelete="CASCADE"), nullable=False)
+    day: Mapped[dt.date] = mapped_column(Date, nullable=False)  # local day (ROLLUP_TZ)
+    first_seen: Mapped[dt.datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    last_seen: Mapped[dt.datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    seconds_on_site: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    ping_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # set when late/out-of-order points arrived; the catch-up job recomputes from raw points
+    needs_recompute: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+
+    __table_args__ = (
+        UniqueConstraint("employee_id", "site_id", "day", name="uq_attendance_daily_employee_site_day"),
+        Index("ix_attendance_daily_day_site", "day", "site_id"),
+    )
+
+
+class LatestPosition(Base):
+    """Newest accepted fix per employee, upserted on ingest (fleet view)."""
+    __tablename__ = "latest_positions"
+    employee_id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    timestamp: Mapped[dt.datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    lat: Mapped[float] = mapped_column(Float, nullable=False)
+    lng: Mapped[float] = mapped_column(Float, nullable=False)
+    accuracy: Mapped[float | None] = mapped_column(Float, nullable=True)
+    site_id: Mapped[int | None] = mapped_column(ForeignKey("sites.id", ondelete="SET NULL"), nullable=True)
+    site_name_ar: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    site_name_en: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    # tracking_points.id of the fix (no FK: the partitioned table's key includes timestamp)
+    point_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+
+    __table_args__ = (Index("ix_latest_positions_site_id", "site_id"),)
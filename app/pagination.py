@@ -0,0 +1,73 @@
+"""
+Opaque keyset (cursor) pagination helpers.
+
+A cursor encodes the sort key of the last row of a page as URL-safe base64 of
+a small JSON array. The next page is fetched with ``WHERE key > cursor``
+against an index on the sort key, so every page costs the same no matter how
+deep the client has paged, unlike ``OFFSET``.
+
+The continuation cursor is returned in the ``X-Next-Cursor`` response header
+so the list-shaped response bodies stay unchanged; the header is absent on
+the last page.
+"""
+
+from __future__ import annotations
+
+import base64
+import datetime as dt
+import json
+from typing import Any, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Response
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps(
+        [v.isoformat() if isinstance(v, dt.datetime) else v for v in values],
+        separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    """Decode a cursor produced by ``encode_cursor``; raise HTTP 400 if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list):
+            raise ValueError
+        return values
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def decode_tracking_cursor(cursor: Optional[str]) -> Optional[Tuple[dt.datetime, int]]:
+    """Return the ``(timestamp, id)`` encoded in a tracking cursor."""
+    if cursor is None:
+        return None
+    values = decode_cursor(cursor)
+    try:
+        timestamp, point_id = values
+        return dt.datetime.fromisoformat(timestamp), int(point_id)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def decode_id_cursor(cursor: Optional[str]) -> Optional[int]:
+    """Return the ``id`` encoded in a single-key cursor."""
+    if cursor is None:
+        return None
+    values = decode_cursor(cursor)
+    try:
+        (row_id,) = values
+        return int(row_id)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def set_next_cursor(response: Response, values: Optional[Sequence[Any]]) -> None:
+    """Attach the continuation cursor for the given last-row key, if any."""
+    if values is not None:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(values)
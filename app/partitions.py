@@ -0,0 +1,247 @@
+"""
+Monthly partition maintenance for ``tracking_points`` (PostgreSQL).
+
+Migration ``0005_partition_tracking_points`` turns the table into monthly
+range partitions on ``timestamp`` named ``tracking_points_pYYYYMM`` plus a
+``tracking_points_default`` catch-all. This module keeps partitions created
+``PARTITION_MONTHS_AHEAD`` months into the future and enforces retention by
+detaching (and optionally dropping) whole expired partitions instead of
+running huge DELETEs::
+
+    python -m app.partitions ensure [--ahead 3]
+    python -m app.partitions retention --keep-months 24 [--detach-only] [--dry-run]
+
+Partition DDL runs under a transaction-level advisory lock, so workers
+booting together and the cron job never race on the same ``CREATE``. If a
+month's rows already landed in the DEFAULT partition (nothing created the
+partition in time), PostgreSQL refuses to create the partition; ``ensure``
+then moves those rows out of DEFAULT into the new partition. That takes an
+exclusive lock on the table, so workers only do it from the CLI: at boot
+(``ensure_partitions_on_boot``) such months are skipped with a warning and
+any failure is logged instead of aborting startup.
+
+Every function is a no-op when the table is not partitioned (e.g. SQLite).
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import logging
+import os
+import re
+from typing import List, Optional
+
+from sqlalchemy import Connection, Engine, text
+
+from .db import engine
+
+logger = logging.getLogger(__name__)
+
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+# 0 keeps every partition forever.
+TRACKING_RETENTION_MONTHS = int(os.getenv("TRACKING_RETENTION_MONTHS", "0"))
+
+PARENT = "tracking_points"
+DEFAULT_PARTITION = f"{PARENT}_default"
+# pg_advisory_xact_lock key serialising partition DDL
+PARTITION_LOCK_KEY = 0x7472616B  # "trak"
+_NAME_RE = re.compile(r"^tracking_points_p(\d{4})(\d{2})$")
+
+
+def add_months(month: dt.date, n: int) -> dt.date:
+    y, m = divmod(month.month - 1 + n, 12)
+    return dt.date(month.year + y, m + 1, 1)
+
+
+def partition_name(month: dt.date) -> str:
+    return f"{PARENT}_p{month:%Y%m}"
+
+
+def is_partitioned(conn: Connection) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    return bool(
+        conn.execute(
+            text(
+                "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+                "WHERE c.relname = :name AND pg_table_is_visible(c.oid)"
+            ),
+            {"name": PARENT},
+        ).scalar()
+    )
+
+
+def monthly_partitions(conn: Connection) -> List[dt.date]:
+    """Return the first day of every month that has an attached partition."""
+    names = conn.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :name AND pg_table_is_visible(p.oid)"
+        ),
+        {"name": PARENT},
+    ).scalars()
+    months = []
+    for name in names:
+        match = _NAME_RE.match(name)
+        if match:
+            months.append(dt.date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def _lock(conn: Connection, wait: bool) -> bool:
+    """Take the partition DDL lock for the rest of the transaction."""
+    if wait:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": PARTITION_LOCK_KEY})
+        return True
+    return bool(conn.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": PARTITION_LOCK_KEY}).scalar())
+
+
+def _bounds(month: dt.date) -> str:
+    return f"FROM ('{month:%Y-%m-%d} 00:00:00+00') TO ('{add_months(month, 1):%Y-%m-%d} 00:00:00+00')"
+
+
+def _default_has_rows(conn: Connection, month: dt.date) -> bool:
+    if conn.execute(text("SELECT to_regclass(:name)"), {"name": DEFAULT_PARTITION}).scalar() is None:
+        return False
+    return (
+        conn.execute(
+            text(f'SELECT 1 FROM {DEFAULT_PARTITION} WHERE "timestamp" >= :lo AND "timestamp" < :hi LIMIT 1'),
+            {"lo": dt.datetime(month.year, month.month, 1, tzinfo=dt.timezone.utc),
+             "hi": dt.datetime.combine(add_months(month, 1), dt.time.min, tzinfo=dt.timezone.utc)},
+        ).first()
+        is not None
+    )
+
+
+def _create_from_default(conn: Connection, month: dt.date) -> None:
+    """Create ``month``'s partition and move its rows out of DEFAULT."""
+    name = partition_name(month)
+    lo = f"{month:%Y-%m-%d} 00:00:00+00"
+    hi = f"{add_months(month, 1):%Y-%m-%d} 00:00:00+00"
+    conn.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {DEFAULT_PARTITION}"))
+    conn.execute(text(f"CREATE TABLE {name} PARTITION OF {PARENT} FOR VALUES {_bounds(month)}"))
+    conn.execute(
+        text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+            f"""WHERE "timestamp" >= '{lo}' AND "timestamp" < '{hi}' RETURNING *) """
+            f"INSERT INTO {name} SELECT * FROM moved"
+        )
+    )
+    conn.execute(text(f"ALTER TABLE {PARENT} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+
+
+def ensure_partitions(
+    conn: Connection,
+    months_ahead: int = PARTITION_MONTHS_AHEAD,
+    today: Optional[dt.date] = None,
+    move_default: bool = True,
+    wait: bool = True,
+) -> List[str]:
+    """
+    Create missing partitions from this month up to ``months_ahead`` months ahead.
+
+    Months with rows in DEFAULT are moved out of it when ``move_default`` is
+    set and skipped otherwise. With ``wait=False`` nothing is done if another
+    connection holds the partition lock.
+    """
+    if not is_partitioned(conn) or not _lock(conn, wait):
+        return []
+    today = today or dt.datetime.utcnow().date()
+    existing = set(monthly_partitions(conn))
+    created = []
+    month = today.replace(day=1)
+    for _ in range(months_ahead + 1):
+        if month not in existing:
+            if not _default_has_rows(conn, month):
+                conn.execute(
+                    text(f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {PARENT} FOR VALUES {_bounds(month)}")
+                )
+                created.append(partition_name(month))
+            elif move_default:
+                _create_from_default(conn, month)
+                created.append(partition_name(month))
+            else:
+                logger.warning(
+                    "rows for %s are in %s; run `python -m app.partitions ensure` to create %s",
+                    f"{month:%Y-%m}", DEFAULT_PARTITION, partition_name(month),
+                )
+        month = add_months(month, 1)
+    if created:
+        logger.info("created tracking_points partitions: %s", ", ".join(created))
+    return created
+
+
+def ensure_partitions_on_boot(engine: Engine) -> List[str]:
+    """
+    ``ensure_partitions`` for worker startup: never blocks on another worker,
+    never moves DEFAULT rows, and logs instead of raising.
+    """
+    try:
+        with engine.begin() as conn:
+            return ensure_partitions(conn, move_default=False, wait=False)
+    except Exception:  # noqa: BLE001 - partitions are also kept by the cron job
+        logger.exception("could not create upcoming tracking_points partitions")
+        return []
+
+
+def expired_partitions(conn: Connection, keep_months: int, today: Optional[dt.date] = None) -> List[str]:
+    """Partitions whose whole month lies before the retention window."""
+    if keep_months <= 0 or not is_partitioned(conn):
+        return []
+    today = today or dt.datetime.utcnow().date()
+    cutoff = add_months(today.replace(day=1), -keep_months)
+    return [partition_name(m) for m in monthly_partitions(conn) if add_months(m, 1) <= cutoff]
+
+
+def apply_retention(
+    conn: Connection,
+    keep_months: int = TRACKING_RETENTION_MONTHS,
+    drop: bool = True,
+    today: Optional[dt.date] = None,
+) -> List[str]:
+    """
+    Detach expired partitions and, unless ``drop`` is False, drop them.
+
+    Detached tables keep their data and can be archived before a manual DROP.
+    """
+    expired = expired_partitions(conn, keep_months, today)
+    for name in expired:
+        conn.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {name}"))
+        if drop:
+            conn.execute(text(f"DROP TABLE {name}"))
+    if expired:
+        logger.info(
+            "%s expired tracking_points partitions: %s",
+            "dropped" if drop else "detached",
+            ", ".join(expired),
+        )
+    return expired
+
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Maintain tracking_points partitions")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_ensure = sub.add_parser("ensure", help="create upcoming monthly partitions")
+    p_ensure.add_argument("--ahead", type=int, default=PARTITION_MONTHS_AHEAD)
+    p_ret = sub.add_parser("retention", help="detach/drop partitions older than the retention window")
+    p_ret.add_argument("--keep-months", type=int, default=TRACKING_RETENTION_MONTHS)
+    p_ret.add_argument("--detach-only", action="store_true")
+    p_ret.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+
+    with engine.begin() as conn:
+        if args.command == "ensure":
+            created = ensure_partitions(conn, args.ahead)
+            print("created: " + (", ".join(created) or "nothing"))
+        elif args.dry_run:
+            print("would expire: " + (", ".join(expired_partitions(conn, args.keep_months)) or "nothing"))
+        else:
+            expired = apply_retention(conn, args.keep_months, drop=not args.detach_only)
+            print("expired: " + (", ".join(expired) or "nothing"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Opt-in SQLAlchemy query profiler (``DB_PROFILING_ENABLED=1``).
+
+``install`` hooks ``before_cursor_execute`` / ``after_cursor_execute`` on an
+engine and ``QueryProfilerMiddleware`` opens a per-request ``QueryStats``
+in a context variable, so every statement executed on behalf of a request
+(threadpool sync endpoints and async endpoints alike) is counted and timed.
+Each response then carries::
+
+    X-DB-Query-Count: 3
+    X-DB-Time-Ms: 4.21
+
+and one log line per request records the same fields. Requests issuing more
+than ``DB_QUERY_COUNT_WARN`` statements are logged as warnings together with
+their most repeated statements (typical N+1 or refresh-after-write round
+trips). Statements slower than ``DB_SLOW_QUERY_MS`` are logged without
+their parameters (they carry employee ids, positions and password hashes);
+only ``DB_PROFILING_DEBUG=1`` adds the parameters and the EXPLAIN plan.
+
+For streaming responses the headers cover the queries run before the body
+started; the log line covers the whole request.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import logging
+import os
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+DB_PROFILING_ENABLED = os.getenv("DB_PROFILING_ENABLED", "0") == "1"
+DB_PROFILING_DEBUG = os.getenv("DB_PROFILING_DEBUG", "0") == "1"
+DB_QUERY_COUNT_WARN = int(os.getenv("DB_QUERY_COUNT_WARN", "20"))
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "100"))
+
+QUERY_COUNT_HEADER = "X-DB-Query-Count"
+QUERY_TIME_HEADER = "X-DB-Time-Ms"
+
+_EXPLAINABLE = ("select", "insert", "update", "delete", "with")
+_START_KEY = "query_profiler_start"
+_EXPLAINING_KEY = "query_profiler_explaining"
+
+
+@dataclass
+class QueryStats:
+    count: int = 0
+    seconds: float = 0.0
+    statements: Counter = field(default_factory=Counter)
+
+    @property
+    def ms(self) -> float:
+        return self.seconds * 1000.0
+
+
+_current: contextvars.ContextVar[Optional[QueryStats]] = contextvars.ContextVar("query_stats", default=None)
+
+
+def current_stats() -> Optional[QueryStats]:
+    return _current.get()
+
+
+def _before(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault(_START_KEY, []).append(time.perf_counter())
+
+
+def _after(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get(_START_KEY)
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    if conn.info.get(_EXPLAINING_KEY):
+        return
+    stats = _current.get()
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += elapsed
+        stats.statements[statement] += 1
+    if elapsed * 1000.0 >= DB_SLOW_QUERY_MS:
+        if not DB_PROFILING_DEBUG:
+            logger.warning("slow query %.1f ms: %s", elapsed * 1000.0, statement)
+            return
+        logger.warning("slow query %.1f ms: %s params=%r", elapsed * 1000.0, statement, parameters)
+        if not executemany:
+            _log_plan(conn, statement, parameters)
+
+
+def _log_plan(conn, statement: str, parameters) -> None:
+    if not statement.lstrip().lower().startswith(_EXPLAINABLE):
+        return
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    conn.info[_EXPLAINING_KEY] = True
+    try:
+        rows = conn.exec_driver_sql(prefix + statement, parameters).fetchall()
+        if rows:
+            logger.warning("plan:\n%s", "\n".join(" | ".join(str(v) for v in row) for row in rows))
+    except Exception:  # noqa: BLE001 - profiling must never break the request
+        logger.debug("could not EXPLAIN statement", exc_info=True)
+    finally:
+        conn.info[_EXPLAINING_KEY] = False
+
+
+def install(engine: Engine) -> None:
+    """Attach the cursor timing hooks to ``engine`` (idempotent)."""
+    if not event.contains(engine, "before_cursor_execute", _before):
+        event.listen(engine, "before_cursor_execute", _before)
+        event.listen(engine, "after_cursor_execute", _after)
+
+
+class QueryProfilerMiddleware:
+    """ASGI middleware giving each request its own ``QueryStats``."""
+
+    def __init__(self, app, warn_count: int = DB_QUERY_COUNT_WARN):
+        self.app = app
+        self.warn_count = warn_count
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = QueryStats()
+        token = _current.set(stats)
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((QUERY_COUNT_HEADER.lower().encode(), str(stats.count).encode()))
+                headers.append((QUERY_TIME_HEADER.lower().encode(), f"{stats.ms:.2f}".encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            _current.reset(token)
+            self._report(scope, stats)
+
+    def _report(self, scope, stats: QueryStats) -> None:
+        fields = {"method": scope["method"], "path": scope["path"], "db_queries": stats.count, "db_ms": round(stats.ms, 2)}
+        if stats.count > self.warn_count:
+            repeated = "; ".join(f"{n}x {stmt[:120]}" for stmt, n in stats.statements.most_common(3))
+            logger.warning(
+                "%s %s ran %d queries (%.1f ms, threshold %d); most repeated: %s",
+                scope["method"], scope["path"], stats.count, stats.ms, self.warn_count, repeated,
+                extra=fields,
+            )
+        else:
+            logger.info("%s %s: %d queries, %.1f ms", scope["method"], scope["path"], stats.count, stats.ms, extra=fields)
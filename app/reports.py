@@ -0,0 +1,164 @@
+"""
+Tracking report queries and serialisers.
+
+The report endpoint can either return a JSON array (bounded by ``limit``) or
+stream every matching row as NDJSON or CSV. Streaming reads from a server-side
+cursor on the async engine in ``REPORT_STREAM_CHUNK`` sized partitions and writes each partition
+as soon as it arrives, so memory use stays flat regardless of the date range.
+Rows are encoded with orjson straight from the column tuples (see
+``app.serialization`` for the bounded JSON variant).
+
+``employees_near`` answers "who was within X m of this spot between t1 and
+t2": candidates come from the geohash ranges covering the circle (see
+``app.geohash``) and are refined exactly with ``haversine_m``.
+"""
+
+from __future__ import annotations
+
+import csv
+import datetime as dt
+import io
+import os
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+import orjson
+from sqlalchemy import Select, and_, null, or_, select
+from sqlalchemy.orm import Session
+
+from . import geohash
+from .db import AsyncSessionLocal
+from .geofence import haversine_m
+from .models import TrackingPoint
+from .schemas import TrackingPointRead
+
+REPORT_STREAM_CHUNK = int(os.getenv("REPORT_STREAM_CHUNK", "1000"))
+
+REPORT_COLUMNS = (
+    "id",
+    "employee_id",
+    "timestamp",
+    "lat",
+    "lng",
+    "accuracy",
+    "site_id",
+    "site_name_ar",
+    "site_name_en",
+    "last_timestamp",
+    "point_count",
+)
+
+# JSON report: TrackingPointRead's fields in its order (created_at has no column)
+REPORT_JSON_COLUMNS = tuple(TrackingPointRead.model_fields)
+
+STREAM_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def after_key(after: Tuple[dt.datetime, int]):
+    """
+    Keyset condition ``(timestamp, id) > after``.
+
+    Spelled as a timestamp range plus a tie-break so the planner can seek
+    ``uq_tracking_points_point_key`` (employee_id, timestamp, ...) directly.
+    """
+    timestamp, point_id = after
+    return and_(
+        TrackingPoint.timestamp >= timestamp,
+        or_(TrackingPoint.timestamp > timestamp, TrackingPoint.id > point_id),
+    )
+
+
+def report_select(
+    employee_id: str,
+    start_dt: dt.datetime,
+    end_dt: dt.datetime,
+    after: Optional[Tuple[dt.datetime, int]] = None,
+    columns: Sequence[str] = REPORT_COLUMNS,
+) -> Select:
+    """Column-only select of one employee's points in ``[start_dt, end_dt]``."""
+    stmt = (
+        select(*(getattr(TrackingPoint, c) if hasattr(TrackingPoint, c) else null().label(c) for c in columns))
+        .where(TrackingPoint.employee_id == employee_id)
+        .where(TrackingPoint.timestamp >= start_dt)
+        .where(TrackingPoint.timestamp <= end_dt)
+        .order_by(TrackingPoint.timestamp.asc(), TrackingPoint.id.asc())
+    )
+    if after is not None:
+        stmt = stmt.where(after_key(after))
+    return stmt
+
+
+def _ndjson_chunk(rows) -> bytes:
+    return b"".join(orjson.dumps(dict(zip(REPORT_COLUMNS, row))) + b"\n" for row in rows)
+
+
+def _csv_chunk(rows) -> bytes:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+        writer.writerow(v.isoformat() if isinstance(v, dt.datetime) else v for v in row)
+    return buf.getvalue().encode("utf-8")
+
+
+async def stream_report(stmt: Select, fmt: str) -> AsyncIterator[bytes]:
+    """
+    Yield the rows of ``stmt`` serialised as NDJSON or CSV.
+
+    Opens its own session because the response body is produced after the
+    request's session dependency has already been closed.
+    """
+    encode = _csv_chunk if fmt == "csv" else _ndjson_chunk
+    async with AsyncSessionLocal() as db:
+        if fmt == "csv":
+            yield (",".join(REPORT_COLUMNS) + "\n").encode("utf-8")
+        result = await db.stream(stmt.execution_options(yield_per=REPORT_STREAM_CHUNK))
+        async for rows in result.partitions():
+            yield encode(rows)
+
+
+def employees_near(
+    db: Session,
+    lat: float,
+    lng: float,
+    radius_m: float,
+    start_dt: dt.datetime,
+    end_dt: dt.datetime,
+) -> List[Dict]:
+    """Employees with fixes within ``radius_m`` of (lat, lng) in ``[start_dt, end_dt]``, closest first."""
+    ranges = geohash.cover_ranges(lat, lng, radius_m)
+    stmt = (
+        select(
+            TrackingPoint.employee_id,
+            TrackingPoint.timestamp,
+            TrackingPoint.last_timestamp,
+            TrackingPoint.lat,
+            TrackingPoint.lng,
+            TrackingPoint.point_count,
+        )
+        .where(or_(*(TrackingPoint.geohash.between(lo, hi) for lo, hi in ranges)))
+        .where(TrackingPoint.timestamp >= start_dt)
+        .where(TrackingPoint.timestamp <= end_dt)
+    )
+    found: Dict[str, Dict] = {}
+    for r in db.execute(stmt.execution_options(yield_per=REPORT_STREAM_CHUNK)):
+        distance = haversine_m(lat, lng, r.lat, r.lng)
+        if distance > radius_m:
+            continue
+        last_seen = r.last_timestamp or r.timestamp
+        employee = found.get(r.employee_id)
+        if employee is None:
+            found[r.employee_id] = {
+                "employee_id": r.employee_id,
+                "first_seen": r.timestamp,
+                "last_seen": last_seen,
+                "point_count": r.point_count,
+                "closest_m": distance,
+            }
+            continue
+        employee["first_seen"] = min(employee["first_seen"], r.timestamp)
+        employee["last_seen"] = max(employee["last_seen"], last_seen)
+        employee["point_count"] += r.point_count
+        employee["closest_m"] = min(employee["closest_m"], distance)
+    return sorted(found.values(), key=lambda e: (e["closest_m"], e["employee_id"]))
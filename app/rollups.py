@@ -0,0 +1,268 @@
+"""
+Daily attendance rollups (per employee, per site, per local day).
+
+``apply_points`` folds each accepted batch of tracking points into
+``attendance_daily`` in the same transaction as the raw insert: first/last
+seen, ping count and time on site, where time on site is the sum of the gaps
+between consecutive pings at that site capped at ``ROLLUP_MAX_GAP_S``.
+
+Rows written by ingest compaction (``app.compaction``) cover a stationary run
+from ``timestamp`` to ``last_timestamp``; recomputing from the raw table
+counts that whole span as time on site.
+
+Points that arrive out of order (offline uploads older than the row's
+``last_seen``) can't be folded in exactly, so the row is flagged
+``needs_recompute`` and fixed from the raw points by the catch-up job::
+
+    python -m app.rollups catch-up
+    python -m app.rollups rebuild --since 2026-01-01 [--until 2026-01-31]
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import os
+from dataclasses import dataclass
+from itertools import groupby
+from typing import Dict, Iterable, List, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from sqlalchemy import case, delete, select, true
+from sqlalchemy.orm import Session
+
+from .db import SessionLocal, dialect_insert
+from .ingest import Row, as_utc
+from .models import AttendanceDaily, TrackingPoint
+
+ATTENDANCE_ROLLUP_ENABLED = os.getenv("ATTENDANCE_ROLLUP_ENABLED", "1") == "1"
+ROLLUP_MAX_GAP_S = float(os.getenv("ROLLUP_MAX_GAP_S", "300"))
+try:
+    ROLLUP_TZ = ZoneInfo(os.getenv("ROLLUP_TZ", os.getenv("TZ", "UTC")))
+except ZoneInfoNotFoundError:
+    ROLLUP_TZ = ZoneInfo("UTC")
+
+Key = Tuple[str, int, dt.date]
+# (first fix, last fix, number of fixes) of one stored row; a raw point is (ts, ts, 1)
+Span = Tuple[dt.datetime, dt.datetime, int]
+
+
+def local_day(ts: dt.datetime) -> dt.date:
+    return as_utc(ts).astimezone(ROLLUP_TZ).date()
+
+
+def day_bounds(day: dt.date) -> Tuple[dt.datetime, dt.datetime]:
+    """Return the UTC ``[start, end)`` instants of a local day."""
+    start = dt.datetime.combine(day, dt.time.min, tzinfo=ROLLUP_TZ)
+    end = dt.datetime.combine(day + dt.timedelta(days=1), dt.time.min, tzinfo=ROLLUP_TZ)
+    return start.astimezone(dt.timezone.utc), end.astimezone(dt.timezone.utc)
+
+
+def _gap_seconds(earlier: dt.datetime, later: dt.datetime) -> int:
+    return int(max(min((later - earlier).total_seconds(), ROLLUP_MAX_GAP_S), 0))
+
+
+@dataclass
+class _Stats:
+    first: dt.datetime
+    last: dt.datetime
+    count: int
+    seconds: int
+
+    @classmethod
+    def of(cls, spans: List[Span]) -> "_Stats":
+        """Summarise spans that are already sorted by their first fix."""
+        seconds = sum(int((last - first).total_seconds()) for first, last, _ in spans)
+        seconds += sum(_gap_seconds(a[1], b[0]) for a, b in zip(spans, spans[1:]))
+        return cls(
+            first=spans[0][0],
+            last=max(last for _, last, _ in spans),
+            count=sum(count for _, _, count in spans),
+            seconds=seconds,
+        )
+
+    def values(self, key: Key) -> Row:
+        employee_id, site_id, day = key
+        return {
+            "employee_id": employee_id,
+            "site_id": site_id,
+            "day": day,
+            "first_seen": self.first,
+            "last_seen": self.last,
+            "seconds_on_site": self.seconds,
+            "ping_count": self.count,
+            "needs_recompute": False,
+        }
+
+
+def _span(timestamp: dt.datetime, last_timestamp: dt.datetime | None, count: int | None) -> Span:
+    first = as_utc(timestamp)
+    return first, as_utc(last_timestamp) if last_timestamp is not None else first, count or 1
+
+
+def _group(rows: Iterable[Row]) -> Dict[Key, List[Span]]:
+    groups: Dict[Key, List[Span]] = {}
+    for row in rows:
+        if row["site_id"] is None:
+            continue
+        span = _span(row["timestamp"], row.get("last_timestamp"), row.get("point_count"))
+        groups.setdefault((row["employee_id"], row["site_id"], local_day(span[0])), []).append(span)
+    for spans in groups.values():
+        spans.sort()
+    return groups
+
+
+def apply_points(db: Session, rows: List[Row]) -> None:
+    """Fold freshly inserted points into their daily rollups; caller commits."""
+    if not ATTENDANCE_ROLLUP_ENABLED:
+        return
+    groups = _group(rows)
+    if not groups:
+        return
+    existing = {
+        (r.employee_id, r.site_id, r.day): r
+        for r in db.scalars(
+            select(AttendanceDaily)
+            .where(AttendanceDaily.employee_id.in_({k[0] for k in groups}))
+            .where(AttendanceDaily.day.in_({k[2] for k in groups}))
+        )
+    }
+    new_rows: List[Row] = []
+    for key, spans in groups.items():
+        stats = _Stats.of(spans)
+        rollup = existing.get(key)
+        if rollup is None:
+            new_rows.append(stats.values(key))
+            continue
+        last_seen = as_utc(rollup.last_seen)
+        if stats.first >= last_seen:
+            rollup.seconds_on_site += _gap_seconds(last_seen, stats.first) + stats.seconds
+        else:
+            rollup.seconds_on_site += stats.seconds
+            rollup.needs_recompute = True
+        rollup.first_seen = min(as_utc(rollup.first_seen), stats.first)
+        rollup.last_seen = max(last_seen, stats.last)
+        rollup.ping_count += stats.count
+
+    if new_rows:
+        # Another worker may have created the same row since we looked: merge
+        # the counts and let the catch-up job settle the exact time on site.
+        table = AttendanceDaily.__table__
+        stmt = dialect_insert(db, table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.employee_id, table.c.site_id, table.c.day],
+            set_={
+                "ping_count": table.c.ping_count + stmt.excluded.ping_count,
+                "seconds_on_site": table.c.seconds_on_site + stmt.excluded.seconds_on_site,
+                "first_seen": case(
+                    (stmt.excluded.first_seen < table.c.first_seen, stmt.excluded.first_seen),
+                    else_=table.c.first_seen,
+                ),
+                "last_seen": case(
+                    (stmt.excluded.last_seen > table.c.last_seen, stmt.excluded.last_seen),
+                    else_=table.c.last_seen,
+                ),
+                "needs_recompute": true(),
+            },
+        )
+        db.execute(stmt, new_rows)
+
+
+def recompute(db: Session, rollup: AttendanceDaily) -> None:
+    """Recompute one rollup row exactly from the raw tracking points."""
+    start, end = day_bounds(rollup.day)
+    spans = [
+        _span(*r)
+        for r in db.execute(
+            select(TrackingPoint.timestamp, TrackingPoint.last_timestamp, TrackingPoint.point_count)
+            .where(TrackingPoint.employee_id == rollup.employee_id)
+            .where(TrackingPoint.site_id == rollup.site_id)
+            .where(TrackingPoint.timestamp >= start)
+            .where(TrackingPoint.timestamp < end)
+            .order_by(TrackingPoint.timestamp.asc())
+        )
+    ]
+    if not spans:
+        db.delete(rollup)
+        return
+    for field, value in _Stats.of(spans).values((rollup.employee_id, rollup.site_id, rollup.day)).items():
+        setattr(rollup, field, value)
+
+
+def catch_up(db: Session, batch_size: int = 500) -> int:
+    """Recompute every rollup flagged ``needs_recompute``; return how many."""
+    done = 0
+    while True:
+        dirty = list(
+            db.scalars(
+                select(AttendanceDaily)
+                .where(AttendanceDaily.needs_recompute.is_(True))
+                .limit(batch_size)
+            )
+        )
+        if not dirty:
+            return done
+        for rollup in dirty:
+            recompute(db, rollup)
+        db.commit()
+        done += len(dirty)
+
+
+def rebuild(db: Session, since: dt.date, until: dt.date) -> int:
+    """Replace all rollups for local days ``since..until`` from the raw points."""
+    start, _ = day_bounds(since)
+    _, end = day_bounds(until)
+    db.execute(
+        delete(AttendanceDaily)
+        .where(AttendanceDaily.day >= since)
+        .where(AttendanceDaily.day <= until)
+    )
+    result = db.execute(
+        select(
+            TrackingPoint.employee_id,
+            TrackingPoint.site_id,
+            TrackingPoint.timestamp,
+            TrackingPoint.last_timestamp,
+            TrackingPoint.point_count,
+        )
+        .where(TrackingPoint.site_id.is_not(None))
+        .where(TrackingPoint.timestamp >= start)
+        .where(TrackingPoint.timestamp < end)
+        .order_by(TrackingPoint.employee_id, TrackingPoint.site_id, TrackingPoint.timestamp)
+        .execution_options(yield_per=5000)
+    )
+    values: List[Row] = []
+    keyed = (
+        (r.employee_id, r.site_id, local_day(r.timestamp), _span(r.timestamp, r.last_timestamp, r.point_count))
+        for r in result
+    )
+    for key, group in groupby(keyed, key=lambda k: k[:3]):
+        values.append(_Stats.of([k[3] for k in group]).values(key))
+    if values:
+        db.execute(dialect_insert(db, AttendanceDaily.__table__), values)
+    db.commit()
+    return len(values)
+
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Maintain attendance_daily rollups")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("catch-up", help="recompute rollups flagged by late uploads")
+    p_rebuild = sub.add_parser("rebuild", help="rebuild rollups for a range of local days")
+    p_rebuild.add_argument("--since", type=dt.date.fromisoformat, required=True)
+    p_rebuild.add_argument("--until", type=dt.date.fromisoformat, default=None)
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        if args.command == "catch-up":
+            print(f"recomputed {catch_up(db)} rollups")
+        else:
+            until = args.until or local_day(dt.datetime.now(dt.timezone.utc))
+            print(f"rebuilt {rebuild(db, args.since, until)} rollups")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
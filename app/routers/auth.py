@@ -1,18 +1,63 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import update
 from sqlalchemy.orm import Session
-from ..db import get_db
+from ..db import get_db, SessionLocal
 from ..models import User
 from ..schemas import Token, LoginRequest
-from ..auth import verify_password, create_access_token, create_refresh_token
+from ..auth import (
+    PasswordHasherBusy,
+    verify_password_async,
+    create_access_token,
+    create_refresh_token,
+)
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
 
+
+def _find_user(db: Session, employee_id: str) -> User | None:
+    return db.query(User).filter_by(employee_id=employee_id).first()
+
+
+def _store_rehash(user_id: int, old_hash: str, new_hash: str) -> None:
+    """Persist an upgraded password hash, unless the password changed meanwhile."""
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(User)
+            .where(User.id == user_id, User.password_hash == old_hash)
+            .values(password_hash=new_hash)
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
 @router.post("/login", response_model=Token)
-def login(data: LoginRequest, db: Session = Depends(get_db)):
-    user: User | None = db.query(User).filter_by(employee_id=data.employee_id).first()
-    if not user or not verify_password(data.password, user.password_hash):
+async def login(
+    data: LoginRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+):
+    # bcrypt يشتغل في process pool مستقل عشان ما يحجز threadpool حق /tracking
+    user: User | None = await run_in_threadpool(_find_user, db, data.employee_id)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    try:
+        valid, new_hash = await verify_password_async(data.password, user.password_hash)
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=503,
+            detail="Login is busy, retry shortly",
+            headers={"Retry-After": "2"},
+        )
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    if new_hash:
+        background_tasks.add_task(_store_rehash, user.id, user.password_hash, new_hash)
 
-    access = create_access_token({"user_id": user.id, "role": user.role.value})
+    access = create_access_token(
+        {"user_id": user.id, "employee_id": user.employee_id, "role": user.role.value}
+    )
     refresh = create_refresh_token({"user_id": user.id})
     return Token(access_token=access, refresh_token=refresh)
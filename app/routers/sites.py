@@ -8,30 +8,57 @@ can list and view details, and employees have no access by default.
 
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends, HTTPException, Path
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Path, Query, Response
 from sqlalchemy.orm import Session
 
 from ..db import get_db
 from ..models import Site, UserRole
 from ..schemas import SiteCreate, SiteRead, SiteUpdate
 from ..dependencies import require_roles
+from ..geofence import site_index
+from ..site_cache import site_snapshots
+from ..pagination import decode_id_cursor, set_next_cursor
+from ..serialization import Shape, rows_response
 
 
 router = APIRouter(prefix="/sites", tags=["Sites"])
 
+# SiteRead fields, selected as plain columns for the list endpoint
+SITE_LIST_COLUMNS = tuple(SiteRead.model_fields)
+
 
 @router.get("", response_model=list[SiteRead])
 def list_sites(
+    response: Response,
+    limit: int | None = Query(None, ge=1, le=1000, description="Page size; omit for all sites"),
+    cursor: str | None = Query(None, description="X-Next-Cursor value from the previous page"),
+    shape: Shape = Query("rows", description="rows (objects) or columns (one array per field)"),
     db: Session = Depends(get_db),
     user=Depends(require_roles(UserRole.admin, UserRole.manager)),
 ):
-    """Return a list of all sites. Accessible to admins and managers."""
-    return db.query(Site).all()
+    """
+    Return sites ordered by id. Accessible to admins and managers.
+
+    With ``limit`` the result is paged by id; the next page's cursor is
+    returned in the ``X-Next-Cursor`` header.
+    """
+    q = db.query(*(getattr(Site, c) for c in SITE_LIST_COLUMNS)).order_by(Site.id.asc())
+    after_id = decode_id_cursor(cursor)
+    if after_id is not None:
+        q = q.filter(Site.id > after_id)
+    if limit is not None:
+        q = q.limit(limit + 1)
+    sites = q.all()
+    if limit is not None and len(sites) > limit:
+        sites = sites[:limit]
+        set_next_cursor(response, (sites[-1].id,))
+    return rows_response(SITE_LIST_COLUMNS, sites, shape, response=response)
 
 
 @router.post("", response_model=SiteRead)
 def create_site(
     site_in: SiteCreate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     user=Depends(require_roles(UserRole.admin)),
 ) -> Site:
@@ -45,12 +72,16 @@ def create_site(
        lat=site_in.lat,
        lng=site_in.lng,
        radius_m=site_in.radius_m,
+       polygon=[list(v) for v in site_in.polygon] if site_in.polygon else None,
        is_active=True,
     )
     
     db.add(site)
     db.commit()
     db.refresh(site)
+    site_index.upsert(site)
+    # النشر لباقي العمال بعد إرسال الرد: تعطل Redis ما يأخر الكتابة
+    background_tasks.add_task(site_snapshots.publish)
     return site
 
 
@@ -71,6 +102,7 @@ def read_site(
 def update_site(
     site_id: int,
     site_in: SiteUpdate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     user=Depends(require_roles(UserRole.admin)),
 ) -> Site:
@@ -81,16 +113,21 @@ def update_site(
 
     # Update fields if provided
     for field, value in site_in.model_dump(exclude_unset=True).items():
+        if field == "polygon" and value is not None:
+            value = [list(v) for v in value]
         setattr(site, field, value)
 
     db.commit()
     db.refresh(site)
+    site_index.upsert(site)
+    background_tasks.add_task(site_snapshots.publish)
     return site
 
 
 @router.delete("/{site_id}")
 def delete_site(
     site_id: int,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     user=Depends(require_roles(UserRole.admin)),
 ) -> dict[str, str]:
@@ -100,4 +137,6 @@ def delete_site(
         raise HTTPException(status_code=404, detail="Site not found")
     db.delete(site)
     db.commit()
+    site_index.remove(site_id)
+    background_tasks.add_task(site_snapshots.publish)
     return {"detail": "Deleted"}
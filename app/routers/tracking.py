@@ -1,77 +1,378 @@
 # app/routers/tracking.py
 from __future__ import annotations
-import math
 import datetime as dt
-from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Literal
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from ..db import get_db
-from ..models import TrackingPoint, Site, UserRole
-from ..schemas import TrackingPointCreate, TrackingPointRead
+from ..db import get_async_db, get_db
+from ..models import AttendanceDaily, UserRole
+from ..schemas import (
+    TrackingBatchCreate,
+    TrackingBatchItemResult,
+    TrackingBatchResult,
+    TrackingPointCreate,
+    TrackingPointRead,
+    TrackingPointResult,
+    LatestPositionRead,
+    NearbyEmployeeRead,
+    SiteVisitRead,
+    AttendanceSummaryRead,
+)
 from ..dependencies import require_roles, get_current_user
+from ..geofence import haversine_m, site_index  # noqa: F401  (haversine_m re-exported)
+from ..dedup import point_id_select
+from ..ingest import Row, build_rows
+from ..ingest_queue import IngestQueueFull, store_rows, store_rows_async
+from ..latest import LATEST_COLUMNS, latest_positions
+from ..live import LIVE_HEARTBEAT_S, Subscription, TooManySubscribers, live_hub
+from ..geohash import NEAR_MAX_RADIUS_M
+from ..reports import REPORT_JSON_COLUMNS, STREAM_MEDIA_TYPES, employees_near, report_select, stream_report
+from ..serialization import Shape, rows_response
+from ..visits import visits_overlapping
+from ..pagination import decode_tracking_cursor, set_next_cursor
+from ..uploads import PACKED_MEDIA_TYPE, GzipRoute, unpack_points
 
-router = APIRouter(prefix="/tracking", tags=["Tracking"])
+# GzipRoute: يقبل أجسام الطلبات المضغوطة (Content-Encoding: gzip) لكل المسارات
+router = APIRouter(prefix="/tracking", tags=["Tracking"], route_class=GzipRoute)
 
-def haversine_m(lat1, lon1, lat2, lon2):
-    R = 6371000.0
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    a = (math.sin(dlat/2)**2 +
-         math.cos(math.radians(lat1)) *
-         math.cos(math.radians(lat2)) *
-         math.sin(dlon/2)**2)
-    return 2*R*math.asin(math.sqrt(a))
 
-@router.post("", response_model=TrackingPointRead)
-def post_tracking(
+_INGEST_BUSY = HTTPException(
+    status_code=503,
+    detail="Tracking ingestion is busy, retry later",
+    headers={"Retry-After": "1"},
+)
+_INGEST_TIMEOUT = HTTPException(status_code=504, detail="Tracking points were not committed in time")
+
+
+def _store(db: Session, rows: list[Row]) -> list[int] | None:
+    """Persist rows via the configured ingestion mode, mapping back-pressure to 503."""
+    try:
+        ids = store_rows(db, rows)
+    except IngestQueueFull:
+        raise _INGEST_BUSY
+    except TimeoutError:
+        raise _INGEST_TIMEOUT
+    live_hub.publish(rows, ids)
+    return ids
+
+
+async def _store_async(db: AsyncSession, rows: list[Row]) -> list[int] | None:
+    try:
+        ids = await store_rows_async(db, rows)
+    except IngestQueueFull:
+        raise _INGEST_BUSY
+    except TimeoutError:
+        raise _INGEST_TIMEOUT
+    live_hub.publish(rows, ids)
+    return ids
+
+
+@router.post("", response_model=TrackingPointResult)
+async def post_tracking(
     payload: TrackingPointCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user=Depends(get_current_user),
 ):
     # employees can only submit for themselves
     if user.role == UserRole.employee and payload.employee_id != user.employee_id:
         raise HTTPException(status_code=403, detail="Not allowed")
 
-    # auto-detect nearest active site within radius
-    nearest_site = None
-    nearest_dist = None
-    for site in db.query(Site).filter_by(is_active=True).all():
-        d = haversine_m(payload.lat, payload.lng, site.lat, site.lng)
-        if d <= site.radius_m and (nearest_dist is None or d < nearest_dist):
-            nearest_dist, nearest_site = d, site
-
-    tp = TrackingPoint(
-        employee_id=payload.employee_id,
-        timestamp=payload.timestamp or dt.datetime.utcnow(),
-        lat=payload.lat,
-        lng=payload.lng,
-        accuracy=payload.accuracy,
-        site_id=nearest_site.id if nearest_site else None,
-        site_name_ar=nearest_site.name_ar if nearest_site else None,
-        site_name_en=nearest_site.name_en if nearest_site else None,
+    # auto-detect nearest active site within radius (grid index, no table scan)
+    if site_index.is_stale():
+        await db.run_sync(site_index.load)
+    rows = build_rows(
+        [payload.employee_id],
+        [payload.timestamp],
+        [payload.lat],
+        [payload.lng],
+        [payload.accuracy],
+        [payload.client_point_id],
+    )
+    ids = await _store_async(db, rows)
+    if ids is None:
+        # TRACKING_ACK_MODE=enqueue: الصف في الطابور وما له id لسه
+        return JSONResponse(status_code=202, content=jsonable_encoder({**rows[0], "status": "queued"}))
+    status = "accepted"
+    if rows[0].get("duplicate"):
+        # إعادة إرسال لنقطة متخزنة: نرجع نفس الصف بدل ما نخزنه مرة ثانية
+        # (None لو النقطة الأصلية انضمت لصف ثاني بالضغط)
+        ids, status = [await db.scalar(point_id_select(rows[0]))], "duplicate"
+    elif rows[0].get("absorbed"):
+        # الضغط دمج النقطة في صف التوقف الحالي: id هو id ذاك الصف
+        status = "absorbed"
+    return {**rows[0], "id": ids[0], "status": status}
+
+@router.post("/batch", response_model=TrackingBatchResult)
+def post_tracking_batch(
+    payload: TrackingBatchCreate,
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user),
+):
+    """
+    Ingest many buffered points in one request (offline replay).
+
+    Rows are validated one by one and rejected rows are reported with their
+    index instead of failing the whole batch. Accepted rows are site-matched
+    in one vectorised pass and written with a single bulk insert.
+    """
+    results: list[TrackingBatchItemResult] = []
+    accepted: list[tuple[int, TrackingPointCreate]] = []
+    for index, item in enumerate(payload.points):
+        try:
+            point = TrackingPointCreate.model_validate(item)
+        except ValidationError as exc:
+            detail = "; ".join(
+                f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in exc.errors()
+            )
+            results.append(TrackingBatchItemResult(index=index, status="rejected", detail=detail))
+            continue
+        # employees can only submit for themselves
+        if user.role == UserRole.employee and point.employee_id != user.employee_id:
+            results.append(TrackingBatchItemResult(index=index, status="rejected", detail="Not allowed"))
+            continue
+        accepted.append((index, point))
+
+    site_index.ensure_loaded(db)
+    points = [p for _, p in accepted]
+    rows = build_rows(
+        [p.employee_id for p in points],
+        [p.timestamp for p in points],
+        [p.lat for p in points],
+        [p.lng for p in points],
+        [p.accuracy for p in points],
+        [p.client_point_id for p in points],
+    )
+    ids = _store(db, rows) if rows else []
+    return _batch_result(results, [index for index, _ in accepted], rows, ids)
+
+
+def _batch_result(
+    results: list[TrackingBatchItemResult],
+    indices: list[int],
+    rows: list[Row],
+    ids: list[int | None] | None,
+) -> TrackingBatchResult:
+    if ids is None:
+        ids = [None] * len(rows)
+    duplicates = absorbed = 0
+    for index, row, tp_id in zip(indices, rows, ids):
+        status = "duplicate" if row.get("duplicate") else "absorbed" if row.get("absorbed") else "accepted"
+        duplicates += status == "duplicate"
+        absorbed += status == "absorbed"
+        results.append(
+            TrackingBatchItemResult(index=index, status=status, id=tp_id, site_id=row["site_id"])
+        )
+    results.sort(key=lambda r: r.index)
+    return TrackingBatchResult(
+        accepted=len(rows) - duplicates,
+        rejected=len(results) - len(rows),
+        duplicates=duplicates,
+        absorbed=absorbed,
+        results=results,
+    )
+
+
+@router.post(
+    "/batch/packed",
+    response_model=TrackingBatchResult,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {PACKED_MEDIA_TYPE: {"schema": {"type": "string", "format": "binary"}}},
+        }
+    },
+)
+async def post_tracking_batch_packed(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    user=Depends(get_current_user),
+):
+    """
+    Ingest a packed columnar batch (see ``app.uploads``), optionally gzipped.
+
+    The body is decoded straight into column arrays for site matching and the
+    bulk insert. Packed batches are all-or-nothing: a malformed body or an
+    out-of-range coordinate rejects the whole request with 400.
+    """
+    if request.headers.get("Content-Type", "").split(";")[0].strip() != PACKED_MEDIA_TYPE:
+        raise HTTPException(status_code=415, detail=f"Expected {PACKED_MEDIA_TYPE}")
+    packed = unpack_points(await request.body())
+    # employees can only submit for themselves
+    if user.role == UserRole.employee and packed.employee_id != user.employee_id:
+        raise HTTPException(status_code=403, detail="Not allowed")
+
+    if site_index.is_stale():
+        await db.run_sync(site_index.load)
+    rows = build_rows(
+        [packed.employee_id] * len(packed),
+        packed.timestamps,
+        packed.lats,
+        packed.lngs,
+        packed.accuracies,
+        packed.client_point_ids,
     )
-    db.add(tp)
-    db.commit()
-    db.refresh(tp)
-    return tp
+    ids = await _store_async(db, rows)
+    return _batch_result([], list(range(len(rows))), rows, ids)
 
 @router.get("/report", response_model=list[TrackingPointRead])
-def tracking_report(
+async def tracking_report(
+    response: Response,
     employee_id: str = Query(...),
     start_date: dt.date = Query(...),
     end_date: dt.date = Query(...),
     limit: int = Query(1000, ge=1, le=10000),
+    cursor: str | None = Query(None, description="X-Next-Cursor value from the previous page"),
+    format: Literal["json", "ndjson", "csv"] = Query(
+        "json", description="ndjson/csv stream every row in range; limit applies to json only"
+    ),
+    shape: Shape = Query("rows", description="json only: rows (objects) or columns (one array per field)"),
+    db: AsyncSession = Depends(get_async_db),
+    user=Depends(require_roles(UserRole.admin, UserRole.manager)),
+):
+    start_dt = dt.datetime.combine(start_date, dt.time.min, tzinfo=None)
+    end_dt = dt.datetime.combine(end_date, dt.time.max, tzinfo=None)
+    after = decode_tracking_cursor(cursor)
+    if format != "json":
+        return StreamingResponse(
+            stream_report(report_select(employee_id, start_dt, end_dt, after), format),
+            media_type=STREAM_MEDIA_TYPES[format],
+            headers={
+                "Content-Disposition": f'attachment; filename="tracking_{employee_id}_{start_date}_{end_date}.{format}"'
+            },
+        )
+    # one extra row tells us whether another page exists
+    stmt = report_select(employee_id, start_dt, end_dt, after, REPORT_JSON_COLUMNS).limit(limit + 1)
+    points = (await db.execute(stmt)).all()
+    if len(points) > limit:
+        points = points[:limit]
+        set_next_cursor(response, (points[-1].timestamp, points[-1].id))
+    # tuples -> orjson مباشرة بدون pydantic لكل صف
+    return rows_response(REPORT_JSON_COLUMNS, points, shape, response)
+
+
+@router.get("/live")
+async def live_positions(
+    request: Request,
+    site_id: list[int] | None = Query(None, description="Only points matched to these sites"),
+    employee_id: list[str] | None = Query(None, description="Only these employees"),
+    user=Depends(require_roles(UserRole.admin, UserRole.manager)),
+):
+    """
+    Server-Sent Events stream of newly accepted points.
+
+    Each ``positions`` event carries a JSON array with the latest position of
+    every employee that reported since the previous event; a slow client
+    skips intermediate positions. A comment line is sent every
+    ``LIVE_HEARTBEAT_S`` seconds when nothing happens.
+
+    Only points accepted by the worker serving the stream are delivered: with
+    more than one worker a dashboard sees a partial fleet (see ``app.live``).
+    """
+    try:
+        subscription = live_hub.subscribe(Subscription(employee_id, site_id))
+    except TooManySubscribers:
+        raise HTTPException(status_code=503, detail="Too many live subscribers", headers={"Retry-After": "5"})
+
+    async def events():
+        try:
+            yield b"retry: 3000\n\n"
+            while not await request.is_disconnected():
+                batch = await subscription.next_batch(LIVE_HEARTBEAT_S)
+                if batch:
+                    yield b"event: positions\ndata: " + orjson.dumps(batch, option=orjson.OPT_UTC_Z) + b"\n\n"
+                else:
+                    yield b": keep-alive\n\n"
+        finally:
+            live_hub.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/latest", response_model=list[LatestPositionRead])
+def latest(
+    site_id: list[int] | None = Query(None, description="Only employees currently at these sites"),
+    shape: Shape = Query("rows", description="rows (objects) or columns (one array per field)"),
+    db: Session = Depends(get_db),
+    user=Depends(require_roles(UserRole.admin, UserRole.manager)),
+):
+    """Newest known position of every employee (one row each), from memory."""
+    if latest_positions.is_stale():
+        latest_positions.load(db)
+    return rows_response(LATEST_COLUMNS, latest_positions.snapshot(site_id), shape)
+
+
+@router.get("/near", response_model=list[NearbyEmployeeRead])
+def near(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius_m: float = Query(..., gt=0, le=NEAR_MAX_RADIUS_M),
+    start: dt.datetime = Query(...),
+    end: dt.datetime = Query(...),
+    db: Session = Depends(get_db),
+    user=Depends(require_roles(UserRole.admin, UserRole.manager)),
+):
+    """Employees that were within ``radius_m`` of (lat, lng) between ``start`` and ``end``."""
+    if end < start:
+        raise HTTPException(status_code=422, detail="end must not be before start")
+    # المرشحين من فهرس الـ geohash، والتحقق الدقيق بـ haversine
+    return employees_near(db, lat, lng, radius_m, start, end)
+
+
+@router.get("/visits", response_model=list[SiteVisitRead])
+def site_visits(
+    start_date: dt.date = Query(...),
+    end_date: dt.date = Query(...),
+    site_id: int | None = Query(None),
+    employee_id: str | None = Query(None),
     db: Session = Depends(get_db),
     user=Depends(require_roles(UserRole.admin, UserRole.manager)),
 ):
+    """Enter/exit sessions overlapping the date range ("who was on site X today")."""
     start_dt = dt.datetime.combine(start_date, dt.time.min, tzinfo=None)
     end_dt = dt.datetime.combine(end_date, dt.time.max, tzinfo=None)
+    return visits_overlapping(db, start_dt, end_dt, site_id=site_id, employee_id=employee_id)
+
+
+@router.get("/summary", response_model=list[AttendanceSummaryRead])
+def attendance_summary(
+    start_date: dt.date = Query(...),
+    end_date: dt.date = Query(...),
+    employee_id: str | None = Query(None),
+    site_id: int | None = Query(None),
+    db: Session = Depends(get_db),
+    user=Depends(require_roles(UserRole.admin, UserRole.manager)),
+):
+    """Per-employee, per-site, per-day totals read from the attendance rollups only."""
     q = (
-        db.query(TrackingPoint)
-        .filter(TrackingPoint.employee_id == employee_id)
-        .filter(TrackingPoint.timestamp >= start_dt)
-        .filter(TrackingPoint.timestamp <= end_dt)
-        .order_by(TrackingPoint.timestamp.asc())
-        .limit(limit)
+        db.query(AttendanceDaily)
+        .filter(AttendanceDaily.day >= start_date)
+        .filter(AttendanceDaily.day <= end_date)
     )
-    return q.all()
+    if employee_id is not None:
+        q = q.filter(AttendanceDaily.employee_id == employee_id)
+    if site_id is not None:
+        q = q.filter(AttendanceDaily.site_id == site_id)
+    q = q.order_by(AttendanceDaily.day, AttendanceDaily.employee_id, AttendanceDaily.site_id)
+    return [
+        AttendanceSummaryRead(
+            employee_id=r.employee_id,
+            site_id=r.site_id,
+            day=r.day,
+            first_seen=r.first_seen,
+            last_seen=r.last_seen,
+            minutes_on_site=round(r.seconds_on_site / 60.0, 1),
+            ping_count=r.ping_count,
+            needs_recompute=r.needs_recompute,
+        )
+        for r in q.all()
+    ]
@@ -9,9 +9,10 @@ separated where appropriate (e.g. password input vs hashed password output).
 from __future__ import annotations
 
 import datetime as dt
-from typing import Optional
+import os
+from typing import Annotated, Any, Literal, Optional
 
-from pydantic import BaseModel, Field, EmailStr
+from pydantic import AfterValidator, BaseModel, Field, EmailStr
 try:
     # Pydantic v2
     from pydantic import ConfigDict
@@ -20,6 +21,25 @@ except ImportError:
 
 from .models import UserRole
 
+# Maximum number of points accepted by a single POST /tracking/batch.
+TRACKING_BATCH_MAX = int(os.getenv("TRACKING_BATCH_MAX", "1000"))
+# Maximum vertices of a site polygon.
+SITE_POLYGON_MAX_VERTICES = int(os.getenv("SITE_POLYGON_MAX_VERTICES", "2000"))
+
+
+def _check_ring(ring: list[tuple[float, float]]) -> list[tuple[float, float]]:
+    if len(set(ring)) < 3:
+        raise ValueError("polygon needs at least 3 distinct vertices")
+    return ring
+
+
+# [[lat, lng], ...] ring of a polygon site (closing vertex optional)
+Polygon = Annotated[
+    list[tuple[Annotated[float, Field(ge=-90, le=90)], Annotated[float, Field(ge=-180, le=180)]]],
+    Field(min_length=3, max_length=SITE_POLYGON_MAX_VERTICES),
+    AfterValidator(_check_ring),
+]
+
 
 # ========== AUTH ==========
 class LoginRequest(BaseModel):
@@ -68,15 +88,21 @@ class SiteBase(BaseModel):
     lat: float
     lng: float
     radius_m: float = 150.0
+    polygon: Optional[Polygon] = None  # يُستخدم بدل نصف القطر إذا موجود
     is_active: bool = True
     created_at: Optional[dt.datetime] = None  # read-only
 
 
 class SiteCreate(BaseModel):
     name: str
+    name_ar: Optional[str] = None
+    name_en: Optional[str] = None
+    description_ar: Optional[str] = None
+    description_en: Optional[str] = None
     lat: float
     lng: float
     radius_m: float = 150.0
+    polygon: Optional[Polygon] = None
 
 
 class SiteUpdate(BaseModel):
@@ -84,6 +110,7 @@ class SiteUpdate(BaseModel):
     lat: Optional[float] = None
     lng: Optional[float] = None
     radius_m: Optional[float] = None
+    polygon: Optional[Polygon] = None  # null يرجع الموقع لدائرة
     is_active: Optional[bool] = None
 
 
@@ -102,6 +129,9 @@ class TrackingPointBase(BaseModel):
     site_id: Optional[int] = None
     site_name_ar: Optional[str] = None
     site_name_en: Optional[str] = None
+    # ingest compaction: one row can stand for a stationary run of fixes
+    last_timestamp: Optional[dt.datetime] = None
+    point_count: int = 1
     created_at: Optional[dt.datetime] = None  # read-only
 
 
@@ -112,8 +142,90 @@ class TrackingPointCreate(BaseModel):
     lat: float
     lng: float
     accuracy: Optional[float] = None
+    # لإعادة الإرسال الآمن: نفس المعرّف (أو نفس الموظف + التايم ستامب) ما يتخزن مرتين
+    client_point_id: Optional[str] = Field(None, min_length=1, max_length=64)
 
 
 class TrackingPointRead(TrackingPointBase):
     id: int
     model_config = ConfigDict(from_attributes=True)
+
+
+class TrackingPointResult(TrackingPointRead):
+    """
+    ``POST /tracking`` response. ``status`` is ``absorbed`` when compaction
+    folded the point into the stationary run stored as row ``id``, and
+    ``queued`` (HTTP 202, no id yet) with ``TRACKING_ACK_MODE=enqueue``.
+    """
+    id: Optional[int] = None
+    status: Literal["accepted", "duplicate", "absorbed", "queued"] = "accepted"
+
+
+class TrackingBatchCreate(BaseModel):
+    # كل عنصر بنفس شكل TrackingPointCreate؛ التحقق يتم لكل صف على حدة
+    # عشان صف واحد خربان ما يفشل الدفعة كاملة
+    points: list[dict[str, Any]] = Field(
+        ...,
+        min_length=1,
+        max_length=TRACKING_BATCH_MAX,
+        description="Items shaped like TrackingPointCreate, validated per row",
+    )
+
+
+class TrackingBatchItemResult(BaseModel):
+    index: int
+    status: Literal["accepted", "absorbed", "duplicate", "rejected"]
+    id: Optional[int] = None
+    site_id: Optional[int] = None
+    detail: Optional[str] = None
+
+
+class TrackingBatchResult(BaseModel):
+    accepted: int
+    rejected: int
+    duplicates: int = 0  # already stored by an earlier upload
+    absorbed: int = 0  # accepted, but folded into another row by compaction
+    results: list[TrackingBatchItemResult]
+
+
+class LatestPositionRead(BaseModel):
+    employee_id: str
+    timestamp: dt.datetime
+    lat: float
+    lng: float
+    accuracy: Optional[float] = None
+    site_id: Optional[int] = None  # None = not on any site
+    site_name_ar: Optional[str] = None
+    site_name_en: Optional[str] = None
+    point_id: Optional[int] = None
+    model_config = ConfigDict(from_attributes=True)
+
+
+class SiteVisitRead(BaseModel):
+    id: int
+    employee_id: str
+    site_id: int
+    entered_at: dt.datetime
+    exited_at: Optional[dt.datetime] = None  # None = still on site
+    last_seen_at: dt.datetime
+    point_count: int
+    model_config = ConfigDict(from_attributes=True)
+
+
+class NearbyEmployeeRead(BaseModel):
+    employee_id: str
+    first_seen: dt.datetime
+    last_seen: dt.datetime
+    point_count: int  # fixes within the radius (compacted runs count every fix)
+    closest_m: float
+
+
+class AttendanceSummaryRead(BaseModel):
+    employee_id: str
+    site_id: int
+    day: dt.date
+    first_seen: dt.datetime
+    last_seen: dt.datetime
+    minutes_on_site: float
+    ping_count: int
+    needs_recompute: bool = False  # True until late uploads have been folded in
@@ -0,0 +1,47 @@
+"""
+Fast JSON encoding for large read endpoints.
+
+``/tracking/report`` and ``/sites`` select plain column tuples and encode
+them straight to bytes with orjson instead of validating one pydantic model
+per row. Columns are selected in the response model's field order and UTC
+datetimes end in ``Z`` like pydantic's, so the bytes match what the
+``response_model`` would have produced.
+
+``shape=columns`` returns one array per field instead of one object per
+row, e.g. ``{"lat": [...], "lng": [...], ...}``, which is much smaller for
+chart-heavy dashboards because field names are not repeated.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Literal, Optional, Sequence
+
+import orjson
+from fastapi import Response
+
+Shape = Literal["rows", "columns"]
+
+_OPTIONS = orjson.OPT_UTC_Z
+
+
+def encode_rows(columns: Sequence[str], rows: Sequence[Sequence[Any]], shape: Shape = "rows") -> bytes:
+    """Encode ``rows`` (tuples in ``columns`` order) as JSON."""
+    if shape == "columns":
+        values = list(zip(*rows)) if rows else [()] * len(columns)
+        return orjson.dumps({name: list(col) for name, col in zip(columns, values)}, option=_OPTIONS)
+    return orjson.dumps([dict(zip(columns, row)) for row in rows], option=_OPTIONS)
+
+
+def rows_response(
+    columns: Sequence[str],
+    rows: Sequence[Sequence[Any]],
+    shape: Shape = "rows",
+    response: Optional[Response] = None,
+) -> Response:
+    """JSON ``Response`` for ``rows``, keeping headers set on ``response``."""
+    out = Response(content=encode_rows(columns, rows, shape), media_type="application/json")
+    if response is not None:
+        for key, value in response.headers.items():
+            if key not in ("content-length", "content-type"):
+                out.headers[key] = value
+    return out
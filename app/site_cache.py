@@ -0,0 +1,276 @@
+"""
+Versioned site-geometry snapshot shared between workers through Redis.
+
+Every worker keeps its own ``site_index`` in memory. Instead of each one
+re-reading ``sites`` from the database on a timer, the worker that commits a
+site change publishes a new snapshot::
+
+    v = INCR falcom:sites:version
+    SET falcom:sites:snapshot:<v> <json>    (built from the DB after INCR)
+    PUBLISH falcom:sites <v>
+
+A background follower thread in every worker subscribes to the channel and
+rebuilds its index from ``snapshot:<v>`` when a newer version is announced.
+Between messages it polls the version key every ``SITE_CACHE_POLL_S`` seconds
+(to recover from missed messages) and marks the index fresh when nothing
+changed, so the database is only read when the version changes and the
+snapshot for it is missing (first start, expired key, flushed Redis).
+
+Building the snapshot after the INCR means ``snapshot:<v>`` always contains
+every change whose version is ``<= v``. If Redis is unreachable the follower
+stops confirming the index and the regular ``SITE_INDEX_TTL_S`` reload from
+the database takes over.
+
+``REDIS_URL`` unset or ``memory://`` selects an in-process stand-in with the
+same interface, which is enough for a single worker and for tests. Nothing
+is shared through it, so an unchanged version proves nothing about edits
+made in other workers: the follower then never marks the index fresh and
+the ``SITE_INDEX_TTL_S`` reload keeps running (a warning is logged at start).
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Dict, List, Optional
+
+import redis
+from sqlalchemy.orm import Session
+
+from .db import SessionLocal
+from .geofence import SITE_INDEX_TTL_S, PreparedPolygon, SiteGeom, SiteIndex, site_index
+from .models import Site
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "memory://")
+SITE_CACHE_PREFIX = os.getenv("SITE_CACHE_PREFIX", "falcom:sites")
+# How often the follower re-checks the version key when no message arrives.
+SITE_CACHE_POLL_S = float(os.getenv("SITE_CACHE_POLL_S", str(max(SITE_INDEX_TTL_S / 4, 1.0))))
+# Lifetime of each snapshot key; a missing snapshot is rebuilt from the DB.
+SITE_SNAPSHOT_TTL_S = int(os.getenv("SITE_SNAPSHOT_TTL_S", "86400"))
+
+VERSION_KEY = f"{SITE_CACHE_PREFIX}:version"
+CHANNEL = SITE_CACHE_PREFIX
+
+
+def snapshot_key(version: int) -> str:
+    return f"{SITE_CACHE_PREFIX}:snapshot:{version}"
+
+
+def dump_snapshot(geoms: List[SiteGeom]) -> str:
+    return json.dumps(
+        [
+            [g.id, g.lat, g.lng, g.radius_m, g.name_ar, g.name_en, g.polygon.vertices if g.polygon else None]
+            for g in geoms
+        ],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+
+
+def load_snapshot(raw: str) -> List[SiteGeom]:
+    geoms = []
+    for fields in json.loads(raw):
+        # polygons are re-prepared locally; older snapshots have no 7th field
+        vertices = fields[6] if len(fields) > 6 else None
+        geoms.append(SiteGeom(*fields[:6], polygon=PreparedPolygon(vertices) if vertices else None))
+    return geoms
+
+
+def active_geoms(db: Session) -> List[SiteGeom]:
+    return [SiteGeom.from_site(s) for s in db.query(Site).filter_by(is_active=True).all()]
+
+
+class MemoryRedis:
+    """Thread-safe in-process subset of the redis-py client used by this module."""
+
+    def __init__(self) -> None:
+        self._data: Dict[str, str] = {}
+        self._subscribers: List["_MemoryPubSub"] = []
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> Optional[str]:
+        return self._data.get(name)
+
+    def set(self, name: str, value, ex: Optional[int] = None, nx: bool = False) -> bool:
+        with self._lock:
+            if nx and name in self._data:
+                return False
+            self._data[name] = str(value)
+            return True
+
+    def incr(self, name: str) -> int:
+        with self._lock:
+            value = int(self._data.get(name, 0)) + 1
+            self._data[name] = str(value)
+            return value
+
+    def publish(self, channel: str, message) -> int:
+        with self._lock:
+            subscribers = [s for s in self._subscribers if channel in s.channels]
+        for sub in subscribers:
+            sub.messages.put({"type": "message", "channel": channel, "data": str(message)})
+        return len(subscribers)
+
+    def pubsub(self, ignore_subscribe_messages: bool = True) -> "_MemoryPubSub":
+        sub = _MemoryPubSub(self)
+        with self._lock:
+            self._subscribers.append(sub)
+        return sub
+
+    def flushall(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class _MemoryPubSub:
+    def __init__(self, owner: MemoryRedis) -> None:
+        self.owner = owner
+        self.channels: set = set()
+        self.messages: "queue.Queue[dict]" = queue.Queue()
+
+    def subscribe(self, *channels: str) -> None:
+        self.channels.update(channels)
+
+    def get_message(self, timeout: float = 0.0) -> Optional[dict]:
+        try:
+            return self.messages.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self) -> None:
+        with self.owner._lock:
+            if self in self.owner._subscribers:
+                self.owner._subscribers.remove(self)
+
+
+def make_client(url: str = REDIS_URL):
+    if not url or url.startswith("memory://"):
+        return MemoryRedis()
+    return redis.Redis.from_url(url, decode_responses=True, socket_timeout=5)
+
+
+class SiteSnapshotFollower:
+    """Keeps a ``SiteIndex`` in sync with the newest snapshot in Redis."""
+
+    def __init__(self, client, index: SiteIndex = site_index, session_factory=SessionLocal,
+                 poll_s: float = SITE_CACHE_POLL_S, shared: Optional[bool] = None):
+        self.client = client
+        self.index = index
+        self.session_factory = session_factory
+        self.poll_s = poll_s
+        # only a real Redis is seen by every worker
+        self.shared = not isinstance(client, MemoryRedis) if shared is None else shared
+        # newest version applied here (the index's own version resets on DB reloads)
+        self._applied: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._refresh_lock = threading.Lock()
+
+    # ----- writers -----
+    def publish(self, db: Optional[Session] = None) -> Optional[int]:
+        """
+        Announce a committed site change; returns the new version.
+
+        Without ``db`` a session of its own is used, so the call can run as a
+        background task after the request's session is closed.
+        """
+        if db is None:
+            with self.session_factory() as own:
+                return self.publish(own)
+        try:
+            version = self.client.incr(VERSION_KEY)
+            self.client.set(snapshot_key(version), dump_snapshot(active_geoms(db)), ex=SITE_SNAPSHOT_TTL_S)
+            self.client.publish(CHANNEL, version)
+            return version
+        except redis.RedisError:
+            # The change is committed; other workers fall back to the TTL reload.
+            logger.exception("could not publish site snapshot")
+            return None
+
+    # ----- readers -----
+    def refresh(self, version: Optional[int] = None) -> None:
+        """Rebuild the index if ``version`` (default: the current one) is newer."""
+        with self._refresh_lock:
+            if version is None:
+                version = int(self.client.get(VERSION_KEY) or 0)
+            current = self.index.version if self.shared else self._applied
+            if current is not None and version <= current:
+                if self.shared:
+                    self.index.touch()
+                return
+            raw = self.client.get(snapshot_key(version))
+            if raw is not None:
+                geoms = load_snapshot(raw)
+            else:
+                db = self.session_factory()
+                try:
+                    geoms = active_geoms(db)
+                finally:
+                    db.close()
+                self.client.set(snapshot_key(version), dump_snapshot(geoms), ex=SITE_SNAPSHOT_TTL_S, nx=True)
+            self.index.rebuild(geoms, version=version)
+            self._applied = version
+
+    def start(self) -> None:
+        """Load the current snapshot and start following new versions."""
+        if self._thread is not None:
+            return
+        if not self.shared:
+            logger.warning(
+                "REDIS_URL is not set: site changes reach other workers only through the "
+                "%.0fs SITE_INDEX_TTL_S reload; use a real Redis with more than one worker",
+                SITE_INDEX_TTL_S,
+            )
+        try:
+            self.refresh()
+        except redis.RedisError:
+            logger.exception("site snapshot unavailable, using the database")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="site-snapshot-follower", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+
+    def _run(self) -> None:
+        pubsub = None
+        checked_at = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                if pubsub is None:
+                    pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                    pubsub.subscribe(CHANNEL)
+                    # catch up on anything published while we were not subscribed
+                    self.refresh()
+                    checked_at = time.monotonic()
+                message = pubsub.get_message(timeout=min(self.poll_s, 1.0))
+                if message and message.get("type") == "message":
+                    self.refresh(int(message["data"]))
+                    checked_at = time.monotonic()
+                elif time.monotonic() - checked_at >= self.poll_s:
+                    self.refresh()
+                    checked_at = time.monotonic()
+            except Exception:  # noqa: BLE001 - keep following after Redis/DB hiccups
+                logger.exception("site snapshot follower error, retrying")
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:  # noqa: BLE001
+                        pass
+                    pubsub = None
+                self._stop.wait(self.poll_s)
+        if pubsub is not None:
+            pubsub.close()
+
+
+site_snapshots = SiteSnapshotFollower(make_client())
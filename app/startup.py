@@ -0,0 +1,158 @@
+"""
+Worker startup: schema check, warmup and readiness.
+
+``STARTUP_MODE`` controls what a worker does to the database when it boots:
+
+* ``auto`` (default) - if Alembic reports the database at head, skip
+  ``create_all`` and seeding (only a fresh, user-less database is seeded);
+  otherwise behave like ``full``.
+* ``full`` - the historical behaviour: ``create_all`` plus ``seed()``.
+* ``fast`` - trust the migrations and never run DDL or seeding: not even
+  the upcoming ``tracking_points`` partitions, which are then left to the
+  ``python -m app.partitions ensure`` cron job.
+
+``auto`` and ``full`` also create upcoming partitions on boot (see
+``app.partitions.ensure_partitions_on_boot``). Seeding runs under
+``lock_seed`` so workers booting together against an empty database insert
+the initial admin and sites only once.
+
+Warmup (site snapshot, ``WARMUP_CONNECTIONS`` connections in each pool, the
+bcrypt workers) runs in the background after startup, and ``readiness``
+only turns ready once it has finished, which is what ``GET /ready`` reports.
+``GET /health`` stays a plain liveness check.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from pathlib import Path
+from typing import Optional, Set
+
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import Engine, inspect, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+STARTUP_MODE = os.getenv("STARTUP_MODE", "auto")
+# connections opened per pool during warmup (0 = the pool size)
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "0"))
+# pg_advisory_xact_lock key serialising seed() across booting workers
+SEED_LOCK_KEY = 0x73656564  # "seed"
+
+_ROOT = Path(__file__).resolve().parent.parent
+ALEMBIC_INI = os.getenv("ALEMBIC_CONFIG", str(_ROOT / "alembic.ini"))
+
+
+def migration_heads() -> Set[str]:
+    """Head revisions of the migration scripts shipped with the app."""
+    cfg = Config(ALEMBIC_INI)
+    cfg.set_main_option("script_location", str(Path(ALEMBIC_INI).resolve().parent / "alembic"))
+    return set(ScriptDirectory.from_config(cfg).get_heads())
+
+
+def schema_at_head(engine: Engine) -> bool:
+    """True when the database's ``alembic_version`` matches the script heads."""
+    try:
+        expected = migration_heads()
+    except Exception:  # noqa: BLE001 - no scripts in this deployment
+        logger.warning("alembic scripts not found at %s; assuming schema is not at head", ALEMBIC_INI)
+        return False
+    with engine.connect() as conn:
+        current = set(MigrationContext.configure(conn).get_current_heads())
+    return bool(current) and current == expected
+
+
+def needs_seed(engine: Engine) -> bool:
+    """A migrated but empty database still gets the initial admin and sites."""
+    with engine.connect() as conn:
+        if not inspect(conn).has_table("users"):
+            return True
+        return conn.execute(text("SELECT 1 FROM users LIMIT 1")).first() is None
+
+
+def lock_seed(db: Session) -> None:
+    """
+    Serialise seeding for the rest of ``db``'s transaction (PostgreSQL).
+
+    Elsewhere concurrent seeds are caught by the unique ``users.employee_id``.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": SEED_LOCK_KEY})
+
+
+def _pool_target(engine: Engine) -> int:
+    if WARMUP_CONNECTIONS > 0:
+        return WARMUP_CONNECTIONS
+    size = getattr(engine.pool, "size", None)
+    return size() if callable(size) else 1
+
+
+def warm_pool(engine: Engine) -> int:
+    """Open (and return to the pool) up to the pool size of connections."""
+    conns = []
+    try:
+        for _ in range(_pool_target(engine)):
+            conn = engine.connect()
+            conns.append(conn)
+            conn.exec_driver_sql("SELECT 1")
+    finally:
+        for conn in conns:
+            conn.close()
+    return len(conns)
+
+
+async def warm_async_pool(engine: AsyncEngine) -> int:
+    conns = []
+    try:
+        for _ in range(_pool_target(engine.sync_engine)):
+            conn = await engine.connect()
+            conns.append(conn)
+            await conn.exec_driver_sql("SELECT 1")
+    finally:
+        for conn in conns:
+            await conn.close()
+    return len(conns)
+
+
+class Readiness:
+    """Whether this worker should receive traffic (``GET /ready``)."""
+
+    def __init__(self) -> None:
+        self.ready = False
+        self.detail = "starting"
+        self._task: Optional[asyncio.Task] = None
+
+    def mark(self, ready: bool, detail: str) -> None:
+        self.ready = ready
+        self.detail = detail
+
+    def start_warmup(self, coro) -> None:
+        # keep a reference so the task is not garbage collected mid-run
+        self._task = asyncio.get_running_loop().create_task(self._run(coro))
+
+    async def _run(self, coro) -> None:
+        try:
+            await coro
+        except Exception as exc:  # noqa: BLE001 - reported through /ready
+            logger.exception("warmup failed")
+            self.mark(False, f"warmup failed: {exc}")
+        else:
+            self.mark(True, "ready")
+
+    async def stop(self) -> None:
+        self.mark(False, "shutting down")
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+readiness = Readiness()
@@ -0,0 +1,261 @@
+"""
+Compact upload formats for buffered mobile tracking batches.
+
+Two things are supported on the tracking router:
+
+* ``Content-Encoding: gzip`` request bodies on any route (``GzipRoute``),
+  capped at ``UPLOAD_MAX_COMPRESSED_BYTES`` as received (checked against
+  ``Content-Length`` and while streaming) and at ``UPLOAD_MAX_BYTES`` after
+  decompression. Plain bodies on these routes are capped at
+  ``UPLOAD_MAX_BYTES`` the same way.
+* A packed columnar point format (``PACKED_MEDIA_TYPE``) for
+  ``POST /tracking/batch/packed``, decoded with NumPy straight into column
+  arrays instead of one pydantic object per point.
+
+Packed layout (little-endian)::
+
+    magic      4s    b"FTPK"
+    version    B     1
+    flags      B     bit 0: accuracy column present, bit 1: client point ids
+    count      I     number of points (n)
+    t0_ms      q     first timestamp, ms since the Unix epoch (UTC)
+    id_len     H     length of the employee id
+    employee   id_len bytes, UTF-8
+    dt_ms      (n-1) x int32   timestamp deltas from the previous point
+    lat        n x int32       degrees * 1e7
+    lng        n x int32       degrees * 1e7
+    accuracy   n x uint16      metres * 10, 0xFFFF = unknown (only if flag)
+    id_lens    n x uint8       client point id lengths, 0 = none (only if flag)
+    ids        sum(id_lens) bytes, the UTF-8 ids back to back (only if flag)
+
+A batch carries the points of a single employee, which is what a phone
+uploads. The columns stay NumPy arrays until ``build_rows`` turns them into
+rows; client point ids (see ``app.dedup``) are the only per-point strings.
+``pack_points`` builds the same layout for clients and benchmarks.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import gzip
+import os
+import struct
+import zlib
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+from fastapi import HTTPException, Request, Response
+from fastapi.routing import APIRoute
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(16 * 1024 * 1024)))
+UPLOAD_MAX_COMPRESSED_BYTES = int(os.getenv("UPLOAD_MAX_COMPRESSED_BYTES", str(4 * 1024 * 1024)))
+PACKED_BATCH_MAX = int(os.getenv("PACKED_BATCH_MAX", "50000"))
+
+PACKED_MEDIA_TYPE = "application/x-falcom-points"
+PACKED_MAGIC = b"FTPK"
+PACKED_VERSION = 1
+FLAG_ACCURACY = 0x01
+FLAG_POINT_IDS = 0x02
+
+COORD_SCALE = 1e7
+ACCURACY_SCALE = 10.0
+ACCURACY_NONE = 0xFFFF
+POINT_ID_MAX_BYTES = 64
+
+_HEADER = struct.Struct("<4sBBIqH")
+_MAX_MS = 4102444800000  # 2100-01-01T00:00:00Z
+
+
+# ----- gzip request bodies -----
+def _too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail="Request body too large")
+
+
+def gunzip_body(body: bytes, limit: int = UPLOAD_MAX_BYTES) -> bytes:
+    """Decompress a gzip body, refusing anything that inflates beyond ``limit``."""
+    inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        data = inflater.decompress(body, limit + 1)
+    except zlib.error:
+        raise HTTPException(status_code=400, detail="Invalid gzip body")
+    if len(data) > limit or inflater.unconsumed_tail:
+        raise _too_large()
+    return data
+
+
+class GzipRequest(Request):
+    async def body(self) -> bytes:
+        if not hasattr(self, "_body"):
+            gzipped = "gzip" in self.headers.getlist("Content-Encoding")
+            body = await self._read(UPLOAD_MAX_COMPRESSED_BYTES if gzipped else UPLOAD_MAX_BYTES)
+            if gzipped:
+                body = gunzip_body(body)
+            self._body = body
+        return self._body
+
+    async def _read(self, limit: int) -> bytes:
+        """Read the raw body, refusing it as soon as it is known to exceed ``limit``."""
+        length = self.headers.get("Content-Length")
+        if length is not None and length.isdigit() and int(length) > limit:
+            raise _too_large()
+        chunks: List[bytes] = []
+        size = 0
+        # Content-Length may be absent (chunked) or wrong: count while reading
+        async for chunk in self.stream():
+            size += len(chunk)
+            if size > limit:
+                raise _too_large()
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+
+class GzipRoute(APIRoute):
+    """Route class that transparently accepts ``Content-Encoding: gzip`` bodies."""
+
+    def get_route_handler(self) -> Callable:
+        original = super().get_route_handler()
+
+        async def handler(request: Request) -> Response:
+            return await original(GzipRequest(request.scope, request.receive))
+
+        return handler
+
+
+# ----- packed columnar points -----
+@dataclass
+class PackedPoints:
+    employee_id: str
+    timestamps: np.ndarray  # datetime64[ms], UTC
+    lats: np.ndarray
+    lngs: np.ndarray
+    accuracies: np.ndarray  # float metres, NaN = unknown
+    client_point_ids: Optional[List[Optional[str]]] = None
+
+    def __len__(self) -> int:
+        return len(self.lats)
+
+
+def _bad(detail: str) -> HTTPException:
+    return HTTPException(status_code=400, detail=f"Invalid packed batch: {detail}")
+
+
+def unpack_points(data: bytes, max_points: int = PACKED_BATCH_MAX) -> PackedPoints:
+    """Decode a packed batch into column arrays; raises 400/413 on malformed input."""
+    if len(data) < _HEADER.size:
+        raise _bad("truncated header")
+    magic, version, flags, n, t0_ms, id_len = _HEADER.unpack_from(data)
+    if magic != PACKED_MAGIC or version != PACKED_VERSION:
+        raise _bad("unknown magic or version")
+    if n == 0:
+        raise _bad("no points")
+    if n > max_points:
+        raise HTTPException(status_code=413, detail=f"At most {max_points} points per packed batch")
+    offset = _HEADER.size
+    try:
+        employee_id = data[offset:offset + id_len].decode("utf-8")
+    except UnicodeDecodeError:
+        raise _bad("employee id is not UTF-8")
+    if not employee_id or len(employee_id) > 32:
+        raise _bad("employee id must be 1-32 characters")
+    offset += id_len
+
+    has_accuracy = bool(flags & FLAG_ACCURACY)
+    has_ids = bool(flags & FLAG_POINT_IDS)
+    expected = offset + 4 * (n - 1) + 8 * n + (2 * n if has_accuracy else 0) + (n if has_ids else 0)
+    # the ids themselves are variable length, checked in _unpack_ids
+    if not (len(data) >= expected if has_ids else len(data) == expected):
+        raise _bad(f"expected {expected} bytes, got {len(data)}")
+
+    deltas = np.frombuffer(data, dtype="<i4", count=n - 1, offset=offset)
+    offset += 4 * (n - 1)
+    lat_fp = np.frombuffer(data, dtype="<i4", count=n, offset=offset)
+    offset += 4 * n
+    lng_fp = np.frombuffer(data, dtype="<i4", count=n, offset=offset)
+    offset += 4 * n
+
+    lats = lat_fp / COORD_SCALE
+    lngs = lng_fp / COORD_SCALE
+    if np.abs(lats).max() > 90 or np.abs(lngs).max() > 180:
+        raise _bad("coordinates out of range")
+
+    ms = np.empty(n, dtype=np.int64)
+    ms[0] = t0_ms
+    np.cumsum(deltas, dtype=np.int64, out=ms[1:])
+    ms[1:] += t0_ms
+    if ms.min() < 0 or ms.max() >= _MAX_MS:
+        raise _bad("timestamps out of range")
+
+    if has_accuracy:
+        acc = np.frombuffer(data, dtype="<u2", count=n, offset=offset)
+        offset += 2 * n
+        accuracies = np.where(acc == ACCURACY_NONE, np.nan, acc / ACCURACY_SCALE)
+    else:
+        accuracies = np.full(n, np.nan)
+
+    client_point_ids = None
+    if has_ids:
+        client_point_ids = _unpack_ids(data, offset, n)
+    return PackedPoints(employee_id, ms.astype("datetime64[ms]"), lats, lngs, accuracies, client_point_ids)
+
+
+def _unpack_ids(data: bytes, offset: int, n: int) -> List[Optional[str]]:
+    lengths = np.frombuffer(data, dtype="u1", count=n, offset=offset)
+    offset += n
+    if lengths.max() > POINT_ID_MAX_BYTES:
+        raise _bad(f"client point ids are at most {POINT_ID_MAX_BYTES} bytes")
+    if len(data) != offset + int(lengths.sum()):
+        raise _bad(f"expected {offset + int(lengths.sum())} bytes, got {len(data)}")
+    ends = (offset + np.cumsum(lengths, dtype=np.int64)).tolist()
+    starts = [offset] + ends[:-1]
+    try:
+        return [data[a:b].decode("utf-8") if a != b else None for a, b in zip(starts, ends)]
+    except UnicodeDecodeError:
+        raise _bad("client point id is not UTF-8")
+
+
+def pack_points(
+    employee_id: str,
+    timestamps: Sequence[dt.datetime],
+    lats: Sequence[float],
+    lngs: Sequence[float],
+    accuracies: Optional[Sequence[Optional[float]]] = None,
+    compress: bool = False,
+    client_point_ids: Optional[Sequence[Optional[str]]] = None,
+) -> bytes:
+    """Encode points in the packed layout (optionally gzipped)."""
+    epoch = dt.datetime(1970, 1, 1, tzinfo=dt.timezone.utc)
+    ms = np.array(
+        [
+            round(((t if t.tzinfo else t.replace(tzinfo=dt.timezone.utc)) - epoch).total_seconds() * 1000)
+            for t in timestamps
+        ],
+        dtype=np.int64,
+    )
+    deltas = np.diff(ms)
+    if len(deltas) and (deltas.min() < -(2**31) or deltas.max() >= 2**31):
+        raise ValueError("timestamp deltas must fit in int32 milliseconds")
+    name = employee_id.encode("utf-8")
+    flags = (FLAG_ACCURACY if accuracies is not None else 0) | (FLAG_POINT_IDS if client_point_ids is not None else 0)
+    parts = [
+        _HEADER.pack(PACKED_MAGIC, PACKED_VERSION, flags, len(ms), int(ms[0]), len(name)),
+        name,
+        deltas.astype("<i4").tobytes(),
+        np.round(np.asarray(lats, dtype=float) * COORD_SCALE).astype("<i4").tobytes(),
+        np.round(np.asarray(lngs, dtype=float) * COORD_SCALE).astype("<i4").tobytes(),
+    ]
+    if accuracies is not None:
+        parts.append(
+            np.array(
+                [ACCURACY_NONE if a is None else min(round(a * ACCURACY_SCALE), ACCURACY_NONE - 1) for a in accuracies],
+                dtype="<u2",
+            ).tobytes()
+        )
+    if client_point_ids is not None:
+        encoded = [(point_id or "").encode("utf-8") for point_id in client_point_ids]
+        if any(len(e) > POINT_ID_MAX_BYTES for e in encoded):
+            raise ValueError(f"client point ids are at most {POINT_ID_MAX_BYTES} bytes")
+        parts.append(bytes(len(e) for e in encoded))
+        parts.extend(encoded)
+    data = b"".join(parts)
+    return gzip.compress(data) if compress else data
@@ -0,0 +1,169 @@
+"""
+Incremental geofence visit sessions computed at ingest time.
+
+For every employee the open ``site_visits`` row (``exited_at IS NULL``) is the
+state of a small state machine that is advanced by each accepted point:
+
+* not on site + fix inside a site's radius -> open a visit for that site;
+* on site + fix inside another site -> close the visit at its last fix and
+  open one for the new site, even within the old site's exit radius;
+* on site + fix within ``radius * VISIT_EXIT_FACTOR`` -> extend the visit
+  (polygon sites: within a buffer around the polygon, see
+  ``SiteGeom.within_exit``);
+* on site + ``VISIT_EXIT_DEBOUNCE`` consecutive fixes beyond that exit radius
+  -> close the visit at its last fix;
+* a gap longer than ``VISIT_MAX_GAP_S`` closes the visit before the new fix.
+
+Entering at the radius but leaving only beyond a wider exit radius, plus the
+debounce count, keeps GPS jitter at the boundary from producing bursts of
+one-point visits. Fixes older than the open visit's last fix (late offline
+uploads) do not rewrite sessions.
+
+Each employee has at most one open visit (partial unique index
+``uq_site_visits_open``). On PostgreSQL ``apply_points`` holds a
+per-employee advisory lock for the rest of the transaction, so two workers
+ingesting the same employee advance the state machine one after the other
+instead of both opening a visit.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import os
+import zlib
+from itertools import groupby
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from .geofence import site_index
+from .ingest import Row, as_utc
+from .models import SiteVisit
+
+SITE_VISITS_ENABLED = os.getenv("SITE_VISITS_ENABLED", "1") == "1"
+VISIT_EXIT_FACTOR = float(os.getenv("VISIT_EXIT_FACTOR", "1.25"))
+VISIT_EXIT_DEBOUNCE = int(os.getenv("VISIT_EXIT_DEBOUNCE", "2"))
+VISIT_MAX_GAP_S = float(os.getenv("VISIT_MAX_GAP_S", "1800"))
+# Longest visit considered by range queries; bounds the index scan.
+VISIT_MAX_DURATION_H = float(os.getenv("VISIT_MAX_DURATION_H", "24"))
+# first key of pg_advisory_xact_lock(int, int) serialising visits per employee
+VISIT_LOCK_CLASS = 0x76697369  # "visi"
+
+
+def _still_on_site(visit: SiteVisit, row: Row) -> bool:
+    if row["site_id"] is not None:
+        # inside a site: the new site wins over the old one's exit buffer
+        return row["site_id"] == visit.site_id
+    site = site_index.get(visit.site_id)
+    if site is None:  # site deleted or deactivated
+        return False
+    return site.within_exit(row["lat"], row["lng"], VISIT_EXIT_FACTOR)
+
+
+def _close(visit: SiteVisit) -> None:
+    visit.exited_at = visit.last_seen_at
+    visit.outside_count = 0
+
+
+def _advance(db: Session, visit: Optional[SiteVisit], employee_id: str, row: Row) -> Optional[SiteVisit]:
+    """Apply one fix to the employee's open visit and return the new open visit."""
+    ts = as_utc(row["timestamp"])
+    if visit is not None:
+        last_seen = as_utc(visit.last_seen_at)
+        if ts < last_seen:
+            return visit
+        if (ts - last_seen).total_seconds() > VISIT_MAX_GAP_S:
+            _close(visit)
+            visit = None
+
+    if visit is not None:
+        if _still_on_site(visit, row):
+            visit.last_seen_at = ts
+            visit.point_count += 1
+            visit.outside_count = 0
+            return visit
+        visit.outside_count += 1
+        if row["site_id"] is None and visit.outside_count < VISIT_EXIT_DEBOUNCE:
+            return visit
+        _close(visit)
+        visit = None
+
+    if row["site_id"] is None:
+        return None
+    visit = SiteVisit(
+        employee_id=employee_id,
+        site_id=row["site_id"],
+        entered_at=ts,
+        last_seen_at=ts,
+        point_count=1,
+        outside_count=0,
+    )
+    db.add(visit)
+    return visit
+
+
+def employee_lock_key(employee_id: str) -> int:
+    """Second advisory lock key of an employee (a signed 32-bit hash)."""
+    return zlib.crc32(employee_id.encode()) - 2**31
+
+
+def lock_employees(db: Session, employee_ids: Iterable[str]) -> None:
+    """
+    Serialise visit updates of these employees for the rest of ``db``'s
+    transaction (PostgreSQL). Keys are taken in sorted order so concurrent
+    batches cannot deadlock; a hash collision only serialises a bit more.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    keys = sorted({employee_lock_key(e) for e in employee_ids})
+    db.execute(
+        text("SELECT pg_advisory_xact_lock(:cls, k) FROM unnest(CAST(:keys AS integer[])) AS k"),
+        {"cls": VISIT_LOCK_CLASS, "keys": keys},
+    )
+
+
+def apply_points(db: Session, rows: List[Row]) -> None:
+    """Advance the visit state machine of every employee in ``rows``; caller commits."""
+    if not SITE_VISITS_ENABLED or not rows:
+        return
+    key = lambda r: r["employee_id"]  # noqa: E731
+    by_employee: Dict[str, List[Row]] = {
+        employee_id: sorted(group, key=lambda r: as_utc(r["timestamp"]))
+        for employee_id, group in groupby(sorted(rows, key=key), key=key)
+    }
+    lock_employees(db, by_employee)
+    open_visits = {
+        v.employee_id: v
+        for v in db.scalars(
+            select(SiteVisit)
+            .where(SiteVisit.employee_id.in_(by_employee))
+            .where(SiteVisit.exited_at.is_(None))
+        )
+    }
+    for employee_id, points in by_employee.items():
+        visit = open_visits.get(employee_id)
+        for row in points:
+            visit = _advance(db, visit, employee_id, row)
+
+
+def visits_overlapping(
+    db: Session,
+    start: dt.datetime,
+    end: dt.datetime,
+    site_id: Optional[int] = None,
+    employee_id: Optional[str] = None,
+) -> List[SiteVisit]:
+    """Visits that were in progress at any time within ``[start, end]``."""
+    stmt = (
+        select(SiteVisit)
+        .where(SiteVisit.entered_at <= end)
+        .where(SiteVisit.entered_at >= start - dt.timedelta(hours=VISIT_MAX_DURATION_H))
+        .where((SiteVisit.exited_at.is_(None)) | (SiteVisit.exited_at >= start))
+        .order_by(SiteVisit.entered_at.asc(), SiteVisit.id.asc())
+    )
+    if site_id is not None:
+        stmt = stmt.where(SiteVisit.site_id == site_id)
+    if employee_id is not None:
+        stmt = stmt.where(SiteVisit.employee_id == employee_id)
+    return list(db.scalars(stmt))
@@ -0,0 +1,10 @@
+"""
+Benchmarks for the Falcom Geofence API (not part of the shipped app).
+
+* ``python -m bench.micro`` - haversine, site matching and JWT micro-benchmarks.
+* ``python -m bench.load`` - end-to-end load against the FastAPI app.
+
+Both print throughput and p50/p95/p99 latency and can be compared against a
+stored baseline with ``--baseline FILE`` (``--save`` writes it); a run that
+regresses beyond ``--tolerance`` exits with status 1.
+"""
@@ -0,0 +1,201 @@
+"""
+End-to-end load generator for ``POST /tracking`` and ``POST /auth/login``.
+
+    python -m bench.load [--employees 200] [--sites 50] [--duration 20]
+                         [--concurrency 32] [--login-ratio 0.02]
+                         [--url http://localhost:8000]
+                         [--baseline bench/baseline_load.json [--save]]
+
+Without ``--url`` the app is driven in-process through ``httpx.ASGITransport``
+against whatever ``DATABASE_URL`` points at (a local Postgres, or SQLite such
+as ``sqlite:///./bench.db``). With ``--url`` requests go to a running server,
+and ``DATABASE_URL`` and ``JWT_SECRET`` must match that server's.
+
+Setup creates ``bench-NNNN`` employees sharing one password and ``--sites``
+sites around Riyadh, then mints access tokens directly so bcrypt only runs
+for the sampled logins. Each employee has a home site: most pings are fixes
+jittered around it, the rest are in transit a few kilometres away, and
+employees are picked with a skewed (Zipf-like) distribution so a few phones
+report much more often than the rest.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import datetime as dt
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+import httpx
+
+from app.auth import create_access_token, get_password_hash
+from app.db import SessionLocal
+from app.models import Site, User, UserRole
+from app.site_cache import site_snapshots
+
+from .stats import Results, finish, summarize
+
+PASSWORD = "bench-password"
+CENTER = (24.7136, 46.6753)  # Riyadh
+ON_SITE_RATIO = 0.85
+
+
+def setup(n_employees: int, n_sites: int, rng: random.Random) -> Tuple[List[Tuple[str, int]], List[Site]]:
+    """Create (or reuse) bench employees and sites; return (employee_id, user_id) pairs."""
+    db = SessionLocal()
+    try:
+        existing = {u.employee_id: u for u in db.query(User).filter(User.employee_id.like("bench-%"))}
+        password_hash = None
+        for i in range(n_employees):
+            employee_id = f"bench-{i:04d}"
+            if employee_id in existing:
+                continue
+            password_hash = password_hash or get_password_hash(PASSWORD)
+            db.add(
+                User(
+                    employee_id=employee_id,
+                    full_name=f"Bench Employee {i}",
+                    role=UserRole.employee,
+                    password_hash=password_hash,
+                    is_active=True,
+                )
+            )
+        sites = db.query(Site).filter(Site.name.like("bench-%")).order_by(Site.id).all()
+        for i in range(len(sites), n_sites):
+            lat = CENTER[0] + rng.uniform(-0.5, 0.5)
+            lng = CENTER[1] + rng.uniform(-0.5, 0.5)
+            sites.append(Site(name=f"bench-{i:03d}", name_en=f"Bench site {i}", lat=lat, lng=lng, radius_m=200.0, is_active=True))
+            db.add(sites[-1])
+        db.commit()
+        site_snapshots.publish(db)
+        users = (
+            db.query(User.employee_id, User.id)
+            .filter(User.employee_id.like("bench-%"))
+            .order_by(User.employee_id)
+            .limit(n_employees)
+            .all()
+        )
+        for site in sites:
+            db.expunge(site)
+        return [(u.employee_id, u.id) for u in users], sites[:n_sites]
+    finally:
+        db.close()
+
+
+class Workload:
+    def __init__(self, employees: List[Tuple[str, int]], sites: List[Site], login_ratio: float, seed: int):
+        self.rng = random.Random(seed)
+        self.employees = employees
+        self.login_ratio = login_ratio
+        self.home = {e: self.rng.choice(sites) for e, _ in employees}
+        self.tokens = {
+            e: create_access_token(
+                {"user_id": uid, "employee_id": e, "role": UserRole.employee.value}, dt.timedelta(hours=2)
+            )
+            for e, uid in employees
+        }
+        # Zipf-like weights: a few chatty phones, a long tail of quiet ones
+        self.weights = [1.0 / (rank + 1) ** 0.8 for rank in range(len(employees))]
+
+    def next_request(self) -> Tuple[str, str, Dict, Dict]:
+        employee_id, _ = self.rng.choices(self.employees, weights=self.weights)[0]
+        if self.rng.random() < self.login_ratio:
+            return "login", "/auth/login", {"employee_id": employee_id, "password": PASSWORD}, {}
+        site = self.home[employee_id]
+        if self.rng.random() < ON_SITE_RATIO:
+            lat = site.lat + self.rng.gauss(0, 0.0004)
+            lng = site.lng + self.rng.gauss(0, 0.0004)
+        else:
+            lat = site.lat + self.rng.uniform(-0.05, 0.05)
+            lng = site.lng + self.rng.uniform(-0.05, 0.05)
+        body = {
+            "employee_id": employee_id,
+            "timestamp": dt.datetime.utcnow().isoformat(),
+            "lat": lat,
+            "lng": lng,
+            "accuracy": round(self.rng.uniform(3.0, 30.0), 1),
+        }
+        return "tracking", "/tracking", body, {"Authorization": f"Bearer {self.tokens[employee_id]}"}
+
+
+async def run_load(client: httpx.AsyncClient, workload: Workload, duration_s: float, concurrency: int):
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    statuses: Dict[str, Counter] = defaultdict(Counter)
+    deadline = time.perf_counter() + duration_s
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            name, path, body, headers = workload.next_request()
+            t = time.perf_counter()
+            try:
+                r = await client.post(path, json=body, headers=headers)
+                status = r.status_code
+            except httpx.HTTPError as exc:
+                status = type(exc).__name__
+            latencies[name].append(time.perf_counter() - t)
+            statuses[name][status] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, statuses, time.perf_counter() - started
+
+
+async def main_async(args) -> int:
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=30.0)
+        app = None
+    else:
+        from app.main import app
+
+        # ASGITransport does not send lifespan events; run startup (tables, seed) ourselves
+        await app.router.startup()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=30.0)
+    try:
+        employees, sites = await asyncio.get_running_loop().run_in_executor(
+            None, setup, args.employees, args.sites, random.Random(args.seed)
+        )
+        workload = Workload(employees, sites, args.login_ratio, args.seed)
+        if args.warmup > 0:
+            await run_load(client, workload, args.warmup, args.concurrency)
+        latencies, statuses, elapsed = await run_load(client, workload, args.duration, args.concurrency)
+    finally:
+        await client.aclose()
+        if app is not None:
+            await app.router.shutdown()
+
+    results: Results = {}
+    for name in sorted(latencies):
+        results[f"POST {'/auth/login' if name == 'login' else '/tracking'}"] = summarize(latencies[name], elapsed)
+    for name, counts in sorted(statuses.items()):
+        print(f"{name}: " + ", ".join(f"{status}={n}" for status, n in sorted(counts.items(), key=str)))
+    return finish(
+        f"load: {args.employees} employees, {args.sites} sites, concurrency {args.concurrency}, {elapsed:.1f}s",
+        results,
+        args.baseline,
+        args.save,
+        args.tolerance,
+    )
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Falcom tracking load generator")
+    parser.add_argument("--employees", type=int, default=200)
+    parser.add_argument("--sites", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=20.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=2.0, help="unmeasured seconds before the run")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--login-ratio", type=float, default=0.02, help="share of requests that are logins")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--url", help="drive a running server instead of the in-process app")
+    parser.add_argument("--baseline", help="baseline JSON to compare with (or write with --save)")
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    return asyncio.run(main_async(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
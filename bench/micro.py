@@ -0,0 +1,167 @@
+"""
+Micro-benchmarks for the tracking hot path.
+
+    python -m bench.micro [--quick] [--baseline bench/baseline_micro.json [--save]]
+
+Covers ``haversine_m``, site matching against 10 / 1k / 100k sites (single
+point ``nearest`` and the vectorised ``match_many``), matching against
+polygon sites with hundreds of vertices, and JWT encode/decode with and
+without the decode cache. Sites are scattered over Saudi Arabia
+with realistic 100-500 m radii; a fixed seed keeps runs comparable.
+"""
+
+from __future__ import annotations
+
+import argparse
+import math
+import random
+import sys
+import time
+from typing import Callable, List
+
+from app.auth import _token_cache, create_access_token, decode_token
+from app.geofence import PreparedPolygon, SiteGeom, SiteIndex, haversine_m
+
+from .stats import Results, finish, summarize
+
+# roughly the Kingdom's bounding box
+LAT_RANGE = (16.0, 32.0)
+LNG_RANGE = (35.0, 55.0)
+
+
+def _timeit(fn: Callable[[], object], samples: int, ops_per_sample: int = 1):
+    """Run ``fn`` ``samples`` times and summarise per-operation latency."""
+    latencies: List[float] = []
+    started = time.perf_counter()
+    for _ in range(samples):
+        t = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t)
+    return summarize(latencies, time.perf_counter() - started, ops_per_sample)
+
+
+def random_sites(n: int, rng: random.Random) -> List[SiteGeom]:
+    return [
+        SiteGeom(
+            id=i + 1,
+            lat=rng.uniform(*LAT_RANGE),
+            lng=rng.uniform(*LNG_RANGE),
+            radius_m=rng.uniform(100.0, 500.0),
+        )
+        for i in range(n)
+    ]
+
+
+def query_points(sites: List[SiteGeom], n: int, rng: random.Random, on_site: float = 0.8):
+    """Mostly fixes near a site (jitter ~ its radius), the rest anywhere."""
+    points = []
+    for _ in range(n):
+        if rng.random() < on_site:
+            s = rng.choice(sites)
+            points.append((s.lat + rng.gauss(0, 0.002), s.lng + rng.gauss(0, 0.002)))
+        else:
+            points.append((rng.uniform(*LAT_RANGE), rng.uniform(*LNG_RANGE)))
+    return points
+
+
+def bench_haversine(scale: int) -> Results:
+    rng = random.Random(1)
+    pairs = [(rng.uniform(16, 32), rng.uniform(35, 55), rng.uniform(16, 32), rng.uniform(35, 55)) for _ in range(1000)]
+
+    def run():
+        for p in pairs:
+            haversine_m(*p)
+
+    return {"haversine_m": _timeit(run, 200 * scale, len(pairs))}
+
+
+def bench_matching(scale: int) -> Results:
+    results: Results = {}
+    for n_sites in (10, 1_000, 100_000):
+        rng = random.Random(n_sites)
+        sites = random_sites(n_sites, rng)
+        index = SiteIndex()
+        index.rebuild(sites)
+        points = query_points(sites, 1000, rng)
+        lats = [p[0] for p in points]
+        lngs = [p[1] for p in points]
+
+        def nearest(points=points, index=index):
+            for lat, lng in points:
+                index.nearest(lat, lng)
+
+        results[f"nearest[{n_sites} sites]"] = _timeit(nearest, 20 * scale, len(points))
+        # match_many is O(points x sites); keep the largest case affordable
+        batch = 1000 if n_sites <= 1_000 else 100
+        results[f"match_many[{n_sites} sites, {batch} pts]"] = _timeit(
+            lambda index=index, lats=lats[:batch], lngs=lngs[:batch]: index.match_many(lats, lngs),
+            (20 if n_sites <= 1_000 else 3) * scale,
+            batch,
+        )
+    return results
+
+
+def random_polygon(lat: float, lng: float, vertices: int, rng: random.Random) -> PreparedPolygon:
+    """Irregular star-shaped compound of roughly 1-2 km across."""
+    ring = []
+    for k in range(vertices):
+        angle = 2 * math.pi * k / vertices
+        r = rng.uniform(0.003, 0.009)
+        ring.append((lat + r * math.sin(angle), lng + r * math.cos(angle)))
+    return PreparedPolygon(ring)
+
+
+def bench_polygons(scale: int) -> Results:
+    results: Results = {}
+    for vertices in (8, 500):
+        rng = random.Random(vertices)
+        sites = [
+            SiteGeom(id=s.id, lat=s.lat, lng=s.lng, radius_m=s.radius_m, polygon=random_polygon(s.lat, s.lng, vertices, rng))
+            for s in random_sites(1_000, rng)
+        ]
+        index = SiteIndex()
+        index.rebuild(sites)
+        points = query_points(sites, 1000, rng)
+
+        def nearest(points=points, index=index):
+            for lat, lng in points:
+                index.nearest(lat, lng)
+
+        results[f"nearest[1000 polygons x {vertices} vertices]"] = _timeit(nearest, 10 * scale, len(points))
+    return results
+
+
+def bench_jwt(scale: int) -> Results:
+    token = create_access_token({"user_id": 1, "role": "employee"})
+
+    def decode_uncached():
+        _token_cache.clear()
+        decode_token(token)
+
+    decode_token(token)
+    return {
+        "jwt_encode": _timeit(lambda: create_access_token({"user_id": 1, "role": "employee"}), 2000 * scale),
+        "jwt_decode": _timeit(decode_uncached, 2000 * scale),
+        "jwt_decode[cached]": _timeit(lambda: decode_token(token), 2000 * scale),
+    }
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Falcom tracking micro-benchmarks")
+    parser.add_argument("--quick", action="store_true", help="fewer samples (smoke run)")
+    parser.add_argument("--baseline", help="baseline JSON to compare with (or write with --save)")
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative regression")
+    args = parser.parse_args(argv)
+
+    scale = 1 if args.quick else 5
+    results: Results = {}
+    results.update(bench_haversine(scale))
+    results.update(bench_matching(scale))
+    results.update(bench_polygons(scale))
+    results.update(bench_jwt(scale))
+    return finish("micro-benchmarks", results, args.baseline, args.save, args.tolerance)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
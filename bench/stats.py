@@ -0,0 +1,102 @@
+"""
+Latency statistics and baseline comparison shared by the benchmarks.
+
+Every benchmark produces a flat ``{name: summary}`` mapping where a summary
+holds ``count``, ``throughput`` (operations per second) and ``p50_ms`` /
+``p95_ms`` / ``p99_ms``. Results can be saved as a JSON baseline and later
+runs compared against it: a benchmark regresses when its p95 latency grows,
+or its throughput drops, by more than the tolerance.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import platform
+import sys
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+Summary = Dict[str, float]
+Results = Dict[str, Summary]
+
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile of already sorted values (``q`` in 0..100)."""
+    if not sorted_values:
+        return float("nan")
+    rank = max(1, math.ceil(q / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies_s: Sequence[float], elapsed_s: float, ops_per_sample: int = 1) -> Summary:
+    """
+    Summarise per-sample latencies in seconds.
+
+    ``ops_per_sample`` > 1 means each sample timed that many operations; the
+    percentiles are then reported per operation.
+    """
+    values = sorted(v / ops_per_sample for v in latencies_s)
+    count = len(values) * ops_per_sample
+    return {
+        "count": count,
+        "throughput": count / elapsed_s if elapsed_s > 0 else float("nan"),
+        "p50_ms": percentile(values, 50) * 1000.0,
+        "p95_ms": percentile(values, 95) * 1000.0,
+        "p99_ms": percentile(values, 99) * 1000.0,
+    }
+
+
+def print_table(title: str, results: Results) -> None:
+    width = max([len(name) for name in results] + [9])
+    print(f"\n{title}")
+    print(f"{'benchmark':<{width}}  {'count':>9}  {'ops/s':>11}  {'p50 ms':>9}  {'p95 ms':>9}  {'p99 ms':>9}")
+    for name, s in results.items():
+        print(
+            f"{name:<{width}}  {int(s['count']):>9}  {s['throughput']:>11.1f}  "
+            f"{s['p50_ms']:>9.4f}  {s['p95_ms']:>9.4f}  {s['p99_ms']:>9.4f}"
+        )
+
+
+def save_baseline(path: str, results: Results) -> None:
+    payload = {
+        "python": sys.version.split()[0],
+        "machine": platform.machine(),
+        "results": results,
+    }
+    Path(path).write_text(json.dumps(payload, indent=2, sort_keys=True) + "\n")
+
+
+def load_baseline(path: str) -> Results:
+    return json.loads(Path(path).read_text())["results"]
+
+
+def compare(results: Results, baseline: Results, tolerance: float) -> List[str]:
+    """Print a comparison and return the names of regressed benchmarks."""
+    regressed = []
+    print(f"\ncompared with baseline (tolerance {tolerance:.0%})")
+    for name, s in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"  {name}: no baseline")
+            continue
+        p95 = s["p95_ms"] / base["p95_ms"] - 1.0 if base["p95_ms"] else 0.0
+        tput = s["throughput"] / base["throughput"] - 1.0 if base["throughput"] else 0.0
+        bad = p95 > tolerance or tput < -tolerance
+        print(f"  {name}: p95 {p95:+.1%}, throughput {tput:+.1%}{'  REGRESSION' if bad else ''}")
+        if bad:
+            regressed.append(name)
+    return regressed
+
+
+def finish(title: str, results: Results, baseline: str | None, save: bool, tolerance: float) -> int:
+    """Print, optionally save/compare, and return the process exit code."""
+    print_table(title, results)
+    if not baseline:
+        return 0
+    if save:
+        save_baseline(baseline, results)
+        print(f"\nbaseline written to {baseline}")
+        return 0
+    regressed = compare(results, load_baseline(baseline), tolerance)
+    return 1 if regressed else 0
@@ -0,0 +1,77 @@
+"""
+Shared fixtures. The app runs against a throwaway SQLite file (created and
+seeded by the normal startup path); tests that need PostgreSQL read
+``TEST_POSTGRES_URL`` and are skipped without it.
+"""
+
+import os
+import tempfile
+import time
+
+# must happen before anything imports app.db
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="falcom-tests-"), "test.db")
+os.environ.setdefault("JWT_SECRET", "test-secret")
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+ADMIN = ("220220", "admin")  # seeded by app.main.seed
+
+
+@pytest.fixture(scope="session")
+def client():
+    from app.main import app
+
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture(scope="session")
+def admin_headers(client):
+    r = client.post("/auth/login", json={"employee_id": ADMIN[0], "password": ADMIN[1]})
+    assert r.status_code == 200, r.text
+    return {"Authorization": "Bearer " + r.json()["access_token"]}
+
+
+@pytest.fixture(scope="session")
+def warm(client):
+    """The app after its background warmup, so the site index is no longer reloaded under a test."""
+    from app.startup import readiness
+
+    for _ in range(200):
+        if readiness.ready:
+            break
+        time.sleep(0.05)
+    assert readiness.ready, readiness.detail
+    return client
+
+
+@pytest.fixture
+def db(warm):
+    from app.db import SessionLocal
+
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def pg_conn():
+    """Connection to ``TEST_POSTGRES_URL`` inside a scratch schema, rolled back afterwards."""
+    url = os.environ.get("TEST_POSTGRES_URL")
+    if not url:
+        pytest.skip("TEST_POSTGRES_URL not set")
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(url)
+    with engine.connect() as conn:
+        tx = conn.begin()
+        conn.execute(text("CREATE SCHEMA falcom_test"))
+        conn.execute(text("SET LOCAL search_path TO falcom_test"))
+        try:
+            yield conn
+        finally:
+            tx.rollback()
+    engine.dispose()
@@ -0,0 +1,128 @@
+import asyncio
+import datetime as dt
+import hashlib
+import itertools
+import time
+
+import pytest
+from jose import ExpiredSignatureError
+from sqlalchemy import update
+
+from app import auth, dependencies
+from app.auth import create_access_token, decode_token
+from app.dependencies import InactiveUsers
+from app.models import User, UserRole
+
+_ids = itertools.count(1)
+ADMIN = {"employee_id": "220220", "password": "admin"}  # seeded by app.main.seed
+
+
+@pytest.fixture
+def manager(db):
+    user = User(employee_id=f"auth-{next(_ids)}", full_name="Manager", role=UserRole.manager, password_hash="x")
+    db.add(user)
+    db.commit()
+    return user
+
+
+def bearer(user):
+    # the claims issued by POST /auth/login
+    token = create_access_token({"user_id": user.id, "employee_id": user.employee_id, "role": user.role.value})
+    return {"Authorization": "Bearer " + token}
+
+
+@pytest.fixture
+def stateless(monkeypatch):
+    def set_stateless(on, refresh_s=30.0):
+        monkeypatch.setattr(dependencies, "AUTH_STATELESS", on)
+        monkeypatch.setattr(dependencies, "inactive_users", InactiveUsers(refresh_s))
+
+    return set_stateless
+
+
+def test_stateless_refuses_a_deactivated_user(client, manager, db, stateless):
+    stateless(True)
+    headers = bearer(manager)
+    assert client.get("/sites", headers=headers).status_code == 200
+    manager.is_active = False
+    db.commit()
+    assert client.get("/sites", headers=headers).status_code == 401
+
+
+def test_stateless_picks_up_deactivations_from_other_workers(client, manager, db, stateless):
+    stateless(True, refresh_s=0.0)
+    headers = bearer(manager)
+    assert client.get("/sites", headers=headers).status_code == 200
+    # a Core update skips the ORM events, like a change committed by another worker
+    db.execute(update(User).where(User.id == manager.id).values(is_active=False))
+    db.commit()
+    assert client.get("/sites", headers=headers).status_code == 401
+
+
+def test_stateless_role_comes_from_the_token(client, manager, db, stateless):
+    stateless(True)
+    old = bearer(manager)
+    manager.role = UserRole.employee
+    db.commit()
+    assert client.get("/sites", headers=bearer(manager)).status_code == 403
+    # the old token keeps its signed role until it expires
+    assert client.get("/sites", headers=old).status_code == 200
+
+
+def test_database_path_applies_changes_to_existing_tokens(client, manager, db, stateless):
+    stateless(False)
+    headers = bearer(manager)
+    assert client.get("/sites", headers=headers).status_code == 200
+    manager.role = UserRole.employee
+    db.commit()
+    assert client.get("/sites", headers=headers).status_code == 403
+    manager.is_active = False
+    db.commit()
+    assert client.get("/sites", headers=headers).status_code == 401
+
+
+def test_user_cache_is_dropped_on_deactivation_and_role_change(client, manager, db, stateless):
+    stateless(False)
+    headers = bearer(manager)
+    client.get("/sites", headers=headers)
+    assert dependencies.user_cache.get(manager.id).role == UserRole.manager
+
+    manager.role = UserRole.employee
+    db.flush()
+    assert dependencies.user_cache.get(manager.id) is None  # dropped on flush, before the commit
+    db.commit()
+    client.get("/sites", headers=headers)
+    assert dependencies.user_cache.get(manager.id).role == UserRole.employee
+
+    manager.is_active = False
+    db.commit()
+    assert dependencies.user_cache.get(manager.id) is None
+    assert client.get("/sites", headers=headers).status_code == 401
+    assert dependencies.user_cache.get(manager.id) is None  # inactive users are not cached
+
+
+def test_token_cache_does_not_outlive_the_token(manager):
+    token = create_access_token({"user_id": manager.id}, expires_delta=dt.timedelta(seconds=2))
+    payload = decode_token(token)
+    assert decode_token(token) == payload  # served from the cache
+    key = hashlib.sha256(token.encode()).digest()
+    assert auth._token_cache.get(key) is not None
+    time.sleep(max(0.0, payload["exp"] - time.time()) + 0.05)
+    assert auth._token_cache.get(key) is None
+
+
+def test_expired_token_is_not_cached(manager):
+    token = create_access_token({"user_id": manager.id}, expires_delta=dt.timedelta(seconds=-1))
+    for _ in range(2):
+        with pytest.raises(ExpiredSignatureError):
+            decode_token(token)
+
+
+def test_login_is_refused_with_503_when_the_bcrypt_pool_is_saturated(client, monkeypatch):
+    monkeypatch.setattr(auth, "_hash_slots", asyncio.Semaphore(0))  # every slot taken
+    monkeypatch.setattr(auth, "BCRYPT_QUEUE_TIMEOUT_S", 0.05)
+    r = client.post("/auth/login", json=ADMIN)
+    assert r.status_code == 503 and r.headers["Retry-After"] == "2"
+
+    monkeypatch.setattr(auth, "_hash_slots", asyncio.Semaphore(1))
+    assert client.post("/auth/login", json=ADMIN).status_code == 200
@@ -0,0 +1,120 @@
+import datetime as dt
+
+import pytest
+
+from app import compaction, ingest_queue
+from app.compaction import compact, douglas_peucker
+from app.geofence import METERS_PER_DEG_LAT
+
+T0 = dt.datetime(2025, 4, 1, 8, 0, tzinfo=dt.timezone.utc)
+
+
+def fix(second, north_m=0.0, east_m=0.0, site_id=1, employee_id="e"):
+    return {
+        "employee_id": employee_id,
+        "timestamp": T0 + dt.timedelta(seconds=second),
+        "lat": 24.0 + north_m / METERS_PER_DEG_LAT,
+        "lng": 46.0 + east_m / (METERS_PER_DEG_LAT * 0.9135),  # cos(24 deg)
+        "site_id": site_id,
+        "client_point_id": "",
+    }
+
+
+@pytest.fixture
+def tolerance(monkeypatch):
+    def set_tolerance(metres):
+        monkeypatch.setattr(compaction, "SIMPLIFY_TOLERANCE_M", metres)
+
+    set_tolerance(0.0)
+    return set_tolerance
+
+
+def test_stationary_run_collapses_to_one_row(tolerance):
+    rows = [fix(s, north_m=(s % 3)) for s in (0, 30, 60, 90)]
+    new_rows, extended, owners = compact(rows, {})
+    [run] = new_rows
+    assert run["timestamp"] == rows[0]["timestamp"] and run["last_timestamp"] == rows[-1]["timestamp"]
+    assert run["point_count"] == 4 and extended == [] and all(o is run for o in owners)
+    assert "last_timestamp" not in rows[0]  # input rows are not modified
+
+
+@pytest.mark.parametrize("second", [
+    fix(30, north_m=compaction.STATIONARY_RADIUS_M + 5),  # moved away
+    fix(compaction.STATIONARY_MAX_GAP_S + 1),  # gap too long
+    fix(30, site_id=2),  # different site
+])
+def test_run_breaks_on_distance_gap_or_site(tolerance, second):
+    new_rows, _, _ = compact([fix(0), second], {})
+    assert [r["point_count"] for r in new_rows] == [1, 1]
+
+
+def test_run_continues_from_the_previous_request(tolerance):
+    tail = {**fix(0), "id": 41, "last_timestamp": None, "point_count": 1}
+    new_rows, extended, owners = compact([fix(30), fix(60)], {"e": tail})
+    assert new_rows == [] and [t["point_count"] for t in extended] == [3]
+    assert tail["point_count"] == 1 and all(o is extended[0] for o in owners)
+
+
+def test_douglas_peucker_drops_points_within_tolerance_and_keeps_the_ends():
+    line = [fix(s, east_m=100 * s) for s in range(5)]
+    line[2]["lat"] += 5 / METERS_PER_DEG_LAT  # 5 m off the straight line
+    assert douglas_peucker(line, 10.0, [False] * 5) == [True, False, False, False, True]
+    assert douglas_peucker(line, 3.0, [False] * 5) == [True, False, True, False, True]
+    assert douglas_peucker(line, 10.0, [False, True, False, False, False]) == [True, True, False, False, True]
+    assert douglas_peucker(line, 0.0, [False] * 5) == [True] * 5
+
+
+def test_simplify_tolerance_switch(tolerance):
+    moving = [fix(10 * s, east_m=100 * s) for s in range(5)]
+    assert len(compact(moving, {})[0]) == 5
+    tolerance(10.0)
+    new_rows, _, owners = compact(moving, {})
+    assert len(new_rows) == 2 and owners[1:4] == [None, None, None]
+
+
+def test_simplification_keeps_site_changes(tolerance):
+    tolerance(10.0)
+    moving = [fix(10 * s, east_m=100 * s, site_id=None if s != 2 else 7) for s in range(5)]
+    new_rows, _, _ = compact(moving, {})
+    assert [r["site_id"] for r in new_rows] == [None, 7, None, None]
+
+
+@pytest.fixture
+def compaction_enabled(monkeypatch, tolerance):
+    def enable(on):
+        monkeypatch.setattr(ingest_queue, "TRACKING_COMPACTION_ENABLED", on)
+
+    return enable
+
+
+def post(client, headers, employee_id, second, client_point_id):
+    point = {
+        "employee_id": employee_id, "lat": 24.0, "lng": 46.0,
+        "timestamp": (T0 + dt.timedelta(seconds=second)).isoformat(), "client_point_id": client_point_id,
+    }
+    r = client.post("/tracking", json=point, headers=headers)
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_absorbed_point_is_reported_as_absorbed(client, admin_headers, compaction_enabled):
+    compaction_enabled(True)
+    first = post(client, admin_headers, "compact-on", 0, "a")
+    second = post(client, admin_headers, "compact-on", 30, "b")
+    assert first["status"] == "accepted"
+    assert second["status"] == "absorbed" and second["id"] == first["id"]
+
+    points = [
+        {"employee_id": "compact-on", "lat": 24.0, "lng": 46.0, "timestamp": (T0 + dt.timedelta(seconds=s)).isoformat()}
+        for s in (60, 90)
+    ]
+    batch = client.post("/tracking/batch", json={"points": points}, headers=admin_headers).json()
+    assert batch["accepted"] == 2 and batch["absorbed"] == 2
+    assert {(r["status"], r["id"]) for r in batch["results"]} == {("absorbed", first["id"])}
+
+
+def test_compaction_disabled_stores_every_point(client, admin_headers, compaction_enabled):
+    compaction_enabled(False)
+    first = post(client, admin_headers, "compact-off", 0, "a")
+    second = post(client, admin_headers, "compact-off", 30, "b")
+    assert first["status"] == second["status"] == "accepted" and first["id"] != second["id"]
@@ -0,0 +1,60 @@
+import random
+
+import pytest
+
+from app.geofence import METERS_PER_DEG_LAT, PreparedPolygon, SiteGeom, SiteIndex
+
+
+def brute_force(sites, lat, lng):
+    """Nearest site (by centre) containing the point, checking every site."""
+    best = None
+    for site in sites:
+        d = site.distance_m(lat, lng)
+        if site.contains(lat, lng, d) and (best is None or d < best[0]):
+            best = (d, site)
+    return best[1] if best else None
+
+
+@pytest.fixture(scope="module")
+def sites():
+    rng = random.Random(7)
+    sites = [
+        SiteGeom(id=i, lat=24 + rng.uniform(0, 0.05), lng=46 + rng.uniform(0, 0.05), radius_m=rng.uniform(50, 1500))
+        for i in range(1, 60)
+    ]
+    d = 800 / METERS_PER_DEG_LAT
+    sites.append(SiteGeom(
+        id=100, lat=24.025, lng=46.025, radius_m=150.0,
+        polygon=PreparedPolygon([(24.025 - d, 46.025 - d), (24.025 + d, 46.025), (24.025 - d, 46.025 + d)]),
+    ))
+    return sites
+
+
+@pytest.fixture(scope="module")
+def points():
+    rng = random.Random(11)
+    return [(24 + rng.uniform(-0.01, 0.06), 46 + rng.uniform(-0.01, 0.06)) for _ in range(2000)]
+
+
+def test_nearest_matches_brute_force(sites, points):
+    index = SiteIndex(cell_deg=0.01)
+    index.rebuild(sites)
+    expected = [brute_force(sites, lat, lng) for lat, lng in points]
+    assert sum(e is not None for e in expected) > 500  # the grid is actually exercised
+    assert [index.nearest(lat, lng) for lat, lng in points] == expected
+
+
+def test_match_many_matches_brute_force(sites, points):
+    index = SiteIndex(cell_deg=0.01)
+    index.rebuild(sites)
+    lats, lngs = zip(*points)
+    assert index.match_many(lats, lngs) == [brute_force(sites, lat, lng) for lat, lng in points]
+
+
+def test_remove_keeps_the_grid_consistent(sites, points):
+    index = SiteIndex(cell_deg=0.01)
+    index.rebuild(sites)
+    for site in sites[::3]:
+        index.remove(site.id)
+    remaining = [s for s in sites if s not in sites[::3]]
+    assert [index.nearest(lat, lng) for lat, lng in points] == [brute_force(remaining, lat, lng) for lat, lng in points]
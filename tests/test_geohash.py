@@ -0,0 +1,105 @@
+import math
+import random
+
+import pytest
+
+from app.geofence import METERS_PER_DEG_LAT, haversine_m
+from app.geohash import GEOHASH_BITS, cover_ranges, encode
+
+
+def offset(lat, lng, metres, bearing_deg):
+    """Point ``metres`` away on ``bearing_deg`` (great circle, wrapped in longitude)."""
+    d = metres / (METERS_PER_DEG_LAT * 180.0 / math.pi)  # angular distance
+    b, p1, l1 = math.radians(bearing_deg), math.radians(lat), math.radians(lng)
+    p2 = math.asin(math.sin(p1) * math.cos(d) + math.cos(p1) * math.sin(d) * math.cos(b))
+    l2 = l1 + math.atan2(math.sin(b) * math.sin(d) * math.cos(p1), math.cos(d) - math.sin(p1) * math.sin(p2))
+    return math.degrees(p2), (math.degrees(l2) + 180.0) % 360.0 - 180.0
+
+
+def covered(ranges, lat, lng):
+    h = encode(lat, lng)
+    return any(lo <= h <= hi for lo, hi in ranges)
+
+
+def test_encode_interleaves_longitude_first():
+    assert encode(-90.0, -180.0) == 0
+    assert encode(90.0, 180.0) == (1 << 2 * GEOHASH_BITS) - 1
+    # the top bit is the longitude half, the next one the latitude half
+    assert encode(-45.0, 90.0) >> (2 * GEOHASH_BITS - 2) == 0b10
+    assert encode(45.0, -90.0) >> (2 * GEOHASH_BITS - 2) == 0b01
+
+
+@pytest.mark.parametrize("lat, lng, radius_m", [
+    (24.7136, 46.6753, 50.0),
+    (24.7136, 46.6753, 5000.0),
+    (-33.8688, 151.2093, 1200.0),
+    (0.0, 0.0, 300.0),  # every axis boundary at once
+    (10.0, 179.9995, 500.0),  # across the antimeridian
+    (-10.0, -179.9999, 2000.0),
+    (89.999, 12.0, 1000.0),  # near the pole
+])
+def test_cover_ranges_cover_the_whole_circle(lat, lng, radius_m):
+    ranges = cover_ranges(lat, lng, radius_m)
+    rng = random.Random(3)
+    ring = [offset(lat, lng, radius_m * 0.999, b) for b in range(0, 360, 5)]
+    inside = [offset(lat, lng, radius_m * math.sqrt(rng.random()), rng.uniform(0, 360)) for _ in range(500)]
+    for p in ring + inside:
+        assert haversine_m(lat, lng, *p) <= radius_m * 1.01
+        assert covered(ranges, *p), p
+
+
+def test_cover_ranges_are_sorted_disjoint_and_bounded():
+    for radius_m in (1.0, 100.0, 5000.0):
+        ranges = cover_ranges(24.7136, 46.6753, radius_m, max_cells=16)
+        assert len(ranges) <= 16
+        assert all(lo <= hi for lo, hi in ranges)
+        assert all(a[1] + 1 < b[0] for a, b in zip(ranges, ranges[1:]))
+
+
+def test_antimeridian_cover_includes_both_sides():
+    ranges = cover_ranges(0.0, 179.9999, 200.0)
+    assert covered(ranges, 0.0, 179.9995) and covered(ranges, 0.0, -179.9995)
+    assert not covered(ranges, 0.0, 0.0)
+
+
+def test_near_filters_by_radius_and_time(client, admin_headers):
+    centre = (21.4225, 39.8262)
+    fixes = {
+        "near-a": offset(*centre, 40, 90),
+        "near-b": offset(*centre, 190, 45),  # close to the ring, inside
+        "near-c": offset(*centre, 230, 45),  # inside the covering cells, outside the circle
+        "near-d": offset(*centre, 5000, 0),
+    }
+    assert covered(cover_ranges(*centre, 200), *fixes["near-c"])  # only haversine drops it
+    points = [
+        {"employee_id": e, "lat": p[0], "lng": p[1], "timestamp": "2024-08-01T10:00:00Z"} for e, p in fixes.items()
+    ]
+    points.append({"employee_id": "near-late", "lat": centre[0], "lng": centre[1], "timestamp": "2024-08-02T10:00:00Z"})
+    assert client.post("/tracking/batch", json={"points": points}, headers=admin_headers).json()["accepted"] == 5
+
+    params = {"lat": centre[0], "lng": centre[1], "radius_m": 200,
+              "start": "2024-08-01T00:00:00Z", "end": "2024-08-01T23:59:59Z"}
+    r = client.get("/tracking/near", params=params, headers=admin_headers)
+    assert r.status_code == 200, r.text
+    found = r.json()
+    assert [e["employee_id"] for e in found] == ["near-a", "near-b"]
+    assert found[0]["closest_m"] == pytest.approx(40, abs=1) and found[1]["closest_m"] < 200
+
+
+def test_near_across_the_antimeridian(client, admin_headers):
+    points = [
+        {"employee_id": "near-west", "lat": 0.0, "lng": 179.9995, "timestamp": "2024-08-01T10:00:00Z"},
+        {"employee_id": "near-east", "lat": 0.0, "lng": -179.9995, "timestamp": "2024-08-01T10:00:00Z"},
+    ]
+    client.post("/tracking/batch", json={"points": points}, headers=admin_headers)
+    params = {"lat": 0.0, "lng": 179.9999, "radius_m": 200,
+              "start": "2024-08-01T00:00:00Z", "end": "2024-08-01T23:59:59Z"}
+    found = client.get("/tracking/near", params=params, headers=admin_headers).json()
+    assert [e["employee_id"] for e in found] == ["near-west", "near-east"]
+
+
+def test_near_rejects_oversized_radius_and_inverted_range(client, admin_headers):
+    base = {"lat": 0, "lng": 0, "start": "2024-08-01T00:00:00Z", "end": "2024-08-01T23:59:59Z"}
+    assert client.get("/tracking/near", params={**base, "radius_m": 10 ** 7}, headers=admin_headers).status_code == 422
+    inverted = {**base, "radius_m": 10, "start": base["end"], "end": base["start"]}
+    assert client.get("/tracking/near", params=inverted, headers=admin_headers).status_code == 422
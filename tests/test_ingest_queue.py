@@ -0,0 +1,38 @@
+import datetime as dt
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app.ingest import build_rows
+from app.ingest_queue import GroupCommitWriter, _Pending
+
+T0 = dt.datetime(2025, 3, 1, 8, 0, tzinfo=dt.timezone.utc)
+
+
+def pending(employee_id, n, minute=0):
+    return _Pending(build_rows(
+        [employee_id] * n,
+        [T0 + dt.timedelta(minutes=minute + i) for i in range(n)],
+        [24.0] * n, [46.0] * n, [None] * n,
+    ))
+
+
+def test_failed_group_only_fails_the_offending_request(warm):
+    good, bad, also_good = pending("gc-1", 2), pending("gc-2", 1), pending("gc-3", 3)
+    bad.rows[0]["lat"] = None  # NOT NULL violation
+    GroupCommitWriter()._flush([good, bad, also_good])
+
+    with pytest.raises(IntegrityError):
+        bad.future.result(timeout=0)
+    for request in (good, also_good):
+        ids = request.future.result(timeout=0)
+        assert len(ids) == len(request.rows) and None not in ids
+
+
+def test_repeat_across_requests_survives_the_retry(warm):
+    first, repeat, bad = pending("gc-4", 1), pending("gc-4", 1), pending("gc-5", 1)
+    bad.rows[0]["lat"] = None
+    GroupCommitWriter()._flush([first, repeat, bad])
+
+    assert first.future.result(timeout=0)[0] is not None
+    assert repeat.future.result(timeout=0) == [None] and repeat.rows[0]["duplicate"]
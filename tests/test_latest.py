@@ -0,0 +1,31 @@
+from app.latest import LatestPositions
+
+NEWER = {"employee_id": "latest-1", "lat": 24.7, "lng": 46.7, "timestamp": "2025-05-01T10:00:00Z"}
+OLDER = {"employee_id": "latest-1", "lat": 21.4, "lng": 39.8, "timestamp": "2025-05-01T09:00:00Z"}
+
+
+def latest_of(client, headers, employee_id):
+    r = client.get("/tracking/latest", headers=headers)
+    assert r.status_code == 200, r.text
+    return next(p for p in r.json() if p["employee_id"] == employee_id)
+
+
+def test_late_older_fix_keeps_the_newer_position(client, admin_headers, db):
+    newer = client.post("/tracking", json=NEWER, headers=admin_headers).json()
+    client.post("/tracking", json=OLDER, headers=admin_headers)
+
+    position = latest_of(client, admin_headers, "latest-1")
+    assert position["timestamp"].startswith("2025-05-01T10:00:00")
+    assert (position["lat"], position["point_id"]) == (24.7, newer["id"])
+
+    # the table, not only this worker's copy, kept the newer fix
+    reloaded = LatestPositions()
+    reloaded.load(db)
+    [row] = [r for r in reloaded.snapshot() if r[0] == "latest-1"]
+    assert (row[2], row[-1]) == (24.7, newer["id"])
+
+
+def test_older_fix_in_the_same_batch_does_not_win(client, admin_headers):
+    points = [{**NEWER, "employee_id": "latest-2"}, {**OLDER, "employee_id": "latest-2"}]
+    assert client.post("/tracking/batch", json={"points": points}, headers=admin_headers).json()["accepted"] == 2
+    assert latest_of(client, admin_headers, "latest-2")["lat"] == 24.7
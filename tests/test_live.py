@@ -0,0 +1,45 @@
+import asyncio
+
+from prometheus_client import REGISTRY
+
+from app.live import Subscription
+
+
+def position(employee_id, lat=24.0, site_id=None):
+    return {"employee_id": employee_id, "lat": lat, "lng": 46.0, "site_id": site_id}
+
+
+def coalesced():
+    return REGISTRY.get_sample_value("tracking_live_positions_coalesced_total")
+
+
+def drain(subscription):
+    return asyncio.run(subscription.next_batch(timeout=0.01))
+
+
+def test_slow_reader_gets_the_latest_position_per_employee():
+    subscription = Subscription(maxsize=10)
+    before = coalesced()
+    for lat in (1.0, 2.0, 3.0):
+        subscription.offer(position("a", lat))
+    subscription.offer(position("b"))
+    assert [(p["employee_id"], p["lat"]) for p in drain(subscription)] == [("a", 3.0), ("b", 24.0)]
+    assert coalesced() - before == 2
+    assert drain(subscription) == []  # nothing new: heartbeat
+
+
+def test_full_buffer_evicts_the_oldest_pending_employee():
+    subscription = Subscription(maxsize=2)
+    before = coalesced()
+    for employee_id in ("a", "b", "c"):
+        subscription.offer(position(employee_id))
+    subscription.offer(position("b", lat=5.0))  # refreshing a pending employee evicts nothing
+    assert [(p["employee_id"], p["lat"]) for p in drain(subscription)] == [("b", 5.0), ("c", 24.0)]
+    assert coalesced() - before == 2
+
+
+def test_filters():
+    subscription = Subscription(employee_ids=["a"], site_ids=[7])
+    assert subscription.matches(position("a", site_id=7))
+    assert not subscription.matches(position("a", site_id=None))
+    assert not subscription.matches(position("b", site_id=7))
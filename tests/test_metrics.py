@@ -0,0 +1,31 @@
+from prometheus_client import REGISTRY
+
+
+def requests_seen(method, route, status):
+    labels = {"method": method, "route": route, "status": status}
+    return REGISTRY.get_sample_value("http_request_duration_seconds_count", labels) or 0.0
+
+
+def test_requests_are_labelled_by_route_template(client, admin_headers):
+    before = requests_seen("GET", "/sites/{site_id}", "404")
+    assert client.get("/sites/987654", headers=admin_headers).status_code == 404
+    assert client.get("/sites/987655", headers=admin_headers).status_code == 404
+    assert requests_seen("GET", "/sites/{site_id}", "404") - before == 2
+
+    before = requests_seen("GET", "/sites/{site_id}", "401")
+    assert client.get("/sites/987654").status_code == 401
+    assert requests_seen("GET", "/sites/{site_id}", "401") - before == 1
+
+
+def test_unknown_paths_share_one_label(client):
+    before = requests_seen("GET", "unmatched", "404")
+    client.get("/no/such/path/1")
+    client.get("/no/such/path/2")
+    assert requests_seen("GET", "unmatched", "404") - before == 2
+
+
+def test_metrics_endpoint_exposes_templates_not_raw_paths(client, admin_headers):
+    client.get("/sites/987654", headers=admin_headers)
+    body = client.get("/metrics").text
+    assert 'route="/sites/{site_id}"' in body
+    assert "987654" not in body and "/no/such/path" not in body
@@ -0,0 +1,50 @@
+import datetime as dt
+import logging
+
+from sqlalchemy import text
+
+from app.partitions import add_months, ensure_partitions, monthly_partitions, partition_name
+
+TODAY = dt.date(2026, 10, 17)
+
+
+def _partitioned_table(conn):
+    conn.execute(
+        text(
+            'CREATE TABLE tracking_points (id integer NOT NULL, "timestamp" timestamptz NOT NULL) '
+            'PARTITION BY RANGE ("timestamp")'
+        )
+    )
+    conn.execute(text("CREATE TABLE tracking_points_default PARTITION OF tracking_points DEFAULT"))
+
+
+def test_add_months_wraps_years():
+    assert add_months(dt.date(2026, 11, 1), 3) == dt.date(2027, 2, 1)
+    assert add_months(dt.date(2026, 1, 1), -1) == dt.date(2025, 12, 1)
+
+
+def test_ensure_partitions_is_noop_without_partitioning(db):
+    assert ensure_partitions(db.connection(), today=TODAY) == []
+
+
+def test_ensure_creates_upcoming_months(pg_conn):
+    _partitioned_table(pg_conn)
+    created = ensure_partitions(pg_conn, months_ahead=2, today=TODAY)
+    assert created == ["tracking_points_p202610", "tracking_points_p202611", "tracking_points_p202612"]
+    assert ensure_partitions(pg_conn, months_ahead=2, today=TODAY) == []
+
+
+def test_rows_in_default_are_skipped_at_boot_and_moved_by_cli(pg_conn, caplog):
+    _partitioned_table(pg_conn)
+    pg_conn.execute(text("INSERT INTO tracking_points VALUES (1, '2026-11-05 10:00+00'), (2, '2026-12-01 00:00+00')"))
+
+    with caplog.at_level(logging.WARNING, logger="app.partitions"):
+        created = ensure_partitions(pg_conn, months_ahead=1, today=TODAY, move_default=False)
+    assert created == ["tracking_points_p202610"]
+    assert "tracking_points_p202611" in caplog.text
+
+    assert ensure_partitions(pg_conn, months_ahead=1, today=TODAY) == ["tracking_points_p202611"]
+    assert dt.date(2026, 11, 1) in monthly_partitions(pg_conn)
+    in_nov = pg_conn.execute(text(f"SELECT id FROM {partition_name(dt.date(2026, 11, 1))}")).scalars().all()
+    in_default = pg_conn.execute(text("SELECT id FROM tracking_points_default")).scalars().all()
+    assert in_nov == [1] and in_default == [2]
@@ -0,0 +1,25 @@
+import logging
+
+from sqlalchemy import create_engine, text
+
+from app import query_profiler
+
+
+def slow_query(monkeypatch, caplog, debug):
+    monkeypatch.setattr(query_profiler, "DB_SLOW_QUERY_MS", 0.0)
+    monkeypatch.setattr(query_profiler, "DB_PROFILING_DEBUG", debug)
+    engine = create_engine("sqlite://")
+    query_profiler.install(engine)
+    with caplog.at_level(logging.WARNING, logger="app.query_profiler"), engine.connect() as conn:
+        conn.execute(text("SELECT :secret"), {"secret": "hunter2"})
+    return caplog.text
+
+
+def test_slow_query_log_omits_parameters(monkeypatch, caplog):
+    logged = slow_query(monkeypatch, caplog, debug=False)
+    assert "slow query" in logged and "hunter2" not in logged
+
+
+def test_debug_logs_parameters_and_plan(monkeypatch, caplog):
+    logged = slow_query(monkeypatch, caplog, debug=True)
+    assert "hunter2" in logged and "plan:" in logged
@@ -0,0 +1,36 @@
+import datetime as dt
+
+from sqlalchemy import select
+
+from app.geofence import site_index
+from app.ingest import build_rows
+from app.ingest_queue import persist_points
+from app.models import AttendanceDaily
+from app.rollups import rebuild
+
+DAY = dt.date(2024, 6, 10)
+HQ = (24.7136, 46.6753)  # seeded "Headquarters"
+OFFSETS_S = [0, 60, 90, 700, 720, 2000, 2010, 2400, 5000]
+
+
+def snapshot(db):
+    return sorted(
+        (r.employee_id, r.site_id, r.day, r.first_seen, r.last_seen, r.seconds_on_site, r.ping_count)
+        for r in db.scalars(select(AttendanceDaily).where(AttendanceDaily.day == DAY))
+    )
+
+
+def test_incremental_rollups_equal_a_rebuild(db):
+    site_index.ensure_loaded(db)
+    start = dt.datetime.combine(DAY, dt.time(8), tzinfo=dt.timezone.utc)
+    for employee_id in ("rollup-1", "rollup-2"):
+        times = [start + dt.timedelta(seconds=s) for s in OFFSETS_S]
+        for batch in (times[:3], times[3:4], times[4:7], times[7:]):
+            n = len(batch)
+            persist_points(db, build_rows([employee_id] * n, batch, [HQ[0]] * n, [HQ[1]] * n, [None] * n))
+            db.commit()
+
+    incremental = snapshot(db)
+    assert len(incremental) == 2 and incremental[0][-1] == len(OFFSETS_S)
+    rebuild(db, DAY, DAY)
+    assert snapshot(db) == incremental
@@ -0,0 +1,45 @@
+import datetime as dt
+import json
+
+from app.pagination import NEXT_CURSOR_HEADER
+from app.schemas import LatestPositionRead
+from app.serialization import encode_rows
+
+T0 = dt.datetime(2025, 3, 1, 8, 0, 30, 250000, tzinfo=dt.timezone.utc)
+COLUMNS = ("employee_id", "timestamp", "lat", "lng", "accuracy", "site_id")
+ROWS = [("a", T0, 24.5, 46.5, None, 3), ("b", T0 + dt.timedelta(minutes=1), 21.4, 39.8, 4.5, None)]
+
+
+def test_columns_shape_has_one_array_per_field():
+    decoded = json.loads(encode_rows(COLUMNS, ROWS, "columns"))
+    assert list(decoded) == list(COLUMNS)
+    assert decoded["employee_id"] == ["a", "b"] and decoded["accuracy"] == [None, 4.5]
+    assert decoded["timestamp"] == ["2025-03-01T08:00:30.250000Z", "2025-03-01T08:01:30.250000Z"]
+
+
+def test_empty_columns_shape_keeps_every_field():
+    assert json.loads(encode_rows(COLUMNS, [], "columns")) == {c: [] for c in COLUMNS}
+
+
+def test_rows_shape_matches_the_response_model():
+    pydantic = [json.loads(LatestPositionRead(**dict(zip(COLUMNS, row))).model_dump_json(include=set(COLUMNS)))
+                for row in ROWS]
+    assert json.loads(encode_rows(COLUMNS, ROWS)) == pydantic
+
+
+def test_report_columns_shape_transposes_rows_and_keeps_the_cursor(client, admin_headers):
+    points = [
+        {"employee_id": "columns-1", "lat": 24.0 + i / 100, "lng": 46.0, "timestamp": f"2024-05-01T08:0{i}:00Z"}
+        for i in range(3)
+    ]
+    assert client.post("/tracking/batch", json={"points": points}, headers=admin_headers).json()["accepted"] == 3
+    params = {"employee_id": "columns-1", "start_date": "2024-05-01", "end_date": "2024-05-01", "limit": 2}
+
+    rows = client.get("/tracking/report", params=params, headers=admin_headers)
+    columns = client.get("/tracking/report", params={**params, "shape": "columns"}, headers=admin_headers)
+    assert columns.status_code == 200 and columns.headers["content-type"] == "application/json"
+    assert columns.headers[NEXT_CURSOR_HEADER] == rows.headers[NEXT_CURSOR_HEADER]
+    by_column = columns.json()
+    assert list(by_column) == list(rows.json()[0])
+    assert [dict(zip(by_column, values)) for values in zip(*by_column.values())] == rows.json()
+    assert by_column["lat"] == [24.0, 24.01]
@@ -0,0 +1,75 @@
+import logging
+import time
+
+import redis
+
+from app.geofence import SiteGeom, SiteIndex
+from app.site_cache import (
+    MemoryRedis, SiteSnapshotFollower, dump_snapshot, load_snapshot, site_snapshots, snapshot_key, VERSION_KEY,
+)
+
+HQ = SiteGeom(id=1, lat=24.7136, lng=46.6753, radius_m=150.0, name_ar="المقر", name_en="HQ")
+
+
+def _follower(shared):
+    client = MemoryRedis()
+    client.incr(VERSION_KEY)
+    client.set(snapshot_key(1), dump_snapshot([HQ]))
+    index = SiteIndex(ttl_s=0.05)
+    return SiteSnapshotFollower(client, index=index, session_factory=None, shared=shared), index
+
+
+def test_snapshot_round_trip():
+    follower, index = _follower(shared=True)
+    follower.refresh()
+    assert index.version == 1
+    assert index.nearest(24.7137, 46.6754).id == 1
+
+
+def test_shared_backend_keeps_index_fresh():
+    follower, index = _follower(shared=True)
+    follower.refresh()
+    time.sleep(0.06)
+    follower.refresh()  # same version: confirmed by the shared snapshot
+    assert not index.is_stale()
+
+
+def test_memory_backend_leaves_ttl_reload_running():
+    follower, index = _follower(shared=None)
+    assert follower.shared is False
+    follower.refresh()
+    time.sleep(0.06)
+    follower.refresh()
+    assert index.is_stale()
+
+
+def test_memory_backend_does_not_overwrite_db_reload_with_old_snapshot():
+    follower, index = _follower(shared=False)
+    follower.refresh()
+    moved = SiteGeom(id=1, lat=25.0, lng=47.0, radius_m=150.0, name_ar="المقر", name_en="HQ")
+    index.rebuild([moved])  # TTL reload from the database (version None)
+    follower.refresh()
+    assert index.get(1).lat == 25.0
+
+
+class RedisDown(MemoryRedis):
+    def incr(self, key):
+        raise redis.ConnectionError("Redis is down")
+
+
+def test_site_write_survives_a_redis_outage(client, admin_headers, monkeypatch, caplog):
+    monkeypatch.setattr(site_snapshots, "client", RedisDown())
+    with caplog.at_level(logging.ERROR, logger="app.site_cache"):
+        r = client.post("/sites", json={"name": "outage", "lat": 10.0, "lng": 10.0}, headers=admin_headers)
+    assert r.status_code == 200, r.text
+    assert "could not publish site snapshot" in caplog.text
+    assert client.get(f"/sites/{r.json()['id']}", headers=admin_headers).status_code == 200
+
+
+def test_site_write_publishes_a_snapshot_after_the_response(client, admin_headers, monkeypatch):
+    redis_client = MemoryRedis()
+    monkeypatch.setattr(site_snapshots, "client", redis_client)
+    r = client.post("/sites", json={"name": "published", "lat": 11.0, "lng": 11.0}, headers=admin_headers)
+    assert r.status_code == 200, r.text
+    version = int(redis_client.get(VERSION_KEY))
+    assert r.json()["id"] in {g.id for g in load_snapshot(redis_client.get(snapshot_key(version)))}
@@ -0,0 +1,109 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+import app.main as main
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    seen = []
+    monkeypatch.setattr(main, "schema_at_head", lambda engine: True)
+    monkeypatch.setattr(main, "needs_seed", lambda engine: seen.append("needs_seed") or True)
+    monkeypatch.setattr(main, "seed", lambda: seen.append("seed"))
+    monkeypatch.setattr(main, "ensure_partitions_on_boot", lambda engine: seen.append("partitions"))
+    monkeypatch.setattr(main.Base.metadata, "create_all", lambda bind: seen.append("create_all"))
+    return seen
+
+
+def test_fast_mode_never_touches_the_database(monkeypatch, calls):
+    monkeypatch.setattr(main, "STARTUP_MODE", "fast")
+    main.prepare_database()
+    assert calls == []
+
+
+def test_auto_mode_at_head_skips_ddl_but_seeds_empty_database(monkeypatch, calls):
+    monkeypatch.setattr(main, "STARTUP_MODE", "auto")
+    main.prepare_database()
+    assert calls == ["partitions", "needs_seed", "seed"]
+
+
+def test_full_mode_creates_and_seeds(monkeypatch, calls):
+    monkeypatch.setattr(main, "STARTUP_MODE", "full")
+    main.prepare_database()
+    assert calls == ["create_all", "partitions", "seed"]
+
+
+def test_ready_after_warmup(client):
+    assert client.get("/health").json() == {"status": "ok"}
+    for _ in range(100):
+        if client.get("/ready").status_code == 200:
+            break
+        time.sleep(0.05)
+    assert client.get("/ready").json()["status"] == "ready"
+
+
+@pytest.fixture
+def empty_database(monkeypatch, tmp_path):
+    """Point ``prepare_database`` at a migrated (tables, no rows) database of its own."""
+
+    def use(url, **engine_kwargs):
+        engine = create_engine(url, **engine_kwargs)
+        main.Base.metadata.create_all(engine)
+        monkeypatch.setattr(main, "engine", engine)
+        monkeypatch.setattr(main, "SessionLocal", sessionmaker(bind=engine))
+        monkeypatch.setattr(main, "STARTUP_MODE", "auto")
+        monkeypatch.setattr(main, "schema_at_head", lambda engine: True)
+        monkeypatch.setattr(main, "ensure_partitions_on_boot", lambda engine: [])
+        return engine
+
+    return use
+
+
+def boot_workers(n):
+    with ThreadPoolExecutor(n) as pool:
+        for future in [pool.submit(main.prepare_database) for _ in range(n)]:
+            future.result()
+
+
+def seeded(engine):
+    with engine.connect() as conn:
+        users = conn.execute(text("SELECT count(*) FROM users WHERE employee_id = '220220'")).scalar()
+        sites = conn.execute(text("SELECT count(*) FROM sites")).scalar()
+    return users, sites
+
+
+def test_prepare_database_twice_on_empty_database_seeds_once(empty_database, tmp_path):
+    engine = empty_database(f"sqlite:///{tmp_path / 'boot.db'}", connect_args={"timeout": 30})
+    main.prepare_database()
+    main.prepare_database()
+    assert seeded(engine) == (1, 4)
+
+
+def test_workers_booting_together_seed_once(empty_database, tmp_path):
+    engine = empty_database(f"sqlite:///{tmp_path / 'boot.db'}", connect_args={"timeout": 30})
+    boot_workers(4)
+    assert seeded(engine) == (1, 4)
+
+
+def test_workers_booting_together_seed_once_on_postgres(empty_database):
+    url = os.environ.get("TEST_POSTGRES_URL")
+    if not url:
+        pytest.skip("TEST_POSTGRES_URL not set")
+    admin = create_engine(url, isolation_level="AUTOCOMMIT")
+    with admin.connect() as conn:
+        conn.execute(text("DROP SCHEMA IF EXISTS falcom_boot CASCADE"))
+        conn.execute(text("CREATE SCHEMA falcom_boot"))
+    try:
+        engine = empty_database(url, connect_args={"options": "-csearch_path=falcom_boot"})
+        boot_workers(4)
+        assert seeded(engine) == (1, 4)
+        engine.dispose()
+    finally:
+        with admin.connect() as conn:
+            conn.execute(text("DROP SCHEMA falcom_boot CASCADE"))
+        admin.dispose()
@@ -0,0 +1,85 @@
+import csv
+import datetime as dt
+import io
+import json
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app import reports
+from app.db import Base
+from app.ingest import build_rows, insert_points
+from app.models import Site, TrackingPoint
+
+
+def point(employee_id="dedup-1", **extra):
+    return {"employee_id": employee_id, "lat": 24.0, "lng": 46.0, **extra}
+
+
+def test_server_stamped_points_are_aware_utc_and_distinct():
+    rows = build_rows(["e", "e"], [None, None], [24.0, 24.0], [46.0, 46.0], [None, None])
+    assert all(r["timestamp"].utcoffset() == dt.timedelta(0) for r in rows)
+    assert [r["client_point_id"] for r in rows] == ["#0", "#1"]
+
+
+def test_server_stamped_batch_is_never_reported_as_duplicate(client, admin_headers):
+    r = client.post("/tracking/batch", json={"points": [point("stamped"), point("stamped")]}, headers=admin_headers)
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert body["accepted"] == 2 and body["duplicates"] == 0
+    assert all(item["id"] is not None for item in body["results"])
+
+
+def test_repost_returns_the_stored_point(client, admin_headers):
+    payload = point("resend", timestamp="2025-03-01T08:00:00+03:00", client_point_id="p-1")
+    first = client.post("/tracking", json=payload, headers=admin_headers)
+    again = client.post("/tracking", json=payload, headers=admin_headers)
+    assert first.status_code == again.status_code == 200
+    assert again.json()["id"] == first.json()["id"]
+
+    batch = client.post("/tracking/batch", json={"points": [payload]}, headers=admin_headers).json()
+    assert batch["duplicates"] == 1 and batch["results"][0]["status"] == "duplicate"
+
+
+def test_server_stamped_ids_survive_a_non_utc_session(pg_conn):
+    Base.metadata.create_all(pg_conn, tables=[Site.__table__, TrackingPoint.__table__])
+    pg_conn.execute(text("SET LOCAL TimeZone TO 'Asia/Riyadh'"))
+    rows = build_rows(["e", "e"], [None, None], [24.0, 24.0], [46.0, 46.0], [None, None])
+    ids = insert_points(Session(bind=pg_conn), rows)
+    assert None not in ids and len(set(ids)) == 2
+
+
+def report_points(client, headers, employee_id):
+    points = [
+        {"employee_id": employee_id, "lat": 24.0 + i / 100, "lng": 46.0, "timestamp": f"2024-06-01T08:0{i}:00Z",
+         "accuracy": 5.0 if i else None}
+        for i in range(5)
+    ]
+    assert client.post("/tracking/batch", json={"points": points}, headers=headers).json()["accepted"] == 5
+    return {"employee_id": employee_id, "start_date": "2024-06-01", "end_date": "2024-06-01"}
+
+
+def test_report_streams_ndjson(client, admin_headers, monkeypatch):
+    monkeypatch.setattr(reports, "REPORT_STREAM_CHUNK", 2)  # several partitions
+    params = report_points(client, admin_headers, "stream-ndjson")
+    r = client.get("/tracking/report", params={**params, "format": "ndjson", "limit": 1}, headers=admin_headers)
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/x-ndjson"
+    assert r.headers["content-disposition"] == 'attachment; filename="tracking_stream-ndjson_2024-06-01_2024-06-01.ndjson"'
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert len(lines) == 5  # limit only applies to json
+    assert [p["lat"] for p in lines] == [24.0, 24.01, 24.02, 24.03, 24.04]
+    assert lines[0]["accuracy"] is None and lines[1]["accuracy"] == 5.0 and set(lines[0]) == set(reports.REPORT_COLUMNS)
+
+
+def test_report_streams_csv(client, admin_headers):
+    params = report_points(client, admin_headers, "stream-csv")
+    r = client.get("/tracking/report", params={**params, "format": "csv"}, headers=admin_headers)
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "text/csv; charset=utf-8"
+    assert r.headers["content-disposition"].endswith('.csv"')
+    header, *rows = list(csv.reader(io.StringIO(r.text)))
+    assert tuple(header) == reports.REPORT_COLUMNS and len(rows) == 5
+    first = dict(zip(header, rows[0]))
+    assert first["employee_id"] == "stream-csv" and first["accuracy"] == "" and first["point_count"] == "1"
+    assert dt.datetime.fromisoformat(first["timestamp"]).replace(tzinfo=None) == dt.datetime(2024, 6, 1, 8, 0)
@@ -0,0 +1,97 @@
+import datetime as dt
+import gzip
+import json
+import os
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+from app import uploads
+from app.ingest import build_rows
+from app.uploads import PACKED_MEDIA_TYPE, gunzip_body, pack_points, unpack_points
+
+T0 = dt.datetime(2025, 3, 1, 8, 0, tzinfo=dt.timezone.utc)
+TIMES = [T0, T0 + dt.timedelta(seconds=5), T0 + dt.timedelta(seconds=12)]
+LATS = [24.7136, 24.71361, -33.8688]
+LNGS = [46.6753, 46.67531, 151.2093]
+
+
+def test_packed_round_trip():
+    packed = unpack_points(pack_points("e-1", TIMES, LATS, LNGS, [4.5, None, 12.0], client_point_ids=["a", None, "ج-3"]))
+    assert packed.employee_id == "e-1" and len(packed) == 3
+    assert packed.timestamps.tolist() == [t.replace(tzinfo=None) for t in TIMES]
+    np.testing.assert_allclose(packed.lats, LATS, atol=1e-7)
+    np.testing.assert_allclose(packed.lngs, LNGS, atol=1e-7)
+    np.testing.assert_array_equal(packed.accuracies, [4.5, np.nan, 12.0])
+    assert packed.client_point_ids == ["a", None, "ج-3"]
+
+    rows = build_rows(["e-1"] * 3, packed.timestamps, packed.lats, packed.lngs, packed.accuracies, packed.client_point_ids)
+    assert [r["timestamp"] for r in rows] == TIMES
+    assert [r["accuracy"] for r in rows] == [4.5, None, 12.0]
+    assert [r["client_point_id"] for r in rows] == ["a", "", "ج-3"]
+
+
+def test_optional_columns_default_to_unknown():
+    packed = unpack_points(pack_points("e-1", TIMES, LATS, LNGS))
+    assert np.isnan(packed.accuracies).all() and packed.client_point_ids is None
+
+
+@pytest.mark.parametrize("mangle", [
+    lambda b: b[:-1],
+    lambda b: b + b"x",
+    lambda b: b"XXXX" + b[4:],
+])
+def test_malformed_batch_is_rejected(mangle):
+    data = pack_points("e-1", TIMES, LATS, LNGS, client_point_ids=["a", "b", "c"])
+    with pytest.raises(HTTPException) as exc:
+        unpack_points(mangle(data))
+    assert exc.value.status_code == 400
+
+
+def test_gzip_bomb_is_refused():
+    with pytest.raises(HTTPException) as exc:
+        gunzip_body(gzip.compress(b"\0" * 2048), limit=1024)
+    assert exc.value.status_code == 413
+
+
+def test_packed_repost_reports_duplicates(client, admin_headers):
+    body = pack_points("packed-1", TIMES, LATS, LNGS, client_point_ids=["p1", "p2", "p3"], compress=True)
+    headers = {**admin_headers, "Content-Type": PACKED_MEDIA_TYPE, "Content-Encoding": "gzip"}
+    first = client.post("/tracking/batch/packed", content=body, headers=headers).json()
+    again = client.post("/tracking/batch/packed", content=body, headers=headers).json()
+    assert first["accepted"] == 3 and first["duplicates"] == 0
+    assert again["accepted"] == 0 and again["duplicates"] == 3
+
+
+@pytest.fixture
+def compressed_limit(monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOAD_MAX_COMPRESSED_BYTES", 256)
+
+
+def gzipped_batch(employee_id, n):
+    points = [{"employee_id": employee_id, "lat": 24.0, "lng": 46.0 + i / 1000, "timestamp": f"2025-03-01T08:{i:02d}:00Z"}
+              for i in range(n)]
+    return gzip.compress(json.dumps({"points": points}).encode())
+
+
+def test_compressed_body_over_the_cap_is_refused_before_reading(client, admin_headers, compressed_limit):
+    body = os.urandom(1024)  # never decompressed: refused on Content-Length
+    headers = {**admin_headers, "Content-Type": "application/json", "Content-Encoding": "gzip"}
+    r = client.post("/tracking/batch", content=body, headers=headers)
+    assert r.status_code == 413
+
+
+def test_chunked_compressed_body_is_counted_while_streaming(client, admin_headers, compressed_limit):
+    body = os.urandom(1024)
+    headers = {**admin_headers, "Content-Type": "application/json", "Content-Encoding": "gzip"}
+    r = client.post("/tracking/batch", content=iter([body[:200], body[200:]]), headers=headers)
+    assert r.status_code == 413
+
+
+def test_compressed_body_under_the_cap_is_accepted(client, admin_headers, compressed_limit):
+    body = gzipped_batch("gz-small", 3)
+    assert len(body) <= 256
+    headers = {**admin_headers, "Content-Type": "application/json", "Content-Encoding": "gzip"}
+    r = client.post("/tracking/batch", content=body, headers=headers)
+    assert r.status_code == 200 and r.json()["accepted"] == 3
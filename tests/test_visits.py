@@ -0,0 +1,172 @@
+import datetime as dt
+import math
+import os
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+from app.geofence import METERS_PER_DEG_LAT, PreparedPolygon, SiteGeom, site_index
+from app.ingest import as_utc
+from app.models import Site, SiteVisit
+from app.visits import apply_points
+
+T0 = dt.datetime(2025, 3, 1, 8, 0, tzinfo=dt.timezone.utc)
+CIRCLE = SiteGeom(id=9001, lat=21.50, lng=39.20, radius_m=100.0)
+# small site 115 m east of CIRCLE: inside CIRCLE's exit radius (125 m)
+NEIGHBOUR = SiteGeom(id=9003, lat=21.50, lng=39.20 + 115 / (METERS_PER_DEG_LAT * math.cos(math.radians(21.5))), radius_m=10.0)
+# long thin compound, ~1 km east-west by ~100 m north-south, centred on the site point
+COMPOUND = SiteGeom(
+    id=9002, lat=21.60, lng=39.30, radius_m=150.0,
+    polygon=PreparedPolygon([(21.59955, 39.2952), (21.59955, 39.3048), (21.60045, 39.3048), (21.60045, 39.2952)]),
+)
+
+
+@pytest.fixture
+def sites():
+    site_index.rebuild([CIRCLE, COMPOUND, NEIGHBOUR])
+    yield
+    site_index.invalidate()  # the next request reloads the real sites
+
+
+def north(site, metres):
+    return site.lat + metres / METERS_PER_DEG_LAT, site.lng
+
+
+def fix(employee_id, minute, lat, lng):
+    site = site_index.nearest(lat, lng)
+    return {
+        "employee_id": employee_id,
+        "timestamp": T0 + dt.timedelta(minutes=minute),
+        "lat": lat,
+        "lng": lng,
+        "site_id": site.id if site else None,
+    }
+
+
+def feed(db, *rows):
+    # one ingest transaction per call (the session does not autoflush)
+    apply_points(db, list(rows))
+    db.flush()
+
+
+def visits(db, employee_id):
+    db.flush()
+    return db.query(SiteVisit).filter_by(employee_id=employee_id).order_by(SiteVisit.entered_at).all()
+
+
+def test_enter_and_exit_with_debounce(db, sites):
+    e = "visit-circle"
+    feed(db, fix(e, 0, *north(CIRCLE, 0)))
+    feed(db, fix(e, 1, *north(CIRCLE, 110)))  # outside radius, inside exit radius
+    feed(db, fix(e, 2, *north(CIRCLE, 300)))  # one stray fix: debounced
+    feed(db, fix(e, 3, *north(CIRCLE, 10)))
+    [visit] = visits(db, e)
+    assert visit.exited_at is None and visit.point_count == 3 and visit.outside_count == 0
+
+    feed(db, fix(e, 4, *north(CIRCLE, 300)), fix(e, 5, *north(CIRCLE, 300)))
+    [visit] = visits(db, e)
+    assert as_utc(visit.exited_at) == T0 + dt.timedelta(minutes=3)
+
+
+def test_gap_closes_visit_and_reentry_opens_new_one(db, sites):
+    e = "visit-gap"
+    feed(db, fix(e, 0, *north(CIRCLE, 0)), fix(e, 120, *north(CIRCLE, 0)))
+    first, second = visits(db, e)
+    assert as_utc(first.exited_at) == T0 and second.exited_at is None
+
+
+def test_polygon_exit_follows_the_compound_not_the_circle(db, sites):
+    e = "visit-polygon"
+    east_end = (21.60, 39.3045)  # inside the polygon, ~470 m from the site point
+    past_end = (21.60, 39.3050)  # ~20 m beyond the east edge: GPS jitter
+    feed(db, fix(e, 0, *east_end))
+    feed(db, fix(e, 1, *past_end), fix(e, 2, *past_end), fix(e, 3, *east_end))
+    [visit] = visits(db, e)
+    assert fix(e, 1, *past_end)["site_id"] is None
+    assert visit.site_id == COMPOUND.id and visit.exited_at is None and visit.point_count == 4
+
+    # ~150 m north of the site point: inside the old radius * factor circle,
+    # but well outside the compound
+    off_side = north(COMPOUND, 150)
+    feed(db, fix(e, 4, *off_side), fix(e, 5, *off_side))
+    [visit] = visits(db, e)
+    assert as_utc(visit.exited_at) == T0 + dt.timedelta(minutes=3)
+
+
+def test_polygon_distance_and_exit_buffer():
+    polygon = COMPOUND.polygon
+    assert polygon.distance_m(21.60, 39.30) == 0.0
+    assert polygon.distance_m(*north(COMPOUND, 150)) == pytest.approx(100, abs=1)
+    assert COMPOUND.within_exit(21.60, 39.3050, 1.25)
+    assert not COMPOUND.within_exit(*north(COMPOUND, 150), 1.25)
+    assert CIRCLE.within_exit(*north(CIRCLE, 120), 1.25)
+    assert not CIRCLE.within_exit(*north(CIRCLE, 130), 1.25)
+
+
+def test_fix_inside_another_site_switches_visits_within_the_exit_radius(db, sites):
+    e = "visit-neighbour"
+    assert CIRCLE.within_exit(NEIGHBOUR.lat, NEIGHBOUR.lng, 1.25)
+    feed(db, fix(e, 0, *north(CIRCLE, 0)))
+    feed(db, fix(e, 1, NEIGHBOUR.lat, NEIGHBOUR.lng))
+    first, second = visits(db, e)
+    assert first.site_id == CIRCLE.id and as_utc(first.exited_at) == T0
+    assert second.site_id == NEIGHBOUR.id and second.exited_at is None
+
+
+def test_one_open_visit_per_employee(db):
+    for minute in (0, 1):
+        db.add(SiteVisit(employee_id="visit-twice", site_id=CIRCLE.id, entered_at=T0 + dt.timedelta(minutes=minute),
+                         last_seen_at=T0 + dt.timedelta(minutes=minute), point_count=1))
+    with pytest.raises(IntegrityError):
+        db.flush()
+    db.rollback()
+
+
+def test_concurrent_workers_extend_a_single_visit(sites):
+    url = os.environ.get("TEST_POSTGRES_URL")
+    if not url:
+        pytest.skip("TEST_POSTGRES_URL not set")
+    admin = create_engine(url, isolation_level="AUTOCOMMIT")
+    with admin.connect() as conn:
+        conn.execute(text("DROP SCHEMA IF EXISTS falcom_visits CASCADE"))
+        conn.execute(text("CREATE SCHEMA falcom_visits"))
+    engine = create_engine(url, connect_args={"options": "-csearch_path=falcom_visits"})
+    try:
+        Site.metadata.create_all(engine, tables=[Site.__table__, SiteVisit.__table__])
+        with engine.begin() as conn:
+            conn.execute(Site.__table__.insert().values(id=CIRCLE.id, name="c", lat=CIRCLE.lat, lng=CIRCLE.lng))
+        Session = sessionmaker(bind=engine)
+        first_applied, errors = threading.Event(), []
+
+        def worker(minute, wait):
+            try:
+                with Session() as db:
+                    if wait:
+                        first_applied.wait(5)
+                    apply_points(db, [fix("visit-race", minute, *north(CIRCLE, 0))])
+                    db.flush()
+                    if not wait:
+                        first_applied.set()
+                        time.sleep(0.3)  # the other worker reads the open visits meanwhile
+                    db.commit()
+            except Exception as exc:  # noqa: BLE001
+                errors.append(exc)
+
+        threads = [threading.Thread(target=worker, args=(m, m == 1)) for m in (0, 1)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(10)
+        assert errors == []
+        with Session() as db:
+            [visit] = db.query(SiteVisit).all()
+        assert visit.exited_at is None and visit.point_count == 2
+    finally:
+        engine.dispose()
+        with admin.connect() as conn:
+            conn.execute(text("DROP SCHEMA falcom_visits CASCADE"))
+        admin.dispose()